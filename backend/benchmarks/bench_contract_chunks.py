@@ -0,0 +1,108 @@
+# bench_contract_chunks.py
+#
+# End-to-end latency of analyze_contract on long synthetic contracts: the
+# chunked map-reduce pipeline against the former single call carrying every
+# FAR clause and the whole contract. No OpenAI calls are made; each call
+# sleeps for a simple latency model instead:
+#     BENCH_LLM_BASE + prompt tokens / BENCH_PREFILL_TPS
+#                    + completion tokens / BENCH_DECODE_TPS
+# (tokens estimated as characters / 4), scaled down by BENCH_TIME_SCALE so a
+# run takes seconds. Reported times are scaled back up.
+# Run from the backend folder:  python -m benchmarks.bench_contract_chunks
+
+import os
+import json
+import time
+import random
+import asyncio
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import routers.Contract as contract
+from contract_chunks import CONTRACT_CHUNK_CONCURRENCY, chunk_areas, chunk_contract
+from regulatory_cache import FAR_DITA_FILES
+
+PAGES = [int(pages) for pages in os.getenv("BENCH_PAGES", "10,50,100").split(",")]
+PAGE_CHARS = 3000
+FAR_CLAUSE_CHARS = int(os.getenv("BENCH_FAR_CHARS", "15000"))
+LLM_BASE = float(os.getenv("BENCH_LLM_BASE", "0.5"))
+PREFILL_TPS = float(os.getenv("BENCH_PREFILL_TPS", "4000"))
+DECODE_TPS = float(os.getenv("BENCH_DECODE_TPS", "50"))
+TIME_SCALE = float(os.getenv("BENCH_TIME_SCALE", "0.02"))
+CONTEXT_TOKENS = 128_000  # gpt-4o
+SINGLE_CALL_COMPLETION = 1500  # the former max_tokens, usually used in full
+CHUNK_COMPLETION = 150  # per area in a chunk's JSON answer
+
+FILLER = ("The Contractor shall perform the services in accordance with the statement of work "
+          "and the schedule agreed with the Program Manager. ")
+CLAUSES = [
+    "Payment shall be made within 30 days after receipt of a proper invoice.",
+    "The Contractor shall not subcontract any part of the work without prior written consent.",
+    "The Government may terminate this contract for default if the Contractor fails to perform.",
+    "The Contractor certifies that it is registered in SAM.gov and is not debarred or suspended.",
+    "The Contractor shall disclose any conflict of interest arising during performance.",
+]
+
+
+def synthetic_contract(rng: random.Random, pages: int) -> str:
+    sections, size, number = [], 0, 1
+    while size < pages * PAGE_CHARS:
+        body = FILLER * rng.randint(5, 20)
+        if rng.random() < 0.15:
+            body += " " + rng.choice(CLAUSES)
+        section = f"{number}. SECTION {number}\n{body}"
+        sections.append(section)
+        size += len(section)
+        number += 1
+    return "\n".join(sections)
+
+
+def tokens(text: str) -> int:
+    return len(text) // 4
+
+
+async def simulated_call(prompt_tokens: int, completion_tokens: int) -> None:
+    seconds = LLM_BASE + prompt_tokens / PREFILL_TPS + completion_tokens / DECODE_TPS
+    await asyncio.sleep(seconds * TIME_SCALE)
+
+
+async def fake_chat_completion(client, schema, model, messages, **kwargs):
+    user = messages[-1]["content"]
+    areas = [line[2:] for line in user.split("Compliance areas to assess:\n")[1].split("\n\n")[0].splitlines()]
+    await simulated_call(tokens(messages[0]["content"] + user), CHUNK_COMPLETION * len(areas))
+    return schema.model_validate_json(json.dumps({"areas": [
+        {"area": area, "addressed": True, "risk_level": "Low", "issues": []} for area in areas
+    ]}))
+
+
+async def run(pages: int, contract_text: str) -> None:
+    chunks = chunk_contract(contract_text)
+    sent = [areas for areas in chunk_areas(chunks) if areas]
+
+    start = time.perf_counter()
+    analysis = await contract.analyze_contract(contract_text)
+    chunked = (time.perf_counter() - start) / TIME_SCALE
+
+    far_tokens = tokens(FAR_CLAUSE_CHARS * len(FAR_DITA_FILES) * "x")
+    single_tokens = far_tokens + tokens(contract_text)
+    start = time.perf_counter()
+    await simulated_call(single_tokens, SINGLE_CALL_COMPLETION)
+    single = (time.perf_counter() - start) / TIME_SCALE
+
+    fits = "fits" if single_tokens < CONTEXT_TOKENS else "exceeds context"
+    print(f"{pages:>4} pages: single call {single_tokens:>7,} tokens ({fits}) {single:6.1f} s | "
+          f"chunked {len(sent):>3}/{len(chunks):<3} chunks sent, "
+          f"concurrency {CONTRACT_CHUNK_CONCURRENCY}, {chunked:6.1f} s, score {analysis.score}%")
+
+
+async def main() -> None:
+    far_texts = {far_file: "x" * FAR_CLAUSE_CHARS for far_file in FAR_DITA_FILES}
+    contract.load_far_regulatory_data = lambda: far_texts
+    contract.structured_chat_completion = fake_chat_completion
+    rng = random.Random(0)
+    for pages in PAGES:
+        await run(pages, synthetic_contract(rng, pages))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
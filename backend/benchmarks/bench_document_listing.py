@@ -0,0 +1,77 @@
+# bench_document_listing.py
+#
+# Latency of the document listing as the table grows: the previous
+# SELECT * of every row of a user (report_data included) against one keyset
+# page of summaries, taken at the start and deep inside the listing.
+# Run from the backend folder:  python -m benchmarks.bench_document_listing
+
+import os
+import time
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import database
+from routers.documents import DocumentFilters, decode_cursor, fetch_document_page
+
+SIZES = [1_000, 10_000, 100_000]
+USERS = 5
+REPORT_BYTES = int(os.getenv("BENCH_REPORT_BYTES", "5000"))
+PAGE_SIZE = 50
+REPEAT = 20
+
+
+def legacy_list(user_id: int) -> int:
+    with database.get_db(readonly=True) as db:
+        return len(db.execute('''
+        SELECT * FROM documents
+        WHERE user_id = ?
+        ORDER BY upload_date DESC
+        ''', (user_id,)).fetchall())
+
+
+def timed(func, *args) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    report = "x" * REPORT_BYTES
+    filters = DocumentFilters()
+    print(f"{'documents':>10} {'legacy all rows':>16} {'first page':>11} {'deep page':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "listing.db")
+        database.init_db()
+        inserted = 0
+        for size in SIZES:
+            with database.get_db() as db:
+                db.executemany('''
+                INSERT INTO documents (user_id, document_name, document_type,
+                                       upload_date, status, risk_level, report_data)
+                VALUES (?, ?, 'contract', ?, 'processed', 'LOW', ?)
+                ''', [
+                    (2 + i % USERS, f"doc{i}.pdf", f"2024-01-01T{i:012d}", report)
+                    for i in range(inserted, size)
+                ])
+            inserted = size
+
+            # Cursor of the page halfway through user 2's documents
+            cursor = None
+            for _ in range(size // USERS // PAGE_SIZE // 2):
+                _, next_cursor = fetch_document_page(2, filters, cursor, PAGE_SIZE)
+                cursor = decode_cursor(next_cursor) if next_cursor else None
+
+            legacy = timed(legacy_list, 2)
+            first = timed(fetch_document_page, 2, filters, None, PAGE_SIZE)
+            deep = timed(fetch_document_page, 2, filters, cursor, PAGE_SIZE)
+            print(f"{size:>10} {legacy * 1000:>13.2f} ms {first * 1000:>8.2f} ms "
+                  f"{deep * 1000:>7.2f} ms")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
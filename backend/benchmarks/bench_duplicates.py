@@ -0,0 +1,99 @@
+# bench_duplicates.py
+#
+# Scaling benchmark for detect_duplicate_invoices.
+# Run from the backend folder:  python -m benchmarks.bench_duplicates
+
+import os
+import random
+import time
+from collections import defaultdict
+from typing import List
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from fuzzywuzzy import fuzz
+
+from routers.Invoice import Invoice, detect_duplicate_invoices
+
+VENDORS = ["Acme Corp", "Globex", "Initech", "Umbrella LLC", "Stark Industries"]
+ITEMS = [
+    "Consulting services", "Software license renewal", "Office supplies",
+    "Cloud hosting", "Network equipment", "Security audit", "Travel expenses",
+    "Maintenance contract", "Training workshop", "Data migration",
+]
+
+
+def make_invoices(n: int, seed: int = 7) -> List[Invoice]:
+    """Synthetic monthly batch: a few big vendors, recurring line items."""
+    rng = random.Random(seed)
+    invoices = []
+    for i in range(n):
+        item = rng.choice(ITEMS)
+        invoices.append(Invoice(
+            invoice_id=f"INV{i:07d}",
+            vendor=rng.choice(VENDORS),
+            amount=round(rng.uniform(100, 100000), 2),
+            gsa_standard=1000.0,
+            payment_routing="US Bank",
+            invoice_date=f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            description=f"{item} {rng.choice(['Q1', 'Q2', 'Q3', 'Q4'])} #{rng.randint(1, 500)}",
+        ))
+    return invoices
+
+
+def legacy_detect_duplicate_invoices(invoices: List[Invoice]) -> List[str]:
+    """The original all-pairs implementation, kept as the reference result."""
+    seen_invoices = {}
+    potential_duplicates = []
+    for inv in invoices:
+        key = f"{inv.vendor.lower()}_{inv.amount}_{inv.invoice_date}"
+        if key in seen_invoices:
+            potential_duplicates.append(
+                f"Exact duplicate found: {inv.invoice_id} (Vendor: {inv.vendor}, Amount: {inv.amount})"
+            )
+        else:
+            seen_invoices[key] = inv.invoice_id
+
+    vendor_groups = defaultdict(list)
+    for inv in invoices:
+        vendor_groups[inv.vendor.lower()].append(inv)
+
+    for vendor, invoices_list in vendor_groups.items():
+        for i in range(len(invoices_list)):
+            for j in range(i + 1, len(invoices_list)):
+                inv1, inv2 = invoices_list[i], invoices_list[j]
+                if (
+                    fuzz.ratio(inv1.description.lower(), inv2.description.lower()) > 80
+                    and fuzz.ratio(inv1.vendor.lower(), inv2.vendor.lower()) > 80
+                    and abs(float(inv1.amount) - float(inv2.amount)) <= 10
+                    and inv1.invoice_id != inv2.invoice_id
+                ):
+                    potential_duplicates.append(
+                        f"Potential duplicate invoices: {inv1.invoice_id} and {inv2.invoice_id} (Similar descriptions & amounts)"
+                    )
+    return potential_duplicates
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    # The legacy scan is quadratic, so only run it where it finishes quickly.
+    legacy_limit = int(os.getenv("BENCH_LEGACY_LIMIT", "10000"))
+    print(f"{'rows':>8} {'indexed (s)':>12} {'legacy (s)':>12} {'pairs':>8} {'same':>6}")
+    for n in (1_000, 10_000, 100_000):
+        invoices = make_invoices(n)
+        (result, _), elapsed = timed(detect_duplicate_invoices, invoices)
+        if n <= legacy_limit:
+            expected, legacy_elapsed = timed(legacy_detect_duplicate_invoices, invoices)
+            legacy_col, same_col = f"{legacy_elapsed:12.3f}", str(result == expected)
+        else:
+            legacy_col, same_col = f"{'skipped':>12}", "-"
+        print(f"{n:>8} {elapsed:12.3f} {legacy_col} {len(result):>8} {same_col:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# bench_endpoints.py
+#
+# End-to-end latency and throughput of the upload endpoints, fully offline.
+# The FastAPI app runs in-process (httpx ASGI transport, lifespan included)
+# on a fresh database, with the pluggable backends switched to local ones:
+#   - LLM_BACKEND=fake      simulated OpenAI (fake_llm.py, --llm-latency),
+#   - OCR_BACKEND=fixtures  recorded OCR text (ocr.py); the scanned invoices
+#                           below are rendered from the sample PDFs, and their
+#                           fixtures are recorded from the text layer,
+#   - FAR_OFFLINE=true      a synthetic FAR snapshot (far_snapshot.py).
+# Inputs are the files in "sample documents/", a synthetic contract that
+# touches every compliance area and synthetic CSVs. Each request
+# uploads a unique variant of its file, so the extraction and LLM caches
+# (fresh, in a temp dir) miss as they would for new documents; --warm
+# re-uploads the same file to measure the cached path instead.
+#
+# Reports p50/p95/p99 latency and throughput per endpoint. Run from the
+# backend folder:
+#   python -m benchmarks.bench_endpoints [--requests 20] [--concurrency 4]
+#   python -m benchmarks.bench_endpoints --only check_invoice_compliance --json out.json
+
+import io
+import os
+import json
+import time
+import asyncio
+import logging
+import zipfile
+import argparse
+import statistics
+import tempfile
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "sample documents")
+CONTRACT_DOCX = os.path.join(SAMPLES_DIR, "contract", "Customer Churn Analytics - Scope.docx")
+INVOICE_PDFS = [
+    os.path.join(SAMPLES_DIR, "invoice", "eW5tGSP8ae.pdf"),
+    os.path.join(SAMPLES_DIR, "invoice", "oShIpB8Jlf.pdf"),
+]
+
+# (form field, (filename, bytes))
+Upload = Tuple[str, Tuple[str, bytes]]
+
+
+class Scenario(NamedTuple):
+    name: str
+    path: str
+    files: Callable[[int], List[Upload]]  # request number -> upload
+    documents: int = 1  # per request, for the throughput column
+
+
+# -----------------------------------------------------------------------------
+# Inputs
+# -----------------------------------------------------------------------------
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def reference(n: int, label: str = "") -> str:
+    """Line that makes each variant's text, and so its LLM prompt, unique
+    (the label keeps scenarios on the same document apart)."""
+    return f"Benchmark reference {label}{n}."
+
+
+def pdf_variant(data: bytes, n: int, label: str = "") -> bytes:
+    import fitz
+
+    with fitz.open(stream=data, filetype="pdf") as document:
+        document[0].insert_text((36, 20), reference(n, label), fontsize=6)
+        return document.tobytes()
+
+
+def docx_variant(data: bytes, n: int, label: str = "") -> bytes:
+    from docx import Document
+
+    document = Document(io.BytesIO(data))
+    document.add_paragraph(reference(n, label))
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def synthetic_contract_docx(pages: int, n: int) -> bytes:
+    """A contract of `pages` pages with some clauses of every compliance
+    area (bench_contract_chunks.synthetic_contract)."""
+    import random
+    from docx import Document
+    from benchmarks.bench_contract_chunks import synthetic_contract
+
+    document = Document()
+    for line in synthetic_contract(random.Random(n), pages).splitlines():
+        document.add_paragraph(line)
+    document.add_paragraph(reference(n))
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def scanned_pdf(data: bytes, dpi: int = 100) -> Tuple[bytes, List[str]]:
+    """Image-only copy of a PDF (so every page goes to OCR) and the text of
+    its pages, to record as the OCR fixture."""
+    import fitz
+
+    scan = fitz.open()
+    texts = []
+    with fitz.open(stream=data, filetype="pdf") as source:
+        for page in source:
+            texts.append(page.get_text("text"))
+            pixmap = page.get_pixmap(dpi=dpi)
+            scan.new_page(width=page.rect.width, height=page.rect.height).insert_image(
+                page.rect, pixmap=pixmap
+            )
+    try:
+        return scan.tobytes(), texts
+    finally:
+        scan.close()
+
+
+class Inputs:
+    """Per-request upload variants; built once, before timing starts."""
+
+    def __init__(self, warm: bool, csv_rows: int, batch_files: int, contract_pages: int):
+        from ocr import save_fixture
+
+        self.warm = warm
+        self.csv_rows = csv_rows
+        self.contract_pages = contract_pages
+        self.batch_files = batch_files
+        self.contract = read(CONTRACT_DOCX)
+        self.invoices = [read(path) for path in INVOICE_PDFS]
+        self.scans = []
+        for data in self.invoices:
+            scan, texts = scanned_pdf(data)
+            self.scans.append((scan, texts))
+        self._save_fixture = save_fixture
+        self._docx: Dict[Tuple[str, int], bytes] = {}
+
+    def variant(self, n: int) -> int:
+        return 0 if self.warm else n
+
+    def contract_docx(self, n: int, label: str = "") -> List[Upload]:
+        n = self.variant(n)
+        if (label, n) not in self._docx:
+            self._docx[label, n] = docx_variant(self.contract, n, label)
+        return [("file", (f"contract-{n}.docx", self._docx[label, n]))]
+
+    def synthetic_contract_docx(self, n: int) -> List[Upload]:
+        n = self.variant(n)
+        if ("synthetic", n) not in self._docx:
+            self._docx["synthetic", n] = synthetic_contract_docx(self.contract_pages, n)
+        return [("file", (f"synthetic-contract-{n}.docx", self._docx["synthetic", n]))]
+
+    def invoice_pdf(self, n: int) -> List[Upload]:
+        data = pdf_variant(self.invoices[n % len(self.invoices)], self.variant(n))
+        return [("file", (f"invoice-{n}.pdf", data))]
+
+    def scanned_invoice_pdf(self, n: int) -> List[Upload]:
+        scan, texts = self.scans[n % len(self.scans)]
+        data = scan + f"\n%bench-{self.variant(n)}\n".encode("ascii")  # comment after %%EOF
+        texts = [texts[0] + reference(self.variant(n), "scan-") + "\n", *texts[1:]]
+        self._save_fixture(data, dict(enumerate(texts, 1)))
+        return [("file", (f"scan-{n}.pdf", data))]
+
+    def invoice_csv(self, n: int) -> List[Upload]:
+        from benchmarks.bench_invoice_engine import make_csv
+
+        return [("file", (f"invoices-{n}.csv", make_csv(self.csv_rows, seed=self.variant(n))))]
+
+    def invoice_zip(self, n: int) -> List[Upload]:
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, "w") as archive:
+            for i in range(self.batch_files):
+                data = self.invoices[i % len(self.invoices)]
+                variant = pdf_variant(data, self.variant(n) * self.batch_files + i, "batch-")
+                archive.writestr(f"invoice-{i}.pdf", variant)
+        return [("files", (f"invoices-{n}.zip", out.getvalue()))]
+
+
+def scenarios(inputs: Inputs) -> List[Scenario]:
+    return [
+        Scenario("analyze_contract", "/analyze_contract/", inputs.contract_docx),
+        Scenario("analyze_contract (synthetic)", "/analyze_contract/",
+                 inputs.synthetic_contract_docx),
+        Scenario("check_contract_against_test_cases", "/check_contract_against_test_cases/",
+                 lambda n: inputs.contract_docx(n, "tc-")),
+        Scenario("check_invoice_compliance", "/check_invoice_compliance/", inputs.invoice_pdf),
+        Scenario("check_invoice_compliance (scanned)", "/check_invoice_compliance/",
+                 inputs.scanned_invoice_pdf),
+        Scenario("upload-csv-invoices", "/upload-csv-invoices/", inputs.invoice_csv),
+        Scenario("batch/check_invoice_compliance", "/batch/check_invoice_compliance/",
+                 inputs.invoice_zip, documents=inputs.batch_files),
+    ]
+
+
+# -----------------------------------------------------------------------------
+# Measurement
+# -----------------------------------------------------------------------------
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def failure(response) -> Optional[str]:
+    """Why a response is not a successful analysis, or None."""
+    if response.status_code != 200:
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        last = json.loads(response.text.strip().splitlines()[-1])
+        if "summary" not in last:
+            return f"no summary line: {last}"
+        if last["summary"]["failed"] or last["summary"]["skipped"]:
+            return f"batch had failures: {last['summary']}"
+    return None
+
+
+async def run_scenario(client, scenario: Scenario, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+    # Built before the clock starts
+    uploads = [scenario.files(n) for n in range(args.warmup + args.requests)]
+
+    async def send(files: List[Upload], record: bool) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(scenario.path, files=files)
+            elapsed = time.perf_counter() - start
+        if not record:
+            return
+        error = failure(response)
+        if error:
+            errors.append(error)
+        else:
+            latencies.append(elapsed)
+
+    for files in uploads[:args.warmup]:
+        await send(files, record=False)
+    start = time.perf_counter()
+    await asyncio.gather(*(send(files, record=True) for files in uploads[args.warmup:]))
+    wall = time.perf_counter() - start
+
+    result = {
+        "endpoint": scenario.name,
+        "requests": args.requests,
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(args.requests / wall, 2),
+        "documents_per_s": round(args.requests * scenario.documents / wall, 2),
+    }
+    if latencies:
+        result.update({
+            "p50_s": round(percentile(latencies, 50), 3),
+            "p95_s": round(percentile(latencies, 95), 3),
+            "p99_s": round(percentile(latencies, 99), 3),
+            "mean_s": round(statistics.mean(latencies), 3),
+        })
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def print_row(result: dict) -> None:
+    def ms(key: str) -> str:
+        return f"{result[key] * 1000:9.0f}" if key in result else f"{'-':>9}"
+
+    print(
+        f"{result['endpoint']:<36} {result['requests']:>5} {result['errors']:>4} "
+        f"{ms('p50_s')} {ms('p95_s')} {ms('p99_s')} {ms('mean_s')} "
+        f"{result['requests_per_s']:>8.2f} {result['documents_per_s']:>8.2f}"
+    )
+
+
+# -----------------------------------------------------------------------------
+# Main
+# -----------------------------------------------------------------------------
+def configure_backends(args, work_dir: str) -> None:
+    """Environment for the offline backends; must run before the app is imported."""
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_S": str(args.llm_latency),
+        "FAKE_LLM_JITTER_S": str(args.llm_jitter),
+        "LLM_REQUESTS_PER_MINUTE": str(args.rpm),
+        "LLM_TOKENS_PER_MINUTE": str(args.tpm),
+        "OCR_BACKEND": "fixtures",
+        "OCR_FIXTURES_DIR": os.path.join(work_dir, "ocr_fixtures"),
+        "FAR_OFFLINE": "true",
+        "FAR_SNAPSHOT_PATH": os.path.join(work_dir, "far_snapshot.json"),
+        "FAR_CACHE_DIR": os.path.join(work_dir, "far_cache"),
+        "LLM_CACHE_PATH": os.path.join(work_dir, "llm_cache.db"),
+        "EXTRACTION_CACHE_PATH": os.path.join(work_dir, "extraction_cache.db"),
+    })
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+
+async def run(args, work_dir: str) -> List[dict]:
+    import httpx
+
+    from benchmarks.far_snapshot import synthetic_corpus, write_snapshot
+    write_snapshot(os.environ["FAR_SNAPSHOT_PATH"], synthetic_corpus(args.far_chars), "benchmark")
+
+    import database
+    database.DATABASE_URL = os.path.join(work_dir, "bench.db")
+    from main import app
+    from llm_gateway import llm_gateway
+    from routers.auth import create_access_token
+
+    logging.getLogger().setLevel(logging.ERROR)
+    inputs = Inputs(args.warm, args.csv_rows, args.batch_files, args.contract_pages)
+    selected = [s for s in scenarios(inputs) if not args.only or s.name in args.only]
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        headers = {"Authorization": "Bearer " + create_access_token({"sub": "user1"})}
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", headers=headers, timeout=None
+        ) as client:
+            print(f"{'endpoint':<36} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} "
+                  f"{'p99 ms':>9} {'mean ms':>9} {'req/s':>8} {'docs/s':>8}")
+            for scenario in selected:
+                result = await run_scenario(client, scenario, args)
+                print_row(result)
+                results.append(result)
+        llm_stats = llm_gateway.stats()["models"]
+    for result in results:
+        if "first_error" in result:
+            print(f"{result['endpoint']}: {result['first_error']}")
+    print("LLM gateway:", json.dumps(llm_stats))
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the upload endpoints.")
+    parser.add_argument("--requests", type=int, default=20, help="timed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests per endpoint")
+    parser.add_argument("--warm", action="store_true", help="re-upload the same file (cache hits)")
+    parser.add_argument("--only", nargs="*", help="endpoint names to run")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake LLM base latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="fake LLM extra latency (s)")
+    parser.add_argument("--rpm", type=int, default=0, help="LLM requests per minute (0: no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="LLM tokens per minute (0: no limit)")
+    parser.add_argument("--far-chars", type=int, default=15000, help="characters per FAR clause")
+    parser.add_argument("--csv-rows", type=int, default=1000)
+    parser.add_argument("--contract-pages", type=int, default=20, help="synthetic contract length")
+    parser.add_argument("--batch-files", type=int, default=10, help="invoices per batch ZIP")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench_endpoints_") as work_dir:
+        configure_backends(args, work_dir)
+        results = asyncio.run(run(args, work_dir))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
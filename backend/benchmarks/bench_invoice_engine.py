@@ -0,0 +1,79 @@
+# bench_invoice_engine.py
+#
+# Row engine (parse_csv_invoices + analyze_invoices) vs the columnar engine
+# (parse_csv_columns + analyze_invoice_columns) on synthetic CSV uploads.
+# Run from the backend folder:  python -m benchmarks.bench_invoice_engine
+
+import os
+import random
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from routers.Invoice import (
+    analyze_invoice_columns,
+    analyze_invoices,
+    invoice_dicts_from_columns,
+    parse_csv_columns,
+    parse_csv_invoices,
+)
+
+HEADER = (
+    "invoice_id,vendor,amount,gsa_standard,payment_routing,invoice_date,"
+    "payment_delay_days,early_payment_requested,supporting_documents,description"
+)
+VENDORS = ["Acme Corp", "Globex", "Initech", "Umbrella LLC", "Stark Industries"]
+ROUTING = ["US Bank", "Chase", "Panama Trust", "Cayman Islands Holdings", "Wells Fargo"]
+ITEMS = [
+    "Consulting services", "Software license renewal", "Office supplies",
+    "Cloud hosting", "Network equipment", "Security audit", "Travel expenses",
+]
+
+
+def make_csv(n: int, seed: int = 11) -> bytes:
+    rng = random.Random(seed)
+    lines = [HEADER]
+    for i in range(n):
+        invoice_id = f"INV{rng.randint(0, n):07d}" if rng.random() < 0.01 else f"INV{i:07d}"
+        gsa = round(rng.uniform(100, 50000), 2)
+        lines.append(",".join([
+            invoice_id,
+            rng.choice(VENDORS),
+            str(round(gsa * rng.uniform(0.8, 1.6), 2)),
+            str(gsa),
+            rng.choice(ROUTING),
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            rng.choice(["", "0", "3", "10", "20", "45"]),
+            rng.choice(["true", "false", "False"]),
+            rng.choice(["true", "True", "false"]),
+            f"{rng.choice(ITEMS)} {rng.choice(['Q1', 'Q2', 'Q3', 'Q4'])} #{rng.randint(1, 5000)}",
+        ]))
+    return "\n".join(lines).encode("utf-8")
+
+
+def main():
+    print(f"{'rows':>8} {'rows engine (s)':>16} {'columnar (s)':>13} {'speedup':>8} {'same':>6}")
+    for n in (1_000, 10_000, 100_000):
+        data = make_csv(n)
+
+        start = time.perf_counter()
+        invoices = parse_csv_invoices(data)
+        row_reports = [report.dict() for report in analyze_invoices(invoices)]
+        row_invoices = [inv.dict() for inv in invoices]
+        row_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns = parse_csv_columns(data)
+        col_reports = analyze_invoice_columns(columns)
+        col_invoices = invoice_dicts_from_columns(columns)
+        col_elapsed = time.perf_counter() - start
+
+        same = row_reports == col_reports and row_invoices == col_invoices
+        print(
+            f"{n:>8} {row_elapsed:16.3f} {col_elapsed:13.3f} "
+            f"{row_elapsed / col_elapsed:7.1f}x {str(same):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench_invoice_findings.py
+#
+# Bulk insert rate of invoice_findings and latency of the /invoice-findings
+# queries (vendor, risk level, date range, each with a deep cursor page) as
+# the table grows to millions of rows.
+# Run from the backend folder:  python -m benchmarks.bench_invoice_findings
+
+import os
+import time
+import random
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import database
+from findings import save_findings
+from routers.documents import decode_cursor
+from routers.findings import FindingFilters, fetch_findings_page
+
+SIZES = [int(size) for size in os.getenv("BENCH_FINDINGS", "100000,1000000,3000000").split(",")]
+USERS = 5
+VENDORS = 2000
+ROWS_PER_DOCUMENT = 10_000
+PAGE_SIZE = 100
+REPEAT = 20
+LEVELS = ("Safe", "Suspicious", "Fraud Detected")
+
+QUERIES = [
+    ("vendor + quarter", 2, FindingFilters(vendor="vendor17", date_from="2024-01-01", date_to="2024-04-01")),
+    ("fraud this quarter", 2, FindingFilters(risk_level="fraud detected", date_from="2024-01-01", date_to="2024-04-01")),
+    ("fraud, admin", None, FindingFilters(risk_level="Fraud Detected")),
+    ("date range", 2, FindingFilters(date_from="2024-05-01", date_to="2024-06-01")),
+]
+
+
+def document_rows(rng: random.Random, count: int):
+    for _ in range(count):
+        level = rng.choice(LEVELS)
+        yield (
+            f"INV{rng.randrange(10**6):06d}",
+            f"vendor{rng.randrange(VENDORS)}",
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            round(rng.uniform(10, 5000), 2),
+            rng.randint(0, 100),
+            level,
+            None if level == "Safe" else "Payment routed through a high-risk country.",
+            None if level == "Safe" else "High",
+            None if level == "Safe" else 35,
+        )
+
+
+def timed(func, *args) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "findings.db")
+        database.init_db()
+        inserted = 0
+        for size in SIZES:
+            added = size - inserted
+            start = time.perf_counter()
+            document_id = inserted // ROWS_PER_DOCUMENT
+            while inserted < size:
+                count = min(ROWS_PER_DOCUMENT, size - inserted)
+                # One transaction per upload, like store_invoice_document
+                with database.get_db() as db:
+                    save_findings(db, document_id, 2 + document_id % USERS, document_rows(rng, count))
+                inserted += count
+                document_id += 1
+            elapsed = time.perf_counter() - start
+            with database.get_db() as db:
+                db.execute("ANALYZE")
+
+            print(f"{size:,} findings (bulk insert {added / elapsed:,.0f} rows/s)")
+            for label, user_id, filters in QUERIES:
+                # Cursor of the tenth page
+                cursor = None
+                for _ in range(10):
+                    _, next_cursor = fetch_findings_page(user_id, filters, cursor, PAGE_SIZE)
+                    if not next_cursor:
+                        break
+                    cursor = decode_cursor(next_cursor)
+                first = timed(fetch_findings_page, user_id, filters, None, PAGE_SIZE)
+                deep = timed(fetch_findings_page, user_id, filters, cursor, PAGE_SIZE)
+                print(f"  {label:<20} first page {first * 1000:6.2f} ms   page 11 {deep * 1000:6.2f} ms")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
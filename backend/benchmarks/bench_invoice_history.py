@@ -0,0 +1,65 @@
+# bench_invoice_history.py
+#
+# Cost of checking an upload against the cross-upload duplicate index as the
+# history grows: every invoice of a 2,000-invoice upload is looked up
+# (exact key plus fuzzy candidates), half of them resubmissions.
+# Run from the backend folder:  python -m benchmarks.bench_invoice_history
+
+import os
+import time
+import random
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import database
+from invoice_history import history_row, save_history
+from routers.Invoice import lookup_invoice_history
+
+SIZES = [int(size) for size in os.getenv("BENCH_HISTORY", "10000,100000,1000000").split(",")]
+VENDORS = 500
+UPLOAD = 2_000
+WORDS = ["cloud", "hosting", "consulting", "office", "supplies", "license", "support",
+         "maintenance", "travel", "training", "hardware", "monthly", "annual", "services"]
+
+
+def random_invoice(rng: random.Random, number: int) -> dict:
+    return {
+        "invoice_id": f"INV{number:08d}",
+        "vendor": f"Vendor{rng.randrange(VENDORS)}",
+        "amount": float(rng.randint(50, 50_000)),
+        "invoice_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "description": " ".join(rng.sample(WORDS, rng.randint(2, 4))),
+    }
+
+
+def main() -> None:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "history.db")
+        database.init_db()
+        history = []
+        for size in SIZES:
+            new = [random_invoice(rng, number) for number in range(len(history), size)]
+            with database.get_db() as db:
+                save_history(db, 1, 1, (history_row(invoice) for invoice in new))
+                db.execute("ANALYZE")
+            history.extend(new)
+
+            upload = rng.sample(history, UPLOAD // 2) + [
+                random_invoice(rng, size + number) for number in range(UPLOAD // 2)
+            ]
+            start = time.perf_counter()
+            issues = lookup_invoice_history(database.DATABASE_URL, 1, (
+                (inv["invoice_id"], inv["vendor"], inv["amount"], inv["invoice_date"], inv["description"])
+                for inv in upload
+            ))
+            elapsed = time.perf_counter() - start
+            flagged = sum(1 for invoice_issues in issues if invoice_issues)
+            print(f"{size:>10,} invoices in history: {elapsed * 1000:7.1f} ms per upload, "
+                  f"{elapsed / UPLOAD * 1e6:6.1f} us per invoice, {flagged} flagged")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
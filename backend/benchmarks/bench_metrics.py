@@ -0,0 +1,77 @@
+# bench_metrics.py
+#
+# Overhead of the instrumentation in metrics.py: the cost of one stage()
+# (inside a trace, as during a request) and of MetricsMiddleware per request,
+# measured on a bare ASGI app so nothing else is in the timing. The total is
+# set against the fastest analysis request of benchmarks/bench_endpoints.py
+# (~0.5 s) with a generous number of stages; the target is under 1%.
+# Run from the backend folder:  python -m benchmarks.bench_metrics
+
+import time
+import asyncio
+import statistics
+
+from metrics import MetricsMiddleware, stage, traced
+
+STAGES = 100_000
+REQUESTS = 20_000
+STAGES_PER_REQUEST = 30  # an analysis records ~10; chunked contracts more
+REQUEST_SECONDS = 0.5
+
+
+def per_stage_seconds() -> float:
+    with traced("bench"):
+        start = time.perf_counter()
+        for _ in range(STAGES):
+            pass
+        empty = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(STAGES):
+            with stage("bench"):
+                pass
+        timed = time.perf_counter() - start
+    return (timed - empty) / STAGES
+
+
+async def bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def per_request_seconds(app) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / REQUESTS
+
+
+async def middleware_seconds() -> float:
+    runs = []
+    for _ in range(5):
+        bare = await per_request_seconds(bare_app)
+        wrapped = await per_request_seconds(MetricsMiddleware(bare_app))
+        runs.append(wrapped - bare)
+    return statistics.median(runs)
+
+
+def main() -> None:
+    stage_cost = statistics.median(per_stage_seconds() for _ in range(5))
+    request_cost = asyncio.run(middleware_seconds())
+    total = request_cost + STAGES_PER_REQUEST * stage_cost
+    print(f"stage():            {stage_cost * 1e6:7.2f} us")
+    print(f"MetricsMiddleware:  {request_cost * 1e6:7.2f} us per request")
+    print(f"per request with {STAGES_PER_REQUEST} stages: {total * 1e6:7.1f} us = "
+          f"{total / REQUEST_SECONDS:.4%} of a {REQUEST_SECONDS * 1000:.0f} ms request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# bench_sqlite.py
+#
+# Concurrent readers and writers against the documents database, comparing
+# the previous access pattern (a fresh rollback-journal connection per call,
+# unconditional commit) with the pooled WAL connections of database.get_db.
+# Writers insert analysed documents; readers run the user lookup done on every
+# authenticated request and the document detail query.
+# Run from the backend folder:  python -m benchmarks.bench_sqlite
+
+import os
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+import statistics
+from contextlib import contextmanager
+from typing import List
+
+import database
+
+WRITERS = int(os.getenv("BENCH_WRITERS", "4"))
+READERS = int(os.getenv("BENCH_READERS", "8"))
+WRITES_PER_WRITER = int(os.getenv("BENCH_WRITES", "200"))
+REPORT_BYTES = int(os.getenv("BENCH_REPORT_BYTES", "20000"))
+SEED_DOCUMENTS = 2000
+
+
+@contextmanager
+def legacy_get_db():
+    # database.get_db before pooling
+    conn = sqlite3.connect(database.DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.commit()
+        conn.close()
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(label: str, get_db, readonly_kwargs: dict) -> None:
+    report = "x" * REPORT_BYTES
+    stop = threading.Event()
+    read_latencies: List[List[float]] = [[] for _ in range(READERS)]
+    errors: List[str] = []
+
+    def writer(index: int) -> None:
+        for i in range(WRITES_PER_WRITER):
+            try:
+                with get_db() as db:
+                    db.execute('''
+                    INSERT INTO documents (user_id, document_name, document_type,
+                                           upload_date, status, risk_level, report_data)
+                    VALUES (?, ?, 'contract', ?, 'processed', 'LOW', ?)
+                    ''', (index % 4 + 2, f"w{index}-{i}.pdf", f"{time.time():.6f}", report))
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    def reader(index: int) -> None:
+        rng = random.Random(index)
+        samples = read_latencies[index]
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with get_db(**readonly_kwargs) as db:
+                    db.execute(
+                        "SELECT * FROM users WHERE username = ?", (f"user{rng.randint(1, 4)}",)
+                    ).fetchone()
+                with get_db(**readonly_kwargs) as db:
+                    db.execute(
+                        "SELECT * FROM documents WHERE id = ?", (rng.randint(1, SEED_DOCUMENTS),)
+                    ).fetchone()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            samples.append(time.perf_counter() - start)
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+    for thread in readers:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    reads = [sample for samples in read_latencies for sample in samples]
+    print(
+        f"{label:<8} writes/s={WRITERS * WRITES_PER_WRITER / elapsed:8.0f}  "
+        f"reads/s={len(reads) / elapsed:8.0f}  "
+        f"read p50={percentile(reads, 50) * 1000:6.2f} ms  "
+        f"p95={percentile(reads, 95) * 1000:6.2f} ms  "
+        f"p99={percentile(reads, 99) * 1000:6.2f} ms  "
+        f"max={max(reads) * 1000:7.1f} ms  "
+        f"mean={statistics.mean(reads) * 1000:6.2f} ms  "
+        f"errors={len(errors)}"
+    )
+
+
+def prepare(path: str, get_db) -> None:
+    database.DATABASE_URL = path
+    with get_db() as db:
+        pass
+    database.init_db()
+    with get_db() as db:
+        db.executemany('''
+        INSERT INTO documents (user_id, document_name, document_type,
+                               upload_date, status, risk_level, report_data)
+        VALUES (2, ?, 'contract', ?, 'processed', 'LOW', ?)
+        ''', [(f"seed{i}.pdf", f"{i:010d}", "x" * 2000) for i in range(SEED_DOCUMENTS)])
+
+
+def main() -> None:
+    print(f"{WRITERS} writers x {WRITES_PER_WRITER} inserts of {REPORT_BYTES} bytes, "
+          f"{READERS} readers")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Legacy: init_db would put the file in WAL mode through the pooled
+        # connection, so use a plain connection for setup and reset the mode.
+        legacy_path = os.path.join(tmp, "legacy.db")
+        prepare(legacy_path, legacy_get_db)
+        database.close_connections()
+        with legacy_get_db() as db:
+            db.execute("PRAGMA journal_mode=DELETE")
+        run("legacy", legacy_get_db, {})
+
+        prepare(os.path.join(tmp, "pooled.db"), database.get_db)
+        run("pooled", database.get_db, {"readonly": True})
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
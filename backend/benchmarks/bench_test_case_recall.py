@@ -0,0 +1,104 @@
+# bench_test_case_recall.py
+#
+# Recall of the top-k test-case selection (case_catalog.TEST_CASE_TOP_K)
+# against full-catalog results: for every stored contract/invoice test-case
+# check whose source file is available, the test cases the LLM flagged with
+# the whole catalog in the prompt are compared with the k cases BM25 picks
+# for the same document. Also reports the prompt size for each k.
+# Run from the backend folder:  python -m benchmarks.bench_test_case_recall
+#
+# BENCH_DATABASE is the database holding the full-catalog results (copied,
+# never modified) and BENCH_SAMPLES the folder with the uploaded files,
+# searched recursively by file name.
+
+import os
+import re
+import shutil
+import tempfile
+from collections import defaultdict
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import database
+from report_store import read_report
+from routers.Contract_new import contract_test_cases, extract_text_from_docx, extract_text_from_pdf
+from routers.Invoice_new import extract_text_from_pdf_bytes, invoice_test_cases
+
+BENCH_DATABASE = os.getenv("BENCH_DATABASE", "documents.db")
+BENCH_SAMPLES = os.getenv("BENCH_SAMPLES", os.path.join("..", "sample documents"))
+K_VALUES = [3, 5, 8, 10, 15, 20, 0]  # 0 = whole catalog
+
+# Whole IDs only: TC-002 must not match inside INV-TC-002
+TEST_CASE_ID = re.compile(r"(?<![\w-])(?:[A-Z]+-)*TC-\d+")
+
+
+def find_samples() -> dict:
+    paths = {}
+    for folder, _, files in os.walk(BENCH_SAMPLES):
+        for name in files:
+            paths.setdefault(name, os.path.join(folder, name))
+    return paths
+
+
+def document_text(document_type: str, path: str) -> str:
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    if document_type == "invoice_test_check":
+        return extract_text_from_pdf_bytes(file_bytes)
+    if path.lower().endswith(".docx"):
+        return extract_text_from_docx(file_bytes)
+    return extract_text_from_pdf(file_bytes)
+
+
+def main() -> None:
+    catalogs = {
+        "invoice_test_check": invoice_test_cases.load(),
+        "contract_test_check": contract_test_cases.load(),
+    }
+    samples = find_samples()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_URL = os.path.join(tmp, "results.db")
+        shutil.copy(BENCH_DATABASE, database.DATABASE_URL)
+        database.init_db()  # older copies keep report_data in documents
+        with database.get_db(readonly=True) as db:
+            rows = db.execute('''
+            SELECT d.document_type, d.document_name, r.data FROM documents d
+            JOIN reports r ON r.document_id = d.id
+            WHERE d.document_type IN ('invoice_test_check', 'contract_test_check')
+            ORDER BY d.id
+            ''').fetchall()
+        database.close_connections()
+
+    # (document type, file) -> flagged test-case sets, one per recorded run
+    runs = defaultdict(list)
+    for document_type, name, data in rows:
+        known = {record["Test Case ID"] for record in catalogs[document_type].records}
+        flagged = set(TEST_CASE_ID.findall(read_report(data))) & known
+        if flagged and name in samples:
+            runs[(document_type, name)].append(flagged)
+
+    for document_type, compiled in catalogs.items():
+        documents = [(name, flagged) for (kind, name), flagged in runs.items() if kind == document_type]
+        run_count = sum(len(flagged) for _, flagged in documents)
+        print(f"{document_type}: {len(compiled.records)} test cases, "
+              f"{len(documents)} document(s), {run_count} recorded run(s)")
+        if not documents:
+            continue
+        texts = {name: document_text(document_type, samples[name]) for name, _ in documents}
+        for k in K_VALUES:
+            found = total = 0
+            prompt_chars = 0
+            for name, flagged_runs in documents:
+                selected = {record["Test Case ID"] for record in compiled.select(texts[name], k or len(compiled.records))}
+                prompt_chars += len(compiled.prompt_for(texts[name], k)) * len(flagged_runs)
+                for flagged in flagged_runs:
+                    found += len(flagged & selected)
+                    total += len(flagged)
+            label = f"k={k}" if k else "all"
+            print(f"  {label:>5}: recall {found / total:6.1%} ({found}/{total}), "
+                  f"prompt {prompt_chars / run_count:8,.0f} chars per check")
+
+
+if __name__ == "__main__":
+    main()
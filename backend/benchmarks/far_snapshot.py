@@ -0,0 +1,59 @@
+# far_snapshot.py
+#
+# Writes a FAR corpus snapshot (the corpus.json format read through
+# FAR_SNAPSHOT_PATH, see regulatory_cache.py) so the app can run with
+# FAR_OFFLINE=true.
+#
+# Run from the backend folder:
+#   python -m benchmarks.far_snapshot far_snapshot.json
+#       the current corpus (disk cache, or downloaded once)
+#   python -m benchmarks.far_snapshot far_snapshot.json --synthetic 15000
+#       placeholder clauses of that many characters, for benchmarks
+
+import os
+import json
+import argparse
+from typing import Dict
+
+from regulatory_cache import FAR_DITA_FILES, far_corpus
+
+FILLER = (
+    "The Contractor shall comply with this clause in performing the contract and shall "
+    "insert the substance of this clause in subcontracts as required. "
+)
+
+
+def synthetic_corpus(chars: int) -> Dict[str, str]:
+    """Placeholder text of `chars` characters per FAR file."""
+    return {
+        far_file: (f"{far_file}\n" + FILLER * (chars // len(FILLER) + 1))[:chars]
+        for far_file in FAR_DITA_FILES
+    }
+
+
+def write_snapshot(path: str, texts: Dict[str, str], version: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "texts": texts}, f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a FAR corpus snapshot.")
+    parser.add_argument("path")
+    parser.add_argument("--synthetic", type=int, metavar="CHARS")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        write_snapshot(args.path, synthetic_corpus(args.synthetic), f"synthetic-{args.synthetic}")
+    else:
+        texts = far_corpus.get()
+        if not texts:
+            raise SystemExit("No FAR corpus available to snapshot.")
+        write_snapshot(args.path, texts, far_corpus.version or "unknown")
+    print(f"Wrote FAR snapshot to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
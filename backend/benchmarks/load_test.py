@@ -0,0 +1,144 @@
+# load_test.py
+#
+# Checks that lightweight endpoints stay responsive while heavy uploads are in
+# flight. Latency of GET /users/me and GET /documents/my-documents is sampled
+# first on an idle server, then while UPLOADS uploads run CONCURRENCY at a
+# time; with the event loop free the two distributions should be about the
+# same.
+#
+# Start the API (uvicorn main:app), then from the backend folder:
+#   python -m benchmarks.load_test --file "../sample documents/<file>" \
+#       --endpoint /analyze_contract/
+# Without --file a synthetic CSV is posted to /upload-csv-invoices/.
+
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.bench_invoice_engine import make_csv
+
+PROBE_PATHS = ["/users/me", "/documents/my-documents"]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(label: str, samples: List[float]) -> None:
+    if not samples:
+        print(f"{label:<32} no samples")
+        return
+    print(
+        f"{label:<32} n={len(samples):<5} "
+        f"p50={percentile(samples, 50) * 1000:8.1f} ms  "
+        f"p95={percentile(samples, 95) * 1000:8.1f} ms  "
+        f"max={max(samples) * 1000:8.1f} ms  "
+        f"mean={statistics.mean(samples) * 1000:8.1f} ms"
+    )
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def probe(
+    client: httpx.AsyncClient, stop: asyncio.Event, interval: float
+) -> Dict[str, List[float]]:
+    """Hit the lightweight endpoints in a loop until `stop` is set."""
+    samples = {path: [] for path in PROBE_PATHS}
+    while not stop.is_set():
+        for path in PROBE_PATHS:
+            start = time.perf_counter()
+            response = await client.get(path)
+            samples[path].append(time.perf_counter() - start)
+            response.raise_for_status()
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def upload(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    filename: str,
+    payload: bytes,
+    semaphore: asyncio.Semaphore,
+    durations: List[float],
+) -> None:
+    async with semaphore:
+        start = time.perf_counter()
+        response = await client.post(endpoint, files={"file": (filename, payload)})
+        durations.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            print(f"upload failed: {response.status_code} {response.text[:200]}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.file:
+        with open(args.file, "rb") as f:
+            payload = f.read()
+        filename = args.file.replace("\\", "/").split("/")[-1]
+    else:
+        payload = make_csv(args.rows)
+        filename = "load_test.csv"
+
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+        token = await login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        # Idle baseline
+        stop = asyncio.Event()
+        baseline_task = asyncio.create_task(probe(client, stop, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await baseline_task
+
+        # Same probes with uploads in flight
+        stop = asyncio.Event()
+        loaded_task = asyncio.create_task(probe(client, stop, args.interval))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        durations: List[float] = []
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            upload(client, args.endpoint, filename, payload, semaphore, durations)
+            for _ in range(args.uploads)
+        ))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        loaded = await loaded_task
+
+    print(f"{args.uploads} uploads of {filename} ({len(payload)} bytes) to {args.endpoint}, "
+          f"concurrency {args.concurrency}, {elapsed:.1f} s")
+    for path in PROBE_PATHS:
+        report(f"{path} idle", baseline[path])
+        report(f"{path} loaded", loaded[path])
+    report("uploads", durations)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default="user1pass")
+    parser.add_argument("--endpoint", default="/upload-csv-invoices/")
+    parser.add_argument("--file", help="document to upload (default: synthetic CSV)")
+    parser.add_argument("--rows", type=int, default=20000, help="rows of the synthetic CSV")
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.05, help="pause between probes (s)")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(main(parse_args()))
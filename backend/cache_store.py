@@ -0,0 +1,133 @@
+# cache_store.py
+#
+# Small persistent key/value cache on SQLite with size-bounded LRU eviction,
+# optional TTL and hit/miss counters. Used for content-addressed caches
+# (extracted document text, LLM responses).
+#
+# The stored byte total is read from the table once per connection and then
+# kept up to date by set() and deletions, so writes cost the same however
+# large the cache is; eviction removes the least recently used entries in
+# batches of EVICT_BATCH through the accessed_at index.
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+EVICT_BATCH = 100
+
+
+class SQLiteCache:
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total = 0  # bytes stored, valid once connected
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at)"
+            )
+            conn.commit()
+            self._total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None \
+                    and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.commit()
+                self._total -= row[2]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            replaced = conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            conn.execute('''
+            INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (key, value, len(value), now, now))
+            total = self._total + len(value) - (replaced[0] if replaced else 0)
+            total = self._evict(conn, total)
+            conn.commit()
+            self._total = total
+
+    def _evict(self, conn: sqlite3.Connection, total: int) -> int:
+        """Drop least recently used entries until the cache fits max_bytes;
+        returns the remaining total."""
+        while total > self.max_bytes:
+            batch = conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT ?",
+                (EVICT_BATCH,),
+            ).fetchall()
+            if not batch:
+                return 0
+            evicted = []
+            for key, size in batch:
+                evicted.append((key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+            self.evictions += len(evicted)
+        return total
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,188 @@
+# case_catalog.py
+#
+# In-memory catalogs of the Excel test cases used by the compliance checks
+# (routers/Invoice_new.py and routers/Contract_new.py).
+#
+# Each workbook is parsed once into a compiled form: the test-case records,
+# the text the prompt embeds for the whole catalog and a BM25 index over the
+# records. Requests only compare the file's mtime with the loaded one (a stat
+# call) and reuse the compiled form; the workbook is re-parsed, off the event
+# loop, only when the file changes. If a reload fails the previous version
+# keeps being served.
+#
+# With TEST_CASE_TOP_K > 0 a prompt only carries the k test cases that score
+# highest against the document (BM25 over every text column), instead of the
+# whole catalog. benchmarks/bench_test_case_recall.py measures how many of the
+# test cases flagged with the full catalog the top k still contain.
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from executors import run_io
+
+# 0 sends the whole catalog
+TEST_CASE_TOP_K = int(os.getenv("TEST_CASE_TOP_K", "0"))
+
+# -----------------------------------------------------------------------------
+# Retrieval
+# -----------------------------------------------------------------------------
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were will with not no any all".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words without stopwords; a trailing plural 's' is dropped."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a small, fixed set of documents (the test cases)."""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.size = len(documents)
+        term_counts = [Counter(tokenize(document)) for document in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average = (sum(lengths) / self.size) if self.size else 0.0
+
+        # term -> [(document, BM25 term weight)], precomputed since the
+        # documents never change
+        postings: Dict[str, list] = {}
+        for document, counts in enumerate(term_counts):
+            norm = k1 * (1 - b + b * lengths[document] / average) if average else k1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append(
+                    (document, count * (k1 + 1) / (count + norm))
+                )
+        self.postings = {}
+        for term, entries in postings.items():
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[term] = [(document, idf * weight) for document, weight in entries]
+
+    def scores(self, query: str) -> List[float]:
+        # Each distinct query term counts once: queries are whole documents
+        scores = [0.0] * self.size
+        for term in set(tokenize(query)):
+            for document, weight in self.postings.get(term, ()):
+                scores[document] += weight
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[int]:
+        """Indices of the k best documents, in their original order."""
+        scores = self.scores(query)
+        best = sorted(range(self.size), key=lambda document: -scores[document])[:k]
+        return sorted(best)
+
+
+# -----------------------------------------------------------------------------
+# Catalogs
+# -----------------------------------------------------------------------------
+# Parses a workbook into records / formats records for the prompt
+TestCaseCompiler = Callable[[str], List[dict]]
+TestCaseRenderer = Callable[[List[dict]], str]
+
+
+class CompiledTestCases(NamedTuple):
+    records: List[dict]  # one dict per test case, column name -> value
+    prompt: str  # the whole catalog as embedded in the LLM prompt
+    index: BM25Index
+    render: TestCaseRenderer
+    mtime_ns: Optional[int]  # of the file version served; None if it is missing
+
+    def select(self, text: str, k: int) -> List[dict]:
+        return [self.records[i] for i in self.index.top_k(text, k)]
+
+    def prompt_for(self, text: str, k: Optional[int] = None) -> str:
+        """Prompt text with the k test cases most relevant to `text` (all if k is 0)."""
+        k = TEST_CASE_TOP_K if k is None else k
+        if k <= 0 or k >= len(self.records):
+            return self.prompt
+        return self.render(self.select(text, k))
+
+
+def record_text(record: dict) -> str:
+    """What a record is indexed by: every text value."""
+    return " ".join(value for value in record.values() if isinstance(value, str))
+
+
+# Every catalog by path, for warm_catalogs()
+catalogs: Dict[str, "TestCaseCatalog"] = {}
+
+
+class TestCaseCatalog:
+    """One workbook: the compiled test cases and the mtime they came from."""
+
+    def __init__(self, path: str, compiler: TestCaseCompiler, render: TestCaseRenderer):
+        self.path = path
+        self.compiler = compiler
+        self.render = render
+        self._compiled: Optional[CompiledTestCases] = None
+        self._lock = threading.Lock()
+        catalogs[path] = self
+
+    def _mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def is_current(self) -> bool:
+        compiled = self._compiled
+        return compiled is not None and compiled.mtime_ns == self._mtime_ns()
+
+    def load(self) -> CompiledTestCases:
+        """(Re)compile the workbook if it changed. Blocking."""
+        with self._lock:
+            compiled = self._compiled
+            mtime_ns = self._mtime_ns()
+            if compiled is not None and compiled.mtime_ns == mtime_ns:
+                return compiled
+            try:
+                records = self.compiler(self.path)
+            except Exception as e:
+                if compiled is None:
+                    raise
+                # Keep serving the previous version until the file changes again
+                logging.warning(
+                    "Reloading %s failed (%s); keeping the previous version.", self.path, e
+                )
+                self._compiled = compiled._replace(mtime_ns=mtime_ns)
+                return self._compiled
+            self._compiled = CompiledTestCases(
+                records,
+                self.render(records),
+                BM25Index([record_text(record) for record in records]),
+                self.render,
+                mtime_ns,
+            )
+            logging.info("Loaded %d test case(s) from %s.", len(records), self.path)
+            return self._compiled
+
+    async def get(self) -> CompiledTestCases:
+        """The compiled catalog; only goes to a thread when it must (re)load."""
+        if self.is_current():
+            return self._compiled
+        return await run_io(self.load)
+
+
+def warm_catalogs() -> None:
+    """Compile every catalog at startup; failures are retried on first use."""
+    for catalog in catalogs.values():
+        try:
+            catalog.load()
+        except Exception as e:
+            logging.warning("Could not load test cases from %s: %s", catalog.path, e)
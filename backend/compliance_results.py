@@ -0,0 +1,241 @@
+# compliance_results.py
+#
+# Structured results of the contract and test-case analyses.
+#
+# The LLM answers these analyses with JSON constrained by a JSON schema
+# (OpenAI structured outputs) generated from the Pydantic models below, so
+# the answer is parsed once, by validation, instead of scanning the report
+# text for words like "High". The parsed result is then stored as typed
+# columns next to the document:
+#   - documents.compliance_score (contract analyses),
+#   - contract_areas: one row per compliance area and contract,
+#   - failed_test_cases: one row per test case a document fails,
+# so dashboards can filter and aggregate without re-reading reports.
+# Reports written before these tables existed are free text and are not
+# backfilled.
+#
+# Like findings.py this never imports database.py.
+
+import json
+import logging
+from typing import Iterable, List, Literal, NamedTuple, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+RiskLevel = Literal["Low", "Medium", "High"]
+RISK_LEVELS = ["Low", "Medium", "High"]  # in increasing order
+
+Model = TypeVar("Model", bound=BaseModel)
+
+# -----------------------------------------------------------------------------
+# Structured output
+# -----------------------------------------------------------------------------
+def _strict_schema(schema: dict) -> dict:
+    """Adapt a Pydantic JSON schema in place to OpenAI's strict mode: every
+    property required, no additional properties, no titles or defaults."""
+    schema.pop("title", None)
+    schema.pop("default", None)
+    if "properties" in schema:
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema["properties"])
+        for prop in schema["properties"].values():
+            _strict_schema(prop)
+    if isinstance(schema.get("items"), dict):
+        _strict_schema(schema["items"])
+    for key in ("anyOf", "allOf"):
+        for sub in schema.get(key, ()):
+            _strict_schema(sub)
+    for sub in schema.get("$defs", {}).values():
+        _strict_schema(sub)
+    return schema
+
+
+def json_schema_format(model: Type[BaseModel]) -> dict:
+    """The chat completions response_format constraining output to `model`."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "strict": True,
+            "schema": _strict_schema(model.model_json_schema()),
+        },
+    }
+
+
+def parse_structured(model: Type[Model], content: Optional[str]) -> Optional[Model]:
+    """The validated answer, or None (logged) if it does not match the schema."""
+    try:
+        return model.model_validate_json(content or "")
+    except ValidationError as e:
+        logging.warning("Invalid %s answer: %s", model.__name__, e)
+        return None
+
+
+def normalize_risk(value) -> Optional[str]:
+    """'high', ' High ' -> 'High'; None for anything that is not a risk level."""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().strip("*").capitalize()
+    return value if value in RISK_LEVELS else None
+
+
+# -----------------------------------------------------------------------------
+# Test-case checks (routers/Contract_new.py, routers/Invoice_new.py)
+# -----------------------------------------------------------------------------
+class FailedTestCase(BaseModel):
+    test_case_id: str
+    reason: str  # why the document fails it, one or two sentences
+
+
+class TestCaseAssessment(BaseModel):
+    failed_test_cases: List[FailedTestCase]
+
+
+class TestCaseRow(NamedTuple):
+    test_case_id: str
+    name: str
+    risk_level: str  # from the catalog's Risk Level column
+    reason: str
+
+
+def failed_test_case_rows(assessment: TestCaseAssessment, records: List[dict]) -> List[TestCaseRow]:
+    """
+    Resolve the failed IDs against the catalog records: names and risk levels
+    come from the workbook, IDs that are not in it are dropped, repeats are
+    merged.
+    """
+    by_id = {str(record["Test Case ID"]).strip(): record for record in records}
+    rows, seen = [], set()
+    for failed in assessment.failed_test_cases:
+        test_case_id = failed.test_case_id.strip()
+        record = by_id.get(test_case_id)
+        if record is None:
+            logging.warning("Ignoring unknown test case %r in LLM answer.", test_case_id)
+            continue
+        if test_case_id in seen:
+            continue
+        seen.add(test_case_id)
+        rows.append(TestCaseRow(
+            test_case_id,
+            str(record.get("Test Case Name/Scenario") or ""),
+            normalize_risk(record.get("Risk Level")) or "High",
+            failed.reason.strip(),
+        ))
+    return rows
+
+
+def overall_risk_level(risk_levels: Iterable[str]) -> str:
+    """'HIGH', 'MEDIUM' or 'LOW': the highest of the failed test cases."""
+    highest = max(risk_levels, key=RISK_LEVELS.index, default="Low")
+    return highest.upper()
+
+
+def render_failed_test_cases(rows: List[TestCaseRow]) -> str:
+    """The stored report: a markdown table of the failed test cases."""
+    if not rows:
+        return "No test cases failed."
+    lines = [
+        "| Test Case ID | Test Case Name | Risk Level | Reason |",
+        "| --- | --- | --- | --- |",
+    ]
+    for row in rows:
+        cells = [row.test_case_id, row.name, row.risk_level, row.reason]
+        lines.append("| " + " | ".join(cell.replace("|", "\\|").replace("\n", " ") for cell in cells) + " |")
+    return "\n".join(lines)
+
+
+def test_case_outcome(
+    assessment: TestCaseAssessment, records: List[dict]
+) -> Tuple[str, str, "ComplianceResult"]:
+    """(risk_level, report, compliance result) of a test-case check."""
+    rows = failed_test_case_rows(assessment, records)
+    return (
+        overall_risk_level(row.risk_level for row in rows),
+        render_failed_test_cases(rows),
+        ComplianceResult(failed_test_cases=rows),
+    )
+
+
+# -----------------------------------------------------------------------------
+# Storage
+# -----------------------------------------------------------------------------
+# 0-100, contract analyses only. No SQL comment here: SQLite appends the
+# column definition verbatim to the stored CREATE TABLE text.
+ADD_COMPLIANCE_SCORE_COLUMN = '''
+ALTER TABLE documents ADD COLUMN compliance_score INTEGER
+'''
+
+CREATE_CONTRACT_AREAS_TABLE = '''
+CREATE TABLE IF NOT EXISTS contract_areas (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    area TEXT NOT NULL,                        -- contract_chunks.ComplianceArea.name
+    risk_level TEXT NOT NULL COLLATE NOCASE,   -- 'Low', 'Medium', 'High'
+    addressed INTEGER NOT NULL,                -- 0: no clause found
+    issues TEXT NOT NULL,                      -- JSON list of strings
+    FOREIGN KEY (document_id) REFERENCES documents (id)
+)
+'''
+
+CREATE_FAILED_TEST_CASES_TABLE = '''
+CREATE TABLE IF NOT EXISTS failed_test_cases (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    test_case_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    risk_level TEXT NOT NULL COLLATE NOCASE,
+    reason TEXT NOT NULL,
+    FOREIGN KEY (document_id) REFERENCES documents (id)
+)
+'''
+
+CREATE_COMPLIANCE_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_contract_areas_document
+    ON contract_areas (document_id)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_contract_areas_area_risk
+    ON contract_areas (area, risk_level)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_failed_test_cases_document
+    ON failed_test_cases (document_id)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_failed_test_cases_id
+    ON failed_test_cases (test_case_id)
+    ''',
+]
+
+
+class AreaRow(NamedTuple):
+    area: str
+    risk_level: str
+    addressed: bool
+    issues: List[str]
+
+
+class ComplianceResult(NamedTuple):
+    """What an analysis stores besides its report and risk level."""
+    score: Optional[int] = None
+    areas: List[AreaRow] = []
+    failed_test_cases: List[TestCaseRow] = []
+
+
+def save_compliance_result(db, document_id: int, result: ComplianceResult) -> None:
+    """Typed columns of one analysed document, in the caller's transaction."""
+    db.execute(
+        "UPDATE documents SET compliance_score = ? WHERE id = ?", (result.score, document_id)
+    )
+    db.executemany('''
+    INSERT INTO contract_areas (document_id, area, risk_level, addressed, issues)
+    VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (document_id, row.area, row.risk_level, int(row.addressed), json.dumps(row.issues))
+        for row in result.areas
+    ])
+    db.executemany('''
+    INSERT INTO failed_test_cases (document_id, test_case_id, name, risk_level, reason)
+    VALUES (?, ?, ?, ?, ?)
+    ''', [(document_id, *row) for row in result.failed_test_cases])
@@ -0,0 +1,336 @@
+# contract_chunks.py
+#
+# Map-reduce analysis of long contracts (routers/Contract.py).
+#
+# A contract is split at its section headings and the sections are packed
+# into chunks of at most CONTRACT_CHUNK_CHARS characters. Each chunk is sent
+# to the LLM on its own, together with only the FAR clauses of the compliance
+# areas its wording touches (keyword match). The keywords only narrow down
+# where an area is looked for, never whether: an area no chunk mentions is
+# asked about in every chunk, i.e. against the whole contract. Chunks left
+# with no area are not sent. The per-chunk findings are then merged here
+# without another LLM call:
+#   - an area's risk is the worst risk any chunk reported for it,
+#   - an area no chunk addresses is a missing clause (its missing_risk),
+#   - the overall compliance score is the mean of the area scores.
+# This module has no I/O; the LLM calls live in the router.
+
+import os
+import re
+from typing import Dict, Iterable, List, Literal, NamedTuple, Optional
+
+from pydantic import BaseModel
+
+from compliance_results import RISK_LEVELS, AreaRow, ComplianceResult, RiskLevel
+
+CONTRACT_CHUNK_CHARS = int(os.getenv("CONTRACT_CHUNK_CHARS", "24000"))
+CONTRACT_CHUNK_CONCURRENCY = int(os.getenv("CONTRACT_CHUNK_CONCURRENCY", "8"))
+CHUNK_MAX_TOKENS = 800  # per-chunk JSON findings
+
+# -----------------------------------------------------------------------------
+# Compliance areas
+# -----------------------------------------------------------------------------
+class ComplianceArea(NamedTuple):
+    name: str
+    label: str  # as shown in the report
+    far_files: List[str]  # keys of the FAR corpus (regulatory_cache)
+    pattern: re.Pattern  # wording that makes a chunk relevant to the area
+    missing_risk: str  # risk when no part of the contract addresses the area
+
+
+def _words(pattern: str) -> re.Pattern:
+    return re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE)
+
+
+COMPLIANCE_AREAS = [
+    ComplianceArea(
+        "Pricing & Payment Terms",
+        "Pricing & Payment Terms (FAR 52.232-25)",
+        ["part_52/52.232-25.dita"],
+        _words(r"pay(?:s|ment|ments|able)?|paid|pric(?:e|es|ing)|invoic\w*|fees?|"
+               r"compensation|billing|interest|remit\w*|net \d+"),
+        "High",
+    ),
+    ComplianceArea(
+        "Subcontracting Restrictions",
+        "Subcontracting Restrictions (FAR 52.244-2)",
+        ["part_52/52.244-2.dita"],
+        _words(r"sub-?contract\w*|assign\w*|delegat\w*|third[- ]part(?:y|ies)|outsourc\w*"),
+        "Medium",
+    ),
+    ComplianceArea(
+        "Penalties for Non-Performance",
+        "Penalties for Non-Performance (FAR 52.249-8, 52.249-9, 52.249-10)",
+        ["part_52/52.249-8.dita", "part_52/52.249-9.dita", "part_52/52.249-10.dita"],
+        _words(r"default\w*|terminat\w*|penalt\w*|liquidated damages|breach\w*|cure|"
+               r"non-?performance|service levels?|sla"),
+        "High",
+    ),
+    ComplianceArea(
+        "Vendor Eligibility & Registration",
+        "Vendor Eligibility & Registration (FAR 9.103, 52.209-5; SAM.gov)",
+        ["part_9/9.103.dita", "part_52/52.209-5.dita"],
+        _words(r"sam(?:\.gov)?|registration|registered|eligib\w*|debar\w*|suspen\w*|"
+               r"responsib\w*|certif\w*|licen[cs]\w*"),
+        "High",
+    ),
+    ComplianceArea(
+        "Conflict of Interest & Undisclosed Relationships",
+        "Conflict of Interest & Undisclosed Relationships (FAR 3.101-1, 9.505)",
+        ["part_3/3.101-1.dita", "part_9/9.505.dita"],
+        _words(r"conflicts? of interest|gratuit\w*|impartial\w*|disclos\w*|affiliat\w*|"
+               r"related part(?:y|ies)|kickbacks?|ethic\w*"),
+        "Medium",
+    ),
+]
+
+AREA_SCORES = {"Low": 100, "Medium": 60, "High": 20}
+
+
+def relevant_areas(text: str) -> List[ComplianceArea]:
+    return [area for area in COMPLIANCE_AREAS if area.pattern.search(text)]
+
+
+def chunk_areas(chunks: List["Chunk"]) -> List[List[ComplianceArea]]:
+    """
+    The areas to ask about per chunk: those its wording touches, plus the
+    areas no chunk touches, so that every area is assessed somewhere.
+    """
+    per_chunk = [relevant_areas(chunk.text) for chunk in chunks]
+    touched = {area.name for areas in per_chunk for area in areas}
+    untouched = [area for area in COMPLIANCE_AREAS if area.name not in touched]
+    return [
+        [area for area in COMPLIANCE_AREAS if area in areas or area in untouched]
+        for areas in per_chunk
+    ]
+
+
+# -----------------------------------------------------------------------------
+# Splitting
+# -----------------------------------------------------------------------------
+class Section(NamedTuple):
+    heading: str  # '' for text before the first heading
+    text: str  # including the heading line
+
+
+class Chunk(NamedTuple):
+    headings: List[str]  # of the sections it contains, in order
+    text: str
+
+    @property
+    def label(self) -> str:
+        """How the report refers to the chunk."""
+        headings = [heading for heading in self.headings if heading]
+        if not headings:
+            return "Preamble"
+        if len(headings) == 1:
+            return headings[0]
+        return f"{headings[0]} … {headings[-1]}"
+
+
+NUMBERED_HEADING = re.compile(
+    r"^(?:(?i:section|article|clause|part|schedule|annex|appendix|exhibit)\s+[\w.-]+"
+    r"|\d+(?:\.\d+)*[.)]?\s+\S"
+    r"|[IVXLC]+[.)]\s+\S)"  # Roman numerals, upper case only
+)
+HEADING_MAX_CHARS = 100
+
+
+def is_heading(line: str) -> bool:
+    """Numbered or keyword headings, ALL-CAPS lines and short title lines."""
+    line = line.strip()
+    if not line or len(line) > HEADING_MAX_CHARS:
+        return False
+    if NUMBERED_HEADING.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return True
+    # "Payment Terms", "Phase 1: Client Segmentation" — not sentences
+    return (
+        line[0].isupper()
+        and len(line.split()) <= 8
+        and line[-1] not in ".,;!?"
+    )
+
+
+def split_sections(text: str) -> List[Section]:
+    sections = []
+    heading, lines = "", []
+    for line in text.splitlines():
+        if is_heading(line) and any(l.strip() for l in lines):
+            sections.append(Section(heading, "\n".join(lines)))
+            heading, lines = "", []
+        if not lines and is_heading(line):
+            heading = line.strip()
+        lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append(Section(heading, "\n".join(lines)))
+    return sections
+
+
+def _split_long_section(section: Section, max_chars: int) -> Iterable[Section]:
+    """Pieces of at most max_chars, cut at line breaks where possible."""
+    text = section.text
+    while len(text) > max_chars:
+        cut = text.rfind("\n", 0, max_chars)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        yield Section(section.heading, text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text.strip():
+        yield Section(section.heading, text)
+
+
+def chunk_contract(text: str, max_chars: int = CONTRACT_CHUNK_CHARS) -> List[Chunk]:
+    """Whole sections packed into chunks of at most max_chars, in order."""
+    chunks = []
+    headings, parts, size = [], [], 0
+    for section in split_sections(text):
+        for piece in _split_long_section(section, max_chars):
+            if parts and size + len(piece.text) + 1 > max_chars:
+                chunks.append(Chunk(headings, "\n".join(parts)))
+                headings, parts, size = [], [], 0
+            if not headings or headings[-1] != piece.heading:
+                headings.append(piece.heading)
+            parts.append(piece.text)
+            size += len(piece.text) + 1
+    if parts:
+        chunks.append(Chunk(headings, "\n".join(parts)))
+    return chunks
+
+
+# -----------------------------------------------------------------------------
+# Per-chunk findings
+# -----------------------------------------------------------------------------
+class AreaFinding(NamedTuple):
+    area: str  # ComplianceArea.name
+    risk_level: str  # one of RISK_LEVELS
+    issues: List[str]
+    section: str  # Chunk.label
+
+
+# The schema of a chunk answer (sent as response_format, see compliance_results)
+AreaName = Literal[tuple(area.name for area in COMPLIANCE_AREAS)]
+
+
+class AreaAssessment(BaseModel):
+    area: AreaName
+    addressed: bool  # the excerpt contains a clause for the area
+    risk_level: Optional[RiskLevel]  # null when not addressed
+    issues: List[str]
+
+
+class ChunkAssessment(BaseModel):
+    areas: List[AreaAssessment]
+
+
+def chunk_findings(
+    assessment: ChunkAssessment, chunk: Chunk, areas: List[ComplianceArea]
+) -> List[AreaFinding]:
+    """
+    Findings from one chunk answer. Areas the chunk does not address and
+    areas it was not asked about are dropped.
+    """
+    asked = {area.name for area in areas}
+    return [
+        AreaFinding(
+            entry.area,
+            entry.risk_level,
+            [issue.strip() for issue in entry.issues if issue.strip()],
+            chunk.label,
+        )
+        for entry in assessment.areas
+        if entry.addressed and entry.risk_level and entry.area in asked
+    ]
+
+
+# -----------------------------------------------------------------------------
+# Merge
+# -----------------------------------------------------------------------------
+class AreaResult(NamedTuple):
+    area: ComplianceArea
+    risk_level: str
+    issues: List[str]
+    sections: List[str]  # where the area is addressed; empty if missing
+
+
+class ContractAnalysis(NamedTuple):
+    areas: List[AreaResult]
+    score: Optional[int]  # overall compliance score, 0-100, higher is better; None on error
+    report: str  # markdown, as stored in the documents table
+
+    def compliance_result(self) -> ComplianceResult:
+        return ComplianceResult(self.score, [
+            AreaRow(result.area.name, result.risk_level, bool(result.sections), result.issues)
+            for result in self.areas
+        ])
+
+
+def merge_findings(findings: Iterable[AreaFinding]) -> List[AreaResult]:
+    by_area: Dict[str, List[AreaFinding]] = {area.name: [] for area in COMPLIANCE_AREAS}
+    for finding in findings:
+        by_area[finding.area].append(finding)
+
+    results = []
+    for area in COMPLIANCE_AREAS:
+        area_findings = by_area[area.name]
+        if not area_findings:
+            results.append(AreaResult(
+                area,
+                area.missing_risk,
+                ["No clause addressing this area was found in the contract."],
+                [],
+            ))
+            continue
+        risk_level = max(
+            (finding.risk_level for finding in area_findings), key=RISK_LEVELS.index
+        )
+        # Issues of the findings at the area's risk level first
+        ordered = sorted(area_findings, key=lambda f: f.risk_level != risk_level)
+        issues = list(dict.fromkeys(issue for f in ordered for issue in f.issues))
+        sections = list(dict.fromkeys(f.section for f in area_findings))
+        results.append(AreaResult(area, risk_level, issues, sections))
+    return results
+
+
+def compliance_score(results: List[AreaResult]) -> int:
+    return round(sum(AREA_SCORES[r.risk_level] for r in results) / len(results))
+
+
+SECTION_LIST_LIMIT = 30
+
+
+def render_report(chunks: List[Chunk], results: List[AreaResult], score: int) -> str:
+    lines = ["### Contract Compliance Analysis", "", "#### Key Sections of the Contract"]
+    headings = [h for chunk in chunks for h in chunk.headings if h]
+    for number, heading in enumerate(headings[:SECTION_LIST_LIMIT], 1):
+        lines.append(f"{number}. {heading}")
+    if len(headings) > SECTION_LIST_LIMIT:
+        lines.append(f"... and {len(headings) - SECTION_LIST_LIMIT} more")
+    if not headings:
+        lines.append("No section headings were detected.")
+
+    lines += ["", "#### Compliance Areas Analysis", ""]
+    for number, result in enumerate(results, 1):
+        lines.append(f"{number}. **{result.area.label}**")
+        lines.append(f"   - **Risk Level**: {result.risk_level}")
+        if result.sections:
+            lines.append(f"   - **Addressed in**: {'; '.join(result.sections)}")
+        for issue in result.issues:
+            lines.append(f"   - **Issue**: {issue}")
+        lines.append("")
+
+    lines += [f"#### Overall Compliance Score: {score}%", "", "#### Summary of Issues"]
+    for result in results:
+        summary = result.issues[0] if result.issues else "No issues found."
+        lines.append(f"- **{result.area.name}**: {result.risk_level} risk. {summary}")
+    return "\n".join(lines)
+
+
+def reduce_contract(chunks: List[Chunk], findings: Iterable[AreaFinding]) -> ContractAnalysis:
+    results = merge_findings(findings)
+    score = compliance_score(results)
+    return ContractAnalysis(results, score, render_report(chunks, results, score))
@@ -1,9 +1,30 @@
+import os
 import sqlite3
+import threading
 from datetime import datetime
 from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple, Union
+
+from report_store import CREATE_REPORTS_TABLE, CompressedReport, read_report, save_report
+from findings import (
+    CREATE_FINDINGS_INDEXES, CREATE_FINDINGS_TABLE, report_finding_rows, save_findings
+)
+from invoice_history import (
+    CREATE_HISTORY_INDEXES, CREATE_HISTORY_TABLE, rebuild_invoice_history
+)
+from metrics import timed
+from compliance_results import (
+    ADD_COMPLIANCE_SCORE_COLUMN, CREATE_COMPLIANCE_INDEXES, CREATE_CONTRACT_AREAS_TABLE,
+    CREATE_FAILED_TEST_CASES_TABLE, ComplianceResult, save_compliance_result
+)
 
 DATABASE_URL = "documents.db"
 
+# Connection tuning. Negative cache_size is in KiB.
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
 def init_db():
     with get_db() as db:
         db.execute('''
@@ -25,11 +46,27 @@ def init_db():
             upload_date TIMESTAMP NOT NULL,
             status TEXT NOT NULL,
             risk_level TEXT,
-            report_data TEXT,  -- This will store the complete analysis response
+            report_data TEXT,  -- Legacy; reports live in the reports table (report_store.py)
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
         ''')
 
+        # Pending background analyses; the row (and the uploaded file) is
+        # deleted once the document is processed or failed. See jobs.py.
+        db.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            document_id INTEGER PRIMARY KEY,
+            document_type TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (document_id) REFERENCES documents (id)
+        )
+        ''')
+
+        migrate(db)
+
         # Insert default users
         users = [
             ('admin', 'adminpass123', 'Admin User', 'admin@example.com'),
@@ -49,12 +86,247 @@ def init_db():
                 # Skip if user already exists
                 pass
 
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(DATABASE_URL)
+# -----------------------------------------------------------------------------
+# Migrations
+#
+# Schema changes after the base tables above. Each entry runs once, in order,
+# as its own transaction (statements may be SQL strings or callables taking
+# the connection); the applied version is kept in PRAGMA user_version.
+# Append new migrations, never edit shipped ones.
+# -----------------------------------------------------------------------------
+def move_reports_out_of_documents(db) -> None:
+    """Compress existing report_data into the reports table (migration 2)."""
+    db.execute(CREATE_REPORTS_TABLE)
+    rows = db.execute(
+        "SELECT id, report_data FROM documents WHERE report_data IS NOT NULL"
+    )
+    moved = 0
+    while True:
+        batch = rows.fetchmany(500)
+        if not batch:
+            break
+        for document_id, report_data in batch:
+            save_report(db, document_id, report_data)
+        moved += len(batch)
+    db.execute("UPDATE documents SET report_data = NULL WHERE report_data IS NOT NULL")
+    print(f"Moved {moved} report(s) into the reports table")
+
+def backfill_invoice_findings(db) -> None:
+    """Index the stored CSV invoice reports into invoice_findings (migration 3)."""
+    documents = db.execute('''
+    SELECT d.id, d.user_id, r.data FROM documents d
+    JOIN reports r ON r.document_id = d.id
+    WHERE d.document_type = 'invoice'
+    ''')
+    indexed = skipped = 0
+    while True:
+        batch = documents.fetchmany(100)
+        if not batch:
+            break
+        for document_id, user_id, data in batch:
+            try:
+                rows = list(report_finding_rows(read_report(data)))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            save_findings(db, document_id, user_id, rows)
+            indexed += 1
+    print(f"Indexed findings of {indexed} invoice report(s), skipped {skipped}")
+
+def index_invoice_history(db) -> None:
+    """Fill invoice_history from the stored CSV invoice reports (migration 4)."""
+    print(f"Indexed {rebuild_invoice_history(db)} invoice(s) for duplicate detection")
+
+MIGRATIONS = [
+    (1, "Index documents for the per-user and admin listings", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_documents_user_upload
+        ON documents (user_id, upload_date)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_documents_upload
+        ON documents (upload_date)
+        ''',
+    ]),
+    (2, "Store reports as compressed blobs outside the documents table", [
+        move_reports_out_of_documents,
+    ]),
+    (3, "Normalized per-invoice findings of the CSV analysis", [
+        CREATE_FINDINGS_TABLE,
+        *CREATE_FINDINGS_INDEXES,
+        backfill_invoice_findings,
+    ]),
+    (4, "Cross-upload duplicate index of CSV invoices", [
+        CREATE_HISTORY_TABLE,
+        *CREATE_HISTORY_INDEXES,
+        index_invoice_history,
+    ]),
+    (5, "Typed results of the contract and test-case analyses", [
+        ADD_COMPLIANCE_SCORE_COLUMN,
+        CREATE_CONTRACT_AREAS_TABLE,
+        CREATE_FAILED_TEST_CASES_TABLE,
+        *CREATE_COMPLIANCE_INDEXES,
+    ]),
+]
+
+def schema_version(db) -> int:
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db) -> int:
+    """Apply pending migrations and return the resulting schema version."""
+    version = schema_version(db)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        # sqlite3 does not open a transaction for DDL by itself
+        if not db.in_transaction:
+            db.execute("BEGIN")
+        for statement in statements:
+            if callable(statement):
+                statement(db)
+            else:
+                db.execute(statement)
+        # PRAGMA takes no parameters; target comes from MIGRATIONS
+        db.execute(f"PRAGMA user_version = {int(target)}")
+        db.commit()
+        version = target
+        print(f"Applied migration {target}: {description}")
+    return version
+
+@timed("db_insert")
+def insert_document(
+    user_id: int,
+    document_name: str,
+    document_type: str,
+    risk_level: str,
+    report_data: Union[str, CompressedReport],
+    status: str = 'processed',
+    compliance: Optional[ComplianceResult] = None,
+) -> int:
+    """Store an analysed document, its (compressed) report and its typed
+    compliance results and return its id. Blocking; async callers go through
+    executors.run_io."""
+    with get_db() as db:
+        cursor = db.execute('''
+        INSERT INTO documents (
+            user_id,
+            document_name,
+            document_type,
+            upload_date,
+            status,
+            risk_level
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            document_name,
+            document_type,
+            datetime.utcnow().isoformat(),
+            status,
+            risk_level
+        ))
+        save_report(db, cursor.lastrowid, report_data)
+        if compliance is not None:
+            save_compliance_result(db, cursor.lastrowid, compliance)
+        return cursor.lastrowid
+
+@timed("db_insert_batch")
+def insert_documents(
+    user_id: int,
+    document_type: str,
+    documents: Iterable[Tuple[str, str, Optional[str], str, Optional[ComplianceResult]]],
+) -> List[int]:
+    """Store several analysed documents, given as (document_name, status,
+    risk_level, report_data, compliance), in one transaction and return
+    their ids in order. Blocking."""
+    with get_db():  # the insert_document blocks below join this transaction
+        return [
+            insert_document(
+                user_id, document_name, document_type, risk_level, report_data,
+                status=status, compliance=compliance,
+            )
+            for document_name, status, risk_level, report_data, compliance in documents
+        ]
+
+# -----------------------------------------------------------------------------
+# Connections
+#
+# Each thread keeps one read-write and one read-only connection per database
+# file and reuses them for every get_db() call (check_same_thread is off only
+# so close_connections() can close them at shutdown). The database runs in WAL mode,
+# so readers never wait for a writer and writers only queue behind each other.
+# -----------------------------------------------------------------------------
+_local = threading.local()
+_connections_lock = threading.Lock()
+_connections = []  # every open connection, for close_connections()
+_generation = 0  # bumped by close_connections() so threads reconnect
+
+
+def connect(path: str, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+        )
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn = sqlite3.connect(
+            path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        # Persistent: only needs to succeed once per database file
+        conn.execute("PRAGMA journal_mode=WAL")
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def thread_connection(readonly: bool = False) -> sqlite3.Connection:
+    pool = getattr(_local, "connections", None)
+    if pool is None or _local.generation != _generation:
+        pool = _local.connections = {}
+        _local.generation = _generation
+    key = (DATABASE_URL, readonly)
+    if key not in pool:
+        pool[key] = connect(DATABASE_URL, readonly)
+        with _connections_lock:
+            _connections.append(pool[key])
+    return pool[key]
+
+
+def close_connections() -> None:
+    """Close every pooled connection (at shutdown, after the I/O pool)."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
+
+@contextmanager
+def get_db(readonly: bool = False):
+    """
+    Yield this thread's pooled connection. The transaction is committed when
+    the block succeeds and rolled back if it raises; nested blocks join the
+    outer transaction. readonly=True uses a query_only connection for pure
+    reads.
+    """
+    conn = thread_connection(readonly)
+    depths = getattr(_local, "depths", None)
+    if depths is None:
+        depths = _local.depths = {}
+    depth = depths.get(conn, 0)
+    depths[conn] = depth + 1
     try:
         yield conn
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        raise
+    else:
+        if depth == 0:
+            conn.commit()
     finally:
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        depths[conn] = depth
@@ -0,0 +1,79 @@
+# executors.py
+#
+# Concurrency model for the API process.
+#
+# Endpoints are async and must never block the event loop:
+#   - CPU-bound work (PDF text layers, OCR, CSV scoring) runs in a process
+#     pool (spawn context; the functions submitted must be module-level so
+#     they can be pickled),
+#   - blocking I/O (sqlite3, Excel reads, cache lookups) runs in a bounded
+#     thread pool,
+#   - OpenAI calls use the async client, through llm_gateway.py (rate limits,
+#     bounded concurrency, retries).
+
+import os
+import asyncio
+import functools
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# OCR_WORKERS is still honoured for deployments that set it before the pools
+# were shared.
+CPU_WORKERS = int(
+    os.getenv("CPU_WORKERS", os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+)
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # spawn, not fork: the API process is multi-threaded.
+        _process_pool = ProcessPoolExecutor(
+            max_workers=CPU_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    return _io_pool
+
+
+async def run_cpu(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a picklable, module-level function in the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_process_pool(), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_io(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking function in the bounded I/O thread pool, in a copy of
+    the caller's context (like asyncio.to_thread), so the request's trace
+    (metrics.py) follows it."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_io_pool(), functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def shutdown_executors() -> None:
+    global _process_pool, _io_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _io_pool is not None:
+        _io_pool.shutdown(cancel_futures=True)
+        _io_pool = None
@@ -0,0 +1,133 @@
+# extraction.py
+#
+# Shared document text extraction for the contract and invoice routers.
+#
+# PDFs are read through the PyMuPDF text layer first, page by page. Only pages
+# without usable text (scans, image-only pages) are sent to Tesseract through
+# the OCR pool, so born-digital documents never pay for OCR.
+#
+# Results are cached by the SHA-256 of the document bytes, so re-uploading
+# the same file skips extraction entirely.
+#
+# The functions here block; async callers run them through executors.run_io.
+# The parsing itself is handed to the process pool, so a large document never
+# holds the GIL of the API process.
+
+import io
+import os
+import json
+import hashlib
+import logging
+from typing import Callable, List, Optional
+
+import fitz  # PyMuPDF
+from docx import Document
+from pydantic import BaseModel
+
+from cache_store import SQLiteCache
+from executors import get_process_pool
+from metrics import stage
+from ocr import OCR_BACKEND, OCR_DPI, OCR_GRAYSCALE, ocr_pdf_bytes
+
+# A page needs OCR when its text layer has fewer non-whitespace characters.
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))
+
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "extraction_cache.db")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+
+extraction_cache = SQLiteCache(
+    EXTRACTION_CACHE_PATH, max_bytes=EXTRACTION_CACHE_MAX_MB * 1024 * 1024
+)
+
+
+class ExtractionResult(BaseModel):
+    pages: List[str]
+    ocr_pages: List[int] = []  # 1-based numbers of the pages that were OCR'd
+    ocr_error: Optional[str] = None  # set when the OCR fallback failed
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.pages)
+
+
+def needs_ocr(page_text: str) -> bool:
+    return len("".join(page_text.split())) < PDF_MIN_TEXT_CHARS
+
+
+def cached_extraction(
+    kind: str, file_bytes: bytes, extractor: Callable[[bytes], ExtractionResult]
+) -> ExtractionResult:
+    """
+    Look the document up by content hash (plus the settings that affect the
+    output) before running `extractor`. Results with a failed OCR fallback are
+    not cached, so a later upload gets another try.
+    """
+    settings = f"{PDF_MIN_TEXT_CHARS}-{OCR_DPI}-{int(OCR_GRAYSCALE)}" if kind == "pdf" else ""
+    if settings and OCR_BACKEND == "fixtures":
+        settings += "-fixtures"  # never mixed with real OCR output
+    key = f"{kind}:{settings}:{hashlib.sha256(file_bytes).hexdigest()}"
+
+    with stage("extraction_cache"):
+        cached = extraction_cache.get(key)
+    if cached is not None:
+        return ExtractionResult(**json.loads(cached))
+
+    result = extractor(file_bytes)
+    if result.ocr_error is None:
+        extraction_cache.set(key, json.dumps(result.dict()).encode("utf-8"))
+    return result
+
+
+def read_pdf_pages(file_bytes: bytes) -> List[str]:
+    """Text layer of every page. Runs in a worker process."""
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        return [page.get_text("text") for page in doc]
+
+
+def read_docx_text(file_bytes: bytes) -> str:
+    """Paragraph text of a DOCX file. Runs in a worker process."""
+    doc = Document(io.BytesIO(file_bytes))
+    return "\n".join(para.text for para in doc.paragraphs)
+
+
+def read_pdf(file_bytes: bytes) -> ExtractionResult:
+    """
+    Extract text from a PDF, using the text layer where it exists and OCR for
+    the remaining pages. If OCR is unavailable, those pages keep whatever the
+    text layer had.
+    """
+    with stage("pdf_text_layer", nbytes=len(file_bytes)):
+        pages = get_process_pool().submit(read_pdf_pages, file_bytes).result()
+
+    ocr_pages = [number for number, text in enumerate(pages, 1) if needs_ocr(text)]
+    ocr_error = None
+    if ocr_pages:
+        try:
+            with stage("ocr", nbytes=len(file_bytes)):
+                for number, text in zip(ocr_pages, ocr_pdf_bytes(file_bytes, pages=ocr_pages)):
+                    pages[number - 1] = text
+        except Exception as e:
+            logging.error("OCR fallback failed for pages %s: %s", ocr_pages, e)
+            ocr_pages, ocr_error = [], str(e)
+
+    logging.info(
+        "Extracted %d page(s), %d via OCR %s.", len(pages), len(ocr_pages), ocr_pages
+    )
+    return ExtractionResult(pages=pages, ocr_pages=ocr_pages, ocr_error=ocr_error)
+
+
+def read_docx(file_bytes: bytes) -> ExtractionResult:
+    """
+    Extract paragraph text from a DOCX file (a single logical page).
+    """
+    with stage("docx_text", nbytes=len(file_bytes)):
+        text = get_process_pool().submit(read_docx_text, file_bytes).result()
+    return ExtractionResult(pages=[text])
+
+
+def extract_pdf(file_bytes: bytes) -> ExtractionResult:
+    return cached_extraction("pdf", file_bytes, read_pdf)
+
+
+def extract_docx(file_bytes: bytes) -> ExtractionResult:
+    return cached_extraction("docx", file_bytes, read_docx)
@@ -0,0 +1,161 @@
+# fake_llm.py
+#
+# Local stand-in for the OpenAI chat completions API, selected with
+# LLM_BACKEND=fake (see llm_gateway.py). Used for benchmarks and offline
+# development: nothing leaves the process and every call costs a
+# configurable latency instead of money.
+#
+#   latency = FAKE_LLM_LATENCY_S + uniform(0, FAKE_LLM_JITTER_S)
+#             + prompt tokens / FAKE_LLM_PREFILL_TPS  (0: not prompt-dependent)
+#
+# Answers constrained by a JSON schema (response_format json_schema) are the
+# simplest document valid against it, with arrays filled from the prompt so
+# the callers' result paths are exercised:
+#   - items with a test_case_id: FAKE_LLM_FAILED_TEST_CASES of the test case
+#     IDs in the prompt (chosen per prompt, so repeat calls agree),
+#   - items with an enum property: one per enum value the prompt mentions
+#     (e.g. one entry per compliance area asked about),
+#   - otherwise one item.
+# Other calls get a fixed text. Token usage is estimated at ~4 characters per
+# token.
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import List, Optional
+
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+FAKE_LLM_LATENCY_S = float(os.getenv("FAKE_LLM_LATENCY_S", "0.5"))
+FAKE_LLM_JITTER_S = float(os.getenv("FAKE_LLM_JITTER_S", "0.2"))
+FAKE_LLM_PREFILL_TPS = float(os.getenv("FAKE_LLM_PREFILL_TPS", "5000"))
+FAKE_LLM_FAILED_TEST_CASES = int(os.getenv("FAKE_LLM_FAILED_TEST_CASES", "3"))
+FAKE_LLM_TEXT = "No compliance issues found. (Fake LLM answer.)"
+
+TEST_CASE_ID = re.compile(r"\b[A-Z]{2,}-\d+\b")  # TC-001, as in the Excel catalogs
+
+
+def _resolve(schema: dict, defs: dict) -> dict:
+    while "$ref" in schema:
+        schema = defs[schema["$ref"].split("/")[-1]]
+    return schema
+
+
+def failed_test_case_ids(prompt: str) -> List[str]:
+    """FAKE_LLM_FAILED_TEST_CASES of the prompt's test case IDs, in prompt order."""
+    ids = list(dict.fromkeys(TEST_CASE_ID.findall(prompt)))
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+    chosen = set(rng.sample(ids, min(FAKE_LLM_FAILED_TEST_CASES, len(ids))))
+    return [test_case_id for test_case_id in ids if test_case_id in chosen]
+
+
+def fake_array(items: dict, defs: dict, prompt: str) -> list:
+    items = _resolve(items, defs)
+    item = fake_json(items, defs, prompt)
+    properties = items.get("properties", {})
+    if "test_case_id" in properties:
+        return [{**item, "test_case_id": test_case_id} for test_case_id in failed_test_case_ids(prompt)]
+    for name, prop in properties.items():
+        values = [value for value in _resolve(prop, defs).get("enum", []) if value in prompt]
+        if values:
+            return [{**item, name: value} for value in values]
+    return [item]
+
+
+def fake_json(schema: dict, defs: dict, prompt: str = "") -> object:
+    """Simplest value valid against a (strict-mode) JSON schema; arrays are
+    filled from the prompt (see fake_array)."""
+    schema = _resolve(schema, defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    if "anyOf" in schema:
+        variants = [s for s in schema["anyOf"] if s.get("type") != "null"] or schema["anyOf"]
+        return fake_json(variants[0], defs, prompt)
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        return {name: fake_json(prop, defs, prompt) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return fake_array(schema.get("items", {}), defs, prompt)
+    if kind == "string":
+        return "fake"
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return True
+    return None
+
+
+def fake_content(response_format: Optional[dict], prompt: str = "") -> str:
+    if response_format and response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+        return json.dumps(fake_json(schema, schema.get("$defs", {}), prompt))
+    if response_format and response_format.get("type") == "json_object":
+        return "{}"
+    return FAKE_LLM_TEXT
+
+
+class _Completions:
+    def __init__(self, client: "FakeLLMClient"):
+        self._client = client
+
+    async def create(self, model: str, messages: list, response_format=None, **kwargs) -> ChatCompletion:
+        client = self._client
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        prompt_tokens = len(prompt) // 4
+        seconds = client.latency_s + client.rng.uniform(0, client.jitter_s)
+        if client.prefill_tps > 0:
+            seconds += prompt_tokens / client.prefill_tps
+        await asyncio.sleep(seconds)
+
+        content = fake_content(response_format, prompt)
+        completion_tokens = len(content) // 4
+        client.calls += 1
+        return ChatCompletion(
+            id="fake-" + hashlib.sha256(f"{client.calls}:{model}".encode()).hexdigest()[:24],
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[Choice(
+                index=0,
+                finish_reason="stop",
+                message=ChatCompletionMessage(role="assistant", content=content),
+            )],
+            usage=CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+class _Chat:
+    def __init__(self, client: "FakeLLMClient"):
+        self.completions = _Completions(client)
+
+
+class FakeLLMClient:
+    """Exposes client.chat.completions.create like AsyncOpenAI."""
+
+    def __init__(
+        self,
+        latency_s: float = FAKE_LLM_LATENCY_S,
+        jitter_s: float = FAKE_LLM_JITTER_S,
+        prefill_tps: float = FAKE_LLM_PREFILL_TPS,
+        seed: int = 0,
+    ):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.prefill_tps = prefill_tps
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.chat = _Chat(self)
@@ -0,0 +1,103 @@
+# findings.py
+#
+# Normalized per-invoice results of the CSV fraud analysis.
+#
+# Every analysed invoice is also written to `invoice_findings`, one row per
+# (invoice, issue), or a single row with NULL issue columns for an invoice
+# without issues. Cross-upload questions ("all Fraud Detected invoices of
+# vendor X this quarter") then become index range scans instead of parsing
+# every stored report. Rows are written with one executemany in the same
+# transaction as their document.
+#
+# Like report_store.py this never imports database.py, so the migration that
+# creates the table can backfill it with these helpers.
+
+import json
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+CREATE_FINDINGS_TABLE = '''
+CREATE TABLE IF NOT EXISTS invoice_findings (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    invoice_id TEXT NOT NULL,
+    vendor TEXT NOT NULL COLLATE NOCASE,
+    invoice_date TEXT NOT NULL,             -- as in the CSV; '' when missing
+    amount REAL,
+    risk_score INTEGER NOT NULL,
+    risk_level TEXT NOT NULL COLLATE NOCASE,  -- 'Fraud Detected', 'Suspicious', 'Safe'
+    issue TEXT,                             -- NULL for invoices without issues
+    severity TEXT,
+    risk_increase INTEGER,
+    FOREIGN KEY (document_id) REFERENCES documents (id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+)
+'''
+
+# Every listing orders by (invoice_date, id), so each index ends in
+# invoice_date (and implicitly the rowid) to serve both the filter and the order.
+CREATE_FINDINGS_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_findings_vendor
+    ON invoice_findings (vendor, invoice_date)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_findings_user_risk
+    ON invoice_findings (user_id, risk_level, invoice_date)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_findings_risk
+    ON invoice_findings (risk_level, invoice_date)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_findings_user_date
+    ON invoice_findings (user_id, invoice_date)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_findings_date
+    ON invoice_findings (invoice_date)
+    ''',
+]
+
+# Columns of a row as produced by finding_rows, i.e. without the owner
+FindingRow = Tuple[str, str, str, Optional[float], int, str, Optional[str], Optional[str], Optional[int]]
+
+
+def risk_label(risk_level: str) -> str:
+    """'Fraud Detected 🔴' -> 'Fraud Detected' (report levels end in an emoji)."""
+    return risk_level.rsplit(" ", 1)[0]
+
+
+def finding_rows(invoice: dict, report: dict) -> List[FindingRow]:
+    """Rows for one invoice, from its parsed invoice and report dicts."""
+    head = (
+        report["invoice_id"],
+        invoice.get("vendor") or "",
+        invoice.get("invoice_date") or "",
+        invoice.get("amount"),
+        report["risk_score"],
+        risk_label(report["risk_level"]),
+    )
+    if not report["issues"]:
+        return [head + (None, None, None)]
+    return [
+        head + (issue["issue"], issue["severity"], issue["risk_increase"])
+        for issue in report["issues"]
+    ]
+
+
+def report_finding_rows(report_data: str) -> Iterator[FindingRow]:
+    """Rows for a stored invoice report ({"invoices": [...], "analysis": [...]})."""
+    report = json.loads(report_data)
+    for invoice, analysis in zip(report.get("invoices", []), report.get("analysis", [])):
+        yield from finding_rows(invoice, analysis)
+
+
+def save_findings(db, document_id: int, user_id: int, rows: Iterable[FindingRow]) -> None:
+    """Bulk insert a document's findings; rows may be a lazy iterator."""
+    db.executemany('''
+    INSERT INTO invoice_findings (
+        document_id, user_id, invoice_id, vendor, invoice_date, amount,
+        risk_score, risk_level, issue, severity, risk_increase
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', ((document_id, user_id) + tuple(row) for row in rows))
@@ -0,0 +1,141 @@
+# invoice_history.py
+#
+# Persistent duplicate index over every previously uploaded CSV invoice.
+#
+# DuplicateTracker (routers/Invoice.py) only compares the invoices of one
+# upload. `invoice_history` keeps the fields its rules look at for all earlier
+# uploads, so a new upload can be checked against the same user's history
+# (the issues quote prior invoice IDs and documents, and other accounts'
+# uploads must not raise a user's risk scores) with index seeks:
+#   - exact duplicates: same vendor, amount and date, looked up by exact_key,
+#   - fuzzy duplicates: same vendor, amount within FUZZY_AMOUNT_WINDOW and a
+#     description of compatible length (the length is the cheap signature
+#     that bounds fuzz.ratio), a range seek on (user_id, vendor_key, amount)
+#     after which only the few candidates are scored.
+# Rows are added in the same transaction as their document and can be rebuilt
+# from the stored reports with rebuild_invoice_history.
+#
+# Like findings.py this never imports database.py, so migrations can use it.
+
+import json
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from report_store import read_report
+
+CREATE_HISTORY_TABLE = '''
+CREATE TABLE IF NOT EXISTS invoice_history (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    invoice_id TEXT NOT NULL,
+    vendor_key TEXT NOT NULL,        -- lower-cased vendor
+    amount REAL,
+    invoice_date TEXT NOT NULL,      -- '' when missing
+    exact_key TEXT NOT NULL,         -- see exact_key()
+    description TEXT NOT NULL,       -- lower-cased
+    description_length INTEGER NOT NULL,
+    FOREIGN KEY (document_id) REFERENCES documents (id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+)
+'''
+
+CREATE_HISTORY_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_history_exact
+    ON invoice_history (user_id, exact_key)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_history_vendor_amount
+    ON invoice_history (user_id, vendor_key, amount)
+    ''',
+]
+
+# Prior invoices named per issue; lookups stop once they have this many.
+HISTORY_MATCH_LIMIT = 3
+
+# Columns of a row as produced by history_row, i.e. without the document
+HistoryRow = Tuple[str, str, Optional[float], str, str, str, int]
+
+
+def exact_key(vendor: str, amount: float, invoice_date: Optional[str]) -> str:
+    """Same vendor/amount/date key as DuplicateTracker."""
+    return f"{vendor.lower()}_{amount}_{invoice_date or ''}"
+
+
+def history_row(invoice: dict) -> HistoryRow:
+    """Index row for one parsed invoice dict (Invoice.dict() layout)."""
+    vendor = invoice.get("vendor") or ""
+    amount = invoice.get("amount")
+    invoice_date = invoice.get("invoice_date") or ""
+    description = (invoice.get("description") or "").lower()
+    return (
+        invoice["invoice_id"],
+        vendor.lower(),
+        amount,
+        invoice_date,
+        exact_key(vendor, amount, invoice_date),
+        description,
+        len(description),
+    )
+
+
+def save_history(db, document_id: int, user_id: int, rows: Iterable[HistoryRow]) -> None:
+    """Bulk insert a document's invoices; rows may be a lazy iterator."""
+    db.executemany('''
+    INSERT INTO invoice_history (
+        document_id, user_id, invoice_id, vendor_key, amount, invoice_date,
+        exact_key, description, description_length
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', ((document_id, user_id) + tuple(row) for row in rows))
+
+
+def exact_matches(db, user_id: int, key: str) -> List[Tuple[int, str]]:
+    """(document_id, invoice_id) of the user's earliest prior invoices with this key."""
+    return [tuple(row) for row in db.execute('''
+    SELECT document_id, invoice_id FROM invoice_history
+    WHERE user_id = ? AND exact_key = ?
+    ORDER BY id
+    LIMIT ?
+    ''', (user_id, key, HISTORY_MATCH_LIMIT))]
+
+
+def fuzzy_candidates(
+    db, user_id: int, vendor_key: str, amount: float, window: float, length: int
+) -> Iterator[Tuple[int, str, str, str]]:
+    """
+    The user's prior invoices of the vendor within +/-window of the amount whose
+    description length is close enough for fuzz.ratio to exceed 80 (it can't
+    when one string is over 1.5x the other). Yields (document_id, invoice_id,
+    exact_key, description); the caller scores them and stops early.
+    """
+    yield from db.execute('''
+    SELECT document_id, invoice_id, exact_key, description FROM invoice_history
+    WHERE user_id = ? AND vendor_key = ? AND amount BETWEEN ? AND ?
+    AND description_length BETWEEN ? AND ?
+    ORDER BY id
+    ''', (user_id, vendor_key, amount - window, amount + window, length * 2 // 3, length * 3 // 2 + 1))
+
+
+def rebuild_invoice_history(db) -> int:
+    """Re-index every stored CSV invoice report; returns the invoice count."""
+    db.execute("DELETE FROM invoice_history")
+    documents = db.execute('''
+    SELECT d.id, d.user_id, r.data FROM documents d
+    JOIN reports r ON r.document_id = d.id
+    WHERE d.document_type = 'invoice'
+    ORDER BY d.id
+    ''')
+    indexed = 0
+    while True:
+        batch = documents.fetchmany(100)
+        if not batch:
+            break
+        for document_id, user_id, data in batch:
+            try:
+                invoices = json.loads(read_report(data)).get("invoices", [])
+                rows = [history_row(invoice) for invoice in invoices]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            save_history(db, document_id, user_id, rows)
+            indexed += len(rows)
+    return indexed
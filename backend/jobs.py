@@ -0,0 +1,254 @@
+# jobs.py
+#
+# Persistent background queue for document analysis.
+#
+# A queued upload creates its `documents` row straight away (status 'queued')
+# plus a `jobs` row holding the file until it has been analysed. A fixed
+# number of worker tasks move each document through 'extracting' and
+# 'analyzing' to 'processed' or 'failed'; clients poll
+# /documents/document/{id}. Jobs left in flight by a restart are re-queued on
+# startup, so nothing is lost as long as its `jobs` row exists. A run that
+# fails outside its handler (e.g. a locked database) is retried with backoff
+# and finally marked 'failed', so a document never stays in flight.
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from database import get_db
+from executors import run_io
+from report_store import save_report
+from compliance_results import ComplianceResult, save_compliance_result
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A job that was interrupted this many times (e.g. it keeps crashing the
+# process) is failed instead of being retried again on restart.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A job whose bookkeeping failed (e.g. the database stayed locked past the
+# busy timeout) is re-queued after this delay, doubled per failure, up to
+# JOB_MAX_ATTEMPTS times in this process.
+JOB_RETRY_DELAY_S = float(os.getenv("JOB_RETRY_DELAY_S", "5"))
+
+# Handler for one document type: (file bytes, filename, set_status) ->
+# (risk_level, report_data, compliance result or None). set_status records
+# progress on the document.
+StatusCallback = Callable[[str], Awaitable[None]]
+JobHandler = Callable[
+    [bytes, str, StatusCallback],
+    Awaitable[Tuple[str, str, Optional[ComplianceResult]]],
+]
+
+IN_FLIGHT_STATUSES = ("queued", "extracting", "analyzing")
+
+
+async def ignore_status(status: str) -> None:
+    """StatusCallback for analyses that run inline in the request."""
+
+
+# -----------------------------------------------------------------------------
+# Storage (blocking; called through run_io)
+# -----------------------------------------------------------------------------
+def create_job(user_id: int, filename: str, document_type: str, payload: bytes) -> int:
+    """Create the queued document and its job in one transaction."""
+    now = datetime.utcnow().isoformat()
+    with get_db() as db:
+        cursor = db.execute('''
+        INSERT INTO documents (
+            user_id,
+            document_name,
+            document_type,
+            upload_date,
+            status
+        ) VALUES (?, ?, ?, ?, 'queued')
+        ''', (user_id, filename, document_type, now))
+        document_id = cursor.lastrowid
+        db.execute('''
+        INSERT INTO jobs (document_id, document_type, filename, payload, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (document_id, document_type, filename, payload, now))
+        return document_id
+
+
+def start_job(document_id: int):
+    """Count an attempt and return the job row (None if already finished)."""
+    with get_db() as db:
+        db.execute(
+            "UPDATE jobs SET attempts = attempts + 1 WHERE document_id = ?", (document_id,)
+        )
+        return db.execute(
+            "SELECT * FROM jobs WHERE document_id = ?", (document_id,)
+        ).fetchone()
+
+
+def set_document_status(document_id: int, status: str) -> None:
+    with get_db() as db:
+        db.execute(
+            "UPDATE documents SET status = ? WHERE id = ?", (status, document_id)
+        )
+
+
+def finish_job(
+    document_id: int,
+    status: str,
+    risk_level: Optional[str],
+    report_data: str,
+    compliance: Optional[ComplianceResult] = None,
+) -> None:
+    """Store the outcome and drop the job (and its payload) atomically."""
+    with get_db() as db:
+        db.execute(
+            "UPDATE documents SET status = ?, risk_level = ? WHERE id = ?",
+            (status, risk_level, document_id)
+        )
+        save_report(db, document_id, report_data)
+        if compliance is not None:
+            save_compliance_result(db, document_id, compliance)
+        db.execute("DELETE FROM jobs WHERE document_id = ?", (document_id,))
+
+
+def recover_jobs() -> List[int]:
+    """Reset jobs interrupted by a shutdown to 'queued' and return every
+    pending document id in upload order."""
+    placeholders = ", ".join("?" for _ in IN_FLIGHT_STATUSES)
+    with get_db() as db:
+        db.execute(f'''
+        UPDATE documents SET status = 'queued'
+        WHERE status IN ({placeholders})
+        AND id IN (SELECT document_id FROM jobs)
+        ''', IN_FLIGHT_STATUSES)
+        rows = db.execute(
+            "SELECT document_id FROM jobs ORDER BY document_id"
+        ).fetchall()
+    return [row["document_id"] for row in rows]
+
+
+# -----------------------------------------------------------------------------
+# Queue
+# -----------------------------------------------------------------------------
+class JobQueue:
+    """
+    In-process dispatcher over the `jobs` table. The table is the source of
+    truth; the asyncio queue only carries document ids to the workers.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._failures: Dict[int, int] = {}  # document id -> failed runs
+        self._retries: Dict[int, asyncio.TimerHandle] = {}  # pending re-queues
+
+    def register(self, document_type: str, handler: JobHandler) -> None:
+        self.handlers[document_type] = handler
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        pending = await run_io(recover_jobs)
+        for document_id in pending:
+            self._queue.put_nowait(document_id)
+        if pending:
+            logging.info("Re-queued %d pending job(s).", len(pending))
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        # Cancelled jobs keep their row and are picked up again on restart.
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(
+        self, user_id: int, filename: str, document_type: str, payload: bytes
+    ) -> int:
+        if document_type not in self.handlers:
+            raise ValueError(f"No job handler for {document_type!r}")
+        document_id = await run_io(create_job, user_id, filename, document_type, payload)
+        if self._queue is not None:
+            self._queue.put_nowait(document_id)
+        return document_id
+
+    async def _worker(self) -> None:
+        while True:
+            document_id = await self._queue.get()
+            try:
+                await self._run(document_id)
+            except Exception:
+                # E.g. a locked database in start_job/finish_job; the worker
+                # carries on with the next job either way.
+                logging.exception("Job %d could not be run.", document_id)
+                await self._retry_or_fail(document_id)
+            else:
+                self._failures.pop(document_id, None)
+            finally:
+                self._queue.task_done()
+
+    async def _retry_or_fail(self, document_id: int) -> None:
+        """Re-queue a job whose run raised, with backoff; after
+        JOB_MAX_ATTEMPTS failures mark it failed so pollers see an outcome."""
+        failures = self._failures.get(document_id, 0) + 1
+        if failures < JOB_MAX_ATTEMPTS:
+            self._failures[document_id] = failures
+            delay = JOB_RETRY_DELAY_S * 2 ** (failures - 1)
+            logging.warning("Retrying job %d in %.1fs.", document_id, delay)
+            self._retries[document_id] = asyncio.get_running_loop().call_later(
+                delay, self._requeue, document_id
+            )
+            return
+        self._failures.pop(document_id, None)
+        try:
+            await run_io(
+                finish_job, document_id, "failed", None,
+                f"Analysis failed: gave up after {failures} attempts."
+            )
+        except Exception:
+            # The job row is kept, so recover_jobs re-queues it on restart
+            logging.exception("Could not mark job %d as failed.", document_id)
+
+    def _requeue(self, document_id: int) -> None:
+        self._retries.pop(document_id, None)
+        self._queue.put_nowait(document_id)
+
+    async def _run(self, document_id: int) -> None:
+        job = await run_io(start_job, document_id)
+        if job is None:
+            return
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            await run_io(
+                finish_job, document_id, "failed", None,
+                f"Analysis failed: gave up after {JOB_MAX_ATTEMPTS} attempts."
+            )
+            return
+
+        async def set_status(status: str) -> None:
+            await run_io(set_document_status, document_id, status)
+
+        handler = self.handlers.get(job["document_type"])
+        try:
+            if handler is None:
+                raise ValueError(f"No job handler for {job['document_type']!r}")
+            risk_level, report_data, compliance = await handler(
+                job["payload"], job["filename"], set_status
+            )
+        except HTTPException as e:
+            logging.warning("Job %d failed: %s", document_id, e.detail)
+            await run_io(finish_job, document_id, "failed", None, str(e.detail))
+        except Exception as e:
+            logging.exception("Job %d failed.", document_id)
+            await run_io(finish_job, document_id, "failed", None, f"Analysis failed: {e}")
+        else:
+            await run_io(
+                finish_job, document_id, "processed", risk_level, report_data, compliance
+            )
+
+
+job_queue = JobQueue()
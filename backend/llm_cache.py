@@ -0,0 +1,144 @@
+# llm_cache.py
+#
+# Persistent, deterministic cache of chat completion responses.
+#
+# The key is a hash of everything that determines the answer (model, messages,
+# temperature, max_tokens), so repeat analyses of the same document against
+# the same prompt return from SQLite instead of calling OpenAI again.
+# Temperature-0 calls are always cached; sampled calls (temperature > 0) are
+# only cached when LLM_CACHE_ALL is enabled, since callers may expect a fresh
+# answer each time.
+
+import os
+import json
+import hashlib
+import logging
+from typing import Callable, List, Optional, Type
+
+from pydantic import ValidationError
+
+from cache_store import SQLiteCache
+from compliance_results import Model, json_schema_format, parse_structured
+from executors import run_io
+from llm_gateway import llm_gateway
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_ALL = os.getenv("LLM_CACHE_ALL", "false").lower() == "true"
+
+llm_cache = SQLiteCache(
+    LLM_CACHE_PATH,
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=LLM_CACHE_TTL_HOURS * 3600,
+)
+
+
+def llm_cache_key(
+    model: str,
+    messages: List[dict],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    response_format: Optional[dict] = None,
+) -> str:
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    # Only when set, so keys of plain-text calls stay as they were
+    if response_format is not None:
+        request["response_format"] = response_format
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def should_cache(temperature: Optional[float]) -> bool:
+    return LLM_CACHE_ALL or temperature == 0
+
+
+async def cached_chat_completion(
+    client,
+    model: str,
+    messages: List[dict],
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    response_format: Optional[dict] = None,
+    use_cache: Optional[bool] = None,
+    validate: Optional[Callable[[str], bool]] = None,
+    **kwargs,
+) -> str:
+    """
+    Call client.chat.completions.create (an AsyncOpenAI client) through the
+    LLM gateway and return the message content, serving it from the cache
+    when allowed. `use_cache` defaults to should_cache(temperature).
+    response_format (e.g. a JSON schema, see
+    compliance_results.json_schema_format) is part of the key; other extra
+    keyword arguments (e.g. store=True) are passed through but are not.
+    Errors are never cached; answers `validate` rejects are neither cached
+    nor served from the cache.
+    """
+    if use_cache is None:
+        use_cache = should_cache(temperature)
+
+    key = (
+        llm_cache_key(model, messages, temperature, max_tokens, response_format)
+        if use_cache else None
+    )
+    if key is not None:
+        cached = await run_io(llm_cache.get, key)
+        if cached is not None:
+            content = cached.decode("utf-8")
+            # Entries stored before validation was asked for may not pass it
+            if validate is None or validate(content):
+                logging.info("LLM cache hit for %s.", model)
+                return content
+            logging.warning("Ignoring invalid cached answer from %s.", model)
+
+    request = {"model": model, "messages": messages, **kwargs}
+    if temperature is not None:
+        request["temperature"] = temperature
+    if max_tokens is not None:
+        request["max_tokens"] = max_tokens
+    if response_format is not None:
+        request["response_format"] = response_format
+    response = await llm_gateway.chat_completion(client, **request)
+    content = response.choices[0].message.content
+
+    if key is not None and content and (validate is None or validate(content)):
+        await run_io(llm_cache.set, key, content.encode("utf-8"))
+    return content
+
+
+STRUCTURED_ATTEMPTS = 2
+
+
+def _validates(schema: Type[Model], content: str) -> bool:
+    try:
+        schema.model_validate_json(content)
+        return True
+    except ValidationError:
+        return False
+
+
+async def structured_chat_completion(
+    client, schema: Type[Model], model: str, messages: List[dict], **kwargs
+) -> Model:
+    """
+    cached_chat_completion constrained to the JSON schema of `schema`, parsed
+    into it. An answer that does not validate is not cached and the call is
+    made again; ValueError if it still does not validate after
+    STRUCTURED_ATTEMPTS calls.
+    """
+    for _ in range(STRUCTURED_ATTEMPTS):
+        content = await cached_chat_completion(
+            client, model, messages,
+            response_format=json_schema_format(schema),
+            validate=lambda content: _validates(schema, content),
+            **kwargs,
+        )
+        result = parse_structured(schema, content)
+        if result is not None:
+            return result
+    raise ValueError(f"{model} returned no valid {schema.__name__} answer in {STRUCTURED_ATTEMPTS} attempts.")
@@ -0,0 +1,298 @@
+# llm_gateway.py
+#
+# Shared path of every chat completion request to OpenAI.
+#
+#   - One AsyncOpenAI client for all routers (its own retries are off; the
+#     gateway retries), or the fake_llm.py stand-in with LLM_BACKEND=fake.
+#   - Token buckets for requests and tokens per minute (LLM_REQUESTS_PER_MINUTE,
+#     LLM_TOKENS_PER_MINUTE; 0 disables a limit), so bursts queue here instead
+#     of coming back as 429s. Tokens are charged from an estimate of the
+#     prompt plus max_tokens and corrected with the reported usage.
+#   - At most LLM_MAX_CONCURRENCY requests in flight.
+#   - Rate limits, timeouts, connection errors and 5xx responses are retried
+#     up to LLM_MAX_RETRIES times with exponential backoff and jitter,
+#     honouring Retry-After.
+#   - Identical requests made while one is in flight share its response.
+#   - Per-model counters and latencies, served by /llm/stats, and call
+#     durations and token usage as histograms in /metrics (metrics.py).
+#
+# llm_cache.cached_chat_completion sits in front of this: cache hits never
+# reach the gateway.
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+import openai as openai_errors
+from openai import AsyncOpenAI
+
+from metrics import TOKEN_BUCKETS, Counter, Histogram, record_stage
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "30"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+# Completion tokens assumed for requests without max_tokens
+LLM_DEFAULT_COMPLETION_TOKENS = 1000
+LATENCY_SAMPLES = 1000
+
+# "openai", or "fake" for the local stand-in in fake_llm.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+if LLM_BACKEND == "fake":
+    from fake_llm import FakeLLMClient
+    openai_client = FakeLLMClient()
+    logging.warning("LLM_BACKEND=fake: LLM answers are simulated.")
+else:
+    if not os.getenv("OPENAI_API_KEY"):
+        logging.warning("OPENAI_API_KEY is not set in environment variables.")
+    openai_client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, timeout=LLM_TIMEOUT_S
+    )
+
+
+LLM_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Duration of one API call (attempt).", ("model", "outcome")
+)
+LLM_TOKENS = Histogram(
+    "llm_tokens", "Tokens per completed call.", ("model", "kind"), TOKEN_BUCKETS
+)
+LLM_RETRIES = Counter("llm_retries_total", "API calls retried after an error.", ("model",))
+LLM_COALESCED = Counter(
+    "llm_coalesced_total", "Requests answered by an identical in-flight call.", ("model",)
+)
+
+
+# -----------------------------------------------------------------------------
+# Rate limiting
+# -----------------------------------------------------------------------------
+class TokenBucket:
+    """`per_minute` units, refilled continuously; acquire() waits in FIFO
+    order until enough are available."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    async def acquire(self, amount: float) -> float:
+        """Take `amount` (at most the capacity); returns the seconds waited."""
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return time.monotonic() - started
+                await asyncio.sleep((amount - self.level) * 60 / self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or, if negative, refund) `amount` after the fact; the level
+        may go below zero, which delays the next requests."""
+        if self.capacity <= 0:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+def estimate_tokens(request: dict) -> int:
+    """Rough token count of a request: ~4 characters per prompt token, plus
+    the completion budget."""
+    prompt_chars = sum(len(str(message.get("content") or "")) for message in request["messages"])
+    return prompt_chars // 4 + (request.get("max_tokens") or LLM_DEFAULT_COMPLETION_TOKENS)
+
+
+# -----------------------------------------------------------------------------
+# Retries
+# -----------------------------------------------------------------------------
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai_errors.RateLimitError):
+        # Out of credit: waiting does not help
+        return getattr(error, "code", None) != "insufficient_quota"
+    return isinstance(error, (
+        openai_errors.APITimeoutError,
+        openai_errors.APIConnectionError,
+        openai_errors.InternalServerError,
+    ))
+
+
+def backoff_delay(error: Exception, attempt: int) -> float:
+    """Retry-After when the API sends it, else exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(LLM_BACKOFF_MAX_S, float(response.headers["retry-after"]))
+        except (KeyError, ValueError):
+            pass
+    delay = min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
+class ModelStats:
+    def __init__(self):
+        self.requests = 0  # calls made by callers
+        self.coalesced = 0  # of which shared an in-flight call
+        self.api_calls = 0  # attempts sent to the API, retries included
+        self.retries = 0
+        self.errors = 0  # calls that failed after the last attempt
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.rate_limit_wait_s = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # seconds, successful calls
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "api_calls": self.api_calls,
+            "retries": self.retries,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "rate_limit_wait_s": round(self.rate_limit_wait_s, 3),
+            "latency_p50_s": percentile(0.50),
+            "latency_p95_s": percentile(0.95),
+            "latency_max_s": round(latencies[-1], 3) if latencies else None,
+        }
+
+
+# -----------------------------------------------------------------------------
+# Gateway
+# -----------------------------------------------------------------------------
+class LLMGateway:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.models: Dict[str, ModelStats] = {}
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _bind_loop(self) -> None:
+        # asyncio primitives belong to one event loop (tests and benchmarks
+        # may run several in turn)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.request_bucket._lock = asyncio.Lock()
+            self.token_bucket._lock = asyncio.Lock()
+            self._inflight = {}
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "models": {model: stats.as_dict() for model, stats in self.models.items()},
+        }
+
+    async def chat_completion(self, client, **request):
+        """
+        client.chat.completions.create(**request) through the limits, retries
+        and coalescing above; returns the API response.
+        """
+        self._bind_loop()
+        stats = self.models.setdefault(request["model"], ModelStats())
+        stats.requests += 1
+
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        key = f"{id(client)}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+        call = self._inflight.get(key)
+        if call is not None:
+            stats.coalesced += 1
+            LLM_COALESCED.inc(1, request["model"])
+        else:
+            call = asyncio.ensure_future(self._call(client, request, stats))
+            self._inflight[key] = call
+            call.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A cancelled caller must not cancel the call others are waiting on
+        return await asyncio.shield(call)
+
+    async def _call(self, client, request: dict, stats: ModelStats):
+        estimate = estimate_tokens(request)
+        attempt = 0
+        model = request["model"]
+        while True:
+            waited = await self.request_bucket.acquire(1)
+            waited += await self.token_bucket.acquire(estimate)
+            stats.rate_limit_wait_s += waited
+            if waited >= 0.001:
+                record_stage("llm_rate_limit_wait", waited)
+            async with self._semaphore:
+                started = time.monotonic()
+                stats.api_calls += 1
+                try:
+                    response = await client.chat.completions.create(**request)
+                except Exception as e:
+                    elapsed = time.monotonic() - started
+                    LLM_SECONDS.observe(elapsed, model, type(e).__name__)
+                    record_stage("llm", elapsed)
+                    # Every attempt takes its estimate again; only the
+                    # successful one is reconciled with the actual usage
+                    self.token_bucket.adjust(-estimate)
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        stats.errors += 1
+                        raise
+                    error = e
+                else:
+                    elapsed = time.monotonic() - started
+                    stats.latencies.append(elapsed)
+                    LLM_SECONDS.observe(elapsed, model, "ok")
+                    record_stage("llm", elapsed)
+                    break
+            delay = backoff_delay(error, attempt)
+            attempt += 1
+            stats.retries += 1
+            LLM_RETRIES.inc(1, model)
+            logging.warning(
+                "%s call failed (%s); retry %d/%d in %.1fs.",
+                model, type(error).__name__, attempt, self.max_retries, delay,
+            )
+            await asyncio.sleep(delay)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            stats.prompt_tokens += usage.prompt_tokens or 0
+            stats.completion_tokens += usage.completion_tokens or 0
+            LLM_TOKENS.observe(usage.prompt_tokens or 0, model, "prompt")
+            LLM_TOKENS.observe(usage.completion_tokens or 0, model, "completion")
+            self.token_bucket.adjust((usage.total_tokens or 0) - estimate)
+        return response
+
+
+llm_gateway = LLMGateway()
@@ -1,9 +1,15 @@
+import asyncio
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from routers import contract_router, invoice_router, auth_router, document_router, contract_new_router, invoice_new_route
+from routers import contract_router, invoice_router, auth_router, document_router, contract_new_router, invoice_new_route, system_router, metrics_router, findings_router, batch_router
 from routers.auth import get_current_user
-from database import init_db
+from database import close_connections, init_db
 from routers.Contract import load_far_regulatory_data
+from regulatory_cache import far_corpus
+from executors import run_io, shutdown_executors
+from jobs import job_queue
+from case_catalog import warm_catalogs
+from metrics import MetricsMiddleware
 from contextlib import asynccontextmanager
 
 # Initialize FastAPI app
@@ -12,15 +18,25 @@ regulatory_data = {}
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global regulatory_data
+    refresh_task = None
     try:
-        regulatory_data = load_far_regulatory_data()  # Load the data at startup
-        init_db()  # Initialize database here
+        # Served from the on-disk cache or snapshot when available
+        regulatory_data = await run_io(load_far_regulatory_data)
+        refresh_task = asyncio.create_task(far_corpus.refresh_periodically())
+        await run_io(init_db)  # Initialize database here
+        await run_io(warm_catalogs)  # Excel test cases, parsed once
+        await job_queue.start()  # Also re-queues jobs interrupted by a restart
         yield
     except Exception as e:
         print(f"Error during startup: {e}")
         regulatory_data = {}  # Fallback to an empty dictionary
     finally:
         # Perform any necessary cleanup here if needed
+        if refresh_task:
+            refresh_task.cancel()
+        await job_queue.stop()
+        shutdown_executors()
+        close_connections()
         print("Application shutdown")
 
 app = FastAPI(lifespan=lifespan)
@@ -31,7 +47,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID"],  # pagination, trace ID
 )
+# Outermost: times every request and gives it a trace ID (metrics.py)
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(auth_router, tags=["Authentication"])
@@ -61,4 +80,24 @@ app.include_router(
     invoice_new_route,
     tags=["Invoices"],
     dependencies=[Depends(get_current_user)]
-)
\ No newline at end of file
+)
+
+app.include_router(
+    findings_router,
+    tags=["Invoices"],
+    dependencies=[Depends(get_current_user)]
+)
+
+app.include_router(
+    batch_router,
+    tags=["Batch"],
+    dependencies=[Depends(get_current_user)]
+)
+
+app.include_router(
+    system_router,
+    tags=["System"],
+    dependencies=[Depends(get_current_user)]
+)
+
+app.include_router(metrics_router, tags=["System"])
@@ -0,0 +1,262 @@
+# metrics.py
+#
+# Hot-path instrumentation: per-stage timings, request trace IDs and the
+# Prometheus text exposition served at GET /metrics (no client library).
+#
+#   with stage("extract", nbytes=len(file_bytes)):
+#       text = await run_io(extract_text, file_bytes)
+#
+# records the stage's duration (and input size) in histograms and, inside a
+# request, in that request's trace. MetricsMiddleware gives every request a
+# trace ID (X-Request-ID, taken from the request or generated), times it per
+# route and logs requests slower than METRICS_SLOW_REQUEST_S with their stage
+# breakdown. Stages work in async code and in run_io threads (run_io copies
+# the caller's context); process-pool workers return their timings to the
+# caller, which records them (see ocr.py).
+#
+# A stage costs two perf_counter calls, a bisect and a lock, a few
+# microseconds against stages of milliseconds to minutes
+# (benchmarks/bench_metrics.py).
+
+import os
+import re
+import uuid
+import time
+import asyncio
+import logging
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+METRICS_SLOW_REQUEST_S = float(os.getenv("METRICS_SLOW_REQUEST_S", "10"))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KiB to 1 GiB
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+
+# -----------------------------------------------------------------------------
+# Metric types
+# -----------------------------------------------------------------------------
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                le = f'le="{bound if bound == "+Inf" else _number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_number(cumulative)}")
+        return lines
+
+
+REGISTRY: List[object] = []
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text format (0.0.4)."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request duration by route.",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Duration of one pipeline stage.", ("stage",)
+)
+STAGE_BYTES = Histogram(
+    "stage_input_bytes", "Input size of one pipeline stage.", ("stage",), BYTE_BUCKETS
+)
+
+
+# -----------------------------------------------------------------------------
+# Stages and traces
+# -----------------------------------------------------------------------------
+class Trace:
+    __slots__ = ("trace_id", "stages")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.stages: List[Tuple[str, float]] = []
+
+    def breakdown(self) -> str:
+        """'extract 0.41s, llm 3.20s x2, ...' in first-seen order."""
+        totals: Dict[str, List[float]] = {}
+        for name, seconds in self.stages:
+            total = totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        return ", ".join(
+            f"{name} {seconds:.2f}s" + (f" x{count}" if count > 1 else "")
+            for name, (seconds, count) in totals.items()
+        )
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def traced(trace_id: Optional[str] = None):
+    """Collect the stages run in this block (and the tasks and run_io calls
+    it starts) under one trace."""
+    trace = Trace(trace_id or uuid.uuid4().hex[:16])
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def record_stage(name: str, seconds: float, nbytes: Optional[int] = None) -> None:
+    STAGE_SECONDS.observe(seconds, name)
+    if nbytes is not None:
+        STAGE_BYTES.observe(nbytes, name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str, nbytes: Optional[int] = None):
+    """Time the block as stage `name` (failed runs included)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, nbytes)
+
+
+def timed(name: str):
+    """Decorator form of stage() for sync and async functions."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# -----------------------------------------------------------------------------
+# Requests
+# -----------------------------------------------------------------------------
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class MetricsMiddleware:
+    """ASGI middleware: trace ID and duration of every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        status = 500
+
+        with traced(request_id if _REQUEST_ID.match(request_id) else None) as trace:
+            header = (b"x-request-id", trace.trace_id.encode("ascii"))
+
+            async def send_with_trace_id(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    message["headers"] = [*message.get("headers", []), header]
+                await send(message)
+
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                elapsed = time.perf_counter() - start
+                # Route template, not the raw path, to keep label values bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+                if elapsed >= METRICS_SLOW_REQUEST_S:
+                    logging.warning(
+                        "Slow request %s %s: %.2fs, status %s [trace %s]: %s",
+                        scope["method"], route, elapsed, status, trace.trace_id,
+                        trace.breakdown() or "no stages",
+                    )
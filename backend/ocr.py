@@ -0,0 +1,154 @@
+# ocr.py
+#
+# Page-streaming OCR for scanned PDFs.
+#
+# Pages are rendered and recognized one at a time inside the shared process
+# pool (executors.py), so a 40-page contract uses several cores and only ever
+# holds as many page bitmaps as there are workers. Results are returned in
+# page order.
+#
+# OCR_BACKEND selects where page text comes from:
+#   - "tesseract" (default): the pipeline above,
+#   - "record": the same, also saving the pages as fixtures,
+#   - "fixtures": recorded text only, no Tesseract/Poppler needed (tests,
+#     benchmarks). A document without a fixture fails like a broken OCR
+#     install would.
+# Fixtures are OCR_FIXTURES_DIR/<sha256 of the PDF>.json:
+#   {"pages": {"<page number>": "<text>", ...}}
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+import pytesseract
+
+from executors import CPU_WORKERS, get_process_pool
+from metrics import record_stage, stage
+
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+OCR_BACKEND = os.getenv("OCR_BACKEND", "tesseract")
+OCR_FIXTURES_DIR = os.getenv("OCR_FIXTURES_DIR", "ocr_fixtures")
+
+
+def ocr_page(pdf_path: str, page_number: int, dpi: int, grayscale: bool) -> Tuple[str, float, float]:
+    """
+    Render a single (1-based) page and run Tesseract on it. Runs in a worker
+    process; the bitmap is released before returning. Returns the text and
+    the render and Tesseract seconds, which the caller records.
+    """
+    start = time.perf_counter()
+    images = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        grayscale=grayscale,
+        first_page=page_number,
+        last_page=page_number,
+    )
+    rendered = time.perf_counter()
+    try:
+        text = "\n".join(pytesseract.image_to_string(image) for image in images)
+    finally:
+        for image in images:
+            image.close()
+    return text, rendered - start, time.perf_counter() - rendered
+
+
+def page_text(result: Tuple[str, float, float]) -> str:
+    text, render_seconds, tesseract_seconds = result
+    record_stage("ocr_render", render_seconds)
+    record_stage("ocr_tesseract", tesseract_seconds)
+    return text
+
+
+def iter_ocr_pages(
+    pdf_path: str,
+    pages: Optional[List[int]] = None,
+    dpi: int = OCR_DPI,
+    grayscale: bool = OCR_GRAYSCALE,
+) -> Iterator[str]:
+    """
+    Yield the OCR text of each requested page (default: all) in page order.
+    At most two pages per worker are in flight at any time.
+    """
+    if pages is None:
+        pages = range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1)
+
+    pool = get_process_pool()
+    window = 2 * CPU_WORKERS
+    in_flight = deque()
+    for page_number in pages:
+        in_flight.append(pool.submit(ocr_page, pdf_path, page_number, dpi, grayscale))
+        if len(in_flight) >= window:
+            yield page_text(in_flight.popleft().result())
+    while in_flight:
+        yield page_text(in_flight.popleft().result())
+
+
+def ocr_pdf_bytes(
+    file_bytes: bytes,
+    pages: Optional[List[int]] = None,
+    dpi: int = OCR_DPI,
+    grayscale: bool = OCR_GRAYSCALE,
+) -> List[str]:
+    """
+    OCR a PDF given as bytes and return the text of each requested page.
+    The PDF is written to a temporary file once so workers can render their
+    own page instead of receiving the whole document.
+    """
+    if OCR_BACKEND == "fixtures":
+        with stage("ocr_fixtures"):
+            return fixture_pages(file_bytes, pages)
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(file_bytes)
+        pdf_file.flush()
+        if pages is None:
+            pages = list(range(1, pdfinfo_from_path(pdf_file.name)["Pages"] + 1))
+        page_texts = list(iter_ocr_pages(pdf_file.name, pages, dpi, grayscale))
+    logging.info("OCR processed %d page(s).", len(page_texts))
+    if OCR_BACKEND == "record":
+        save_fixture(file_bytes, dict(zip(pages, page_texts)))
+    return page_texts
+
+
+# -----------------------------------------------------------------------------
+# Recorded fixtures
+# -----------------------------------------------------------------------------
+def fixture_path(file_bytes: bytes) -> str:
+    return os.path.join(OCR_FIXTURES_DIR, hashlib.sha256(file_bytes).hexdigest() + ".json")
+
+
+def save_fixture(file_bytes: bytes, page_texts: Dict[int, str]) -> None:
+    """Merge the pages into the document's fixture."""
+    path = fixture_path(file_bytes)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            recorded = json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        recorded = {}
+    recorded.update({str(number): text for number, text in page_texts.items()})
+    os.makedirs(OCR_FIXTURES_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"pages": recorded}, f, ensure_ascii=False, indent=1)
+
+
+def fixture_pages(file_bytes: bytes, pages: Optional[List[int]] = None) -> List[str]:
+    """Recorded text of the requested pages (default: all recorded)."""
+    path = fixture_path(file_bytes)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            recorded = json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        raise RuntimeError(f"No OCR fixture for this document ({path}).")
+    if pages is None:
+        pages = sorted(int(number) for number in recorded)
+    missing = [number for number in pages if str(number) not in recorded]
+    if missing:
+        raise RuntimeError(f"OCR fixture {path} has no page(s) {missing}.")
+    return [recorded[str(number)] for number in pages]
@@ -0,0 +1,292 @@
+# regulatory_cache.py
+#
+# Versioned cache of the FAR regulatory corpus used by contract analysis.
+#
+# The corpus is kept in three layers:
+#   1. in memory (what analyze_contract reads, no I/O),
+#   2. on disk under FAR_CACHE_DIR: the part ZIPs, their ETag/Last-Modified
+#      headers and the parsed corpus.json,
+#   3. an optional local snapshot (FAR_SNAPSHOT_PATH, same format as
+#      corpus.json) so the app can start without network access.
+# A background task re-validates the ZIPs with conditional requests and only
+# re-parses when acquisition.gov reports a change. With FAR_OFFLINE=true
+# acquisition.gov is never contacted: the corpus comes from the disk cache or
+# the snapshot only (tests, benchmarks, air-gapped deployments).
+
+import os
+import io
+import json
+import asyncio
+import hashlib
+import logging
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, Optional
+
+import requests
+
+from metrics import stage, timed
+
+FAR_BASE_URL = (
+    "https://www.acquisition.gov/sites/default/files/current/far/compiled_dita/"
+)
+FAR_DITA_FILES = [
+    "part_52/52.232-25.dita",
+    "part_52/52.244-2.dita",
+    "part_52/52.249-8.dita",
+    "part_52/52.249-9.dita",
+    "part_52/52.249-10.dita",
+    "part_9/9.103.dita",
+    "part_52/52.209-5.dita",
+    "part_3/3.101-1.dita",
+    "part_9/9.505.dita",
+]
+
+FAR_CACHE_DIR = os.getenv("FAR_CACHE_DIR", "far_cache")
+FAR_SNAPSHOT_PATH = os.getenv("FAR_SNAPSHOT_PATH")
+FAR_REFRESH_INTERVAL_HOURS = float(os.getenv("FAR_REFRESH_INTERVAL_HOURS", "24"))
+FAR_OFFLINE = os.getenv("FAR_OFFLINE", "false").lower() == "true"
+
+
+def extract_text_from_dita_bytes(xml_bytes: bytes) -> str:
+    """
+    Parse DITA XML content and return its complete text content.
+    """
+    try:
+        root = ET.fromstring(xml_bytes)
+        return " ".join(text.strip() for text in root.itertext() if text.strip())
+    except ET.ParseError as e:
+        return f"Error parsing XML: {e}"
+
+
+def has_regulatory_text(texts: Dict[str, str]) -> bool:
+    """
+    False when every text is an error placeholder ("Error: ..." from the
+    parsing above): such a corpus would check contracts against error strings.
+    """
+    return any(not text.startswith("Error") for text in texts.values())
+
+
+class RegulatoryCorpusCache:
+    """
+    In-process store of the FAR texts (file name -> text) backed by a
+    persistent on-disk cache keyed by the upstream ETag/Last-Modified headers.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = FAR_CACHE_DIR,
+        snapshot_path: Optional[str] = FAR_SNAPSHOT_PATH,
+        offline: bool = FAR_OFFLINE,
+    ):
+        self.cache_dir = cache_dir
+        self.snapshot_path = snapshot_path
+        self.offline = offline
+        self.texts: Dict[str, str] = {}
+        self.version: Optional[str] = None
+        self._refresh_lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    # Paths
+    # -------------------------------------------------------------------------
+    @property
+    def corpus_path(self) -> str:
+        return os.path.join(self.cache_dir, "corpus.json")
+
+    @property
+    def metadata_path(self) -> str:
+        return os.path.join(self.cache_dir, "metadata.json")
+
+    def zip_path(self, part: str) -> str:
+        return os.path.join(self.cache_dir, f"{part}.zip")
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+    def get(self) -> Dict[str, str]:
+        """
+        Return the corpus from memory. Only the very first call in a process
+        without a disk cache or snapshot has to download it.
+        """
+        if not self.texts:
+            self.load()
+        return self.texts
+
+    def load(self) -> Dict[str, str]:
+        """
+        Populate memory from the disk cache, then the snapshot, and only
+        download when neither exists.
+        """
+        for path in (self.corpus_path, self.snapshot_path):
+            if path and self._load_corpus_file(path):
+                return self.texts
+        if self.offline:
+            logging.error("FAR_OFFLINE is set but there is no FAR corpus cache or snapshot.")
+            return self.texts
+        self.refresh()
+        return self.texts
+
+    def _load_corpus_file(self, path: str) -> bool:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                corpus = json.load(f)
+        except (OSError, ValueError):
+            return False
+        texts = corpus.get("texts") or {}
+        if not texts:
+            return False
+        if not has_regulatory_text(texts):
+            logging.warning("Ignoring FAR corpus %s: it holds only error placeholders.", path)
+            return False
+        self.texts = texts
+        self.version = corpus.get("version")
+        logging.info("Loaded FAR corpus %s from %s.", self.version, path)
+        return True
+
+    # -------------------------------------------------------------------------
+    # Refresh
+    # -------------------------------------------------------------------------
+    def _read_metadata(self) -> dict:
+        try:
+            with open(self.metadata_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path: str, data: dict) -> None:
+        # Write then rename so readers never see a half-written file.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _fetch_part(self, part: str, cached: dict) -> Optional[bool]:
+        """
+        Conditionally download one part ZIP. Returns True if it changed,
+        False if the cached copy is current, None if it is unavailable.
+        """
+        headers = {}
+        has_zip = os.path.exists(self.zip_path(part))
+        if has_zip and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if has_zip and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with stage("far_download"):
+                response = requests.get(
+                    f"{FAR_BASE_URL}{part}.zip", headers=headers, timeout=60
+                )
+        except requests.RequestException as e:
+            logging.warning("Could not reach acquisition.gov for %s.zip: %s", part, e)
+            return False if has_zip else None
+
+        if response.status_code == 304:
+            return False
+        if response.status_code != 200:
+            logging.warning(
+                "Error downloading %s.zip: Status code %s", part, response.status_code
+            )
+            return False if has_zip else None
+
+        tmp_path = f"{self.zip_path(part)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, self.zip_path(part))
+        cached.clear()
+        cached.update({
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": hashlib.sha256(response.content).hexdigest(),
+            "fetched_at": datetime.utcnow().isoformat(),
+        })
+        logging.info("Downloaded %s.zip successfully.", part)
+        return True
+
+    @timed("far_parse")
+    def _parse_zips(self, available: set) -> Dict[str, str]:
+        zip_files = {
+            part: zipfile.ZipFile(self.zip_path(part)) for part in available
+        }
+        try:
+            texts = {}
+            for file_name in FAR_DITA_FILES:
+                part = file_name.split("/")[0]
+                if part not in zip_files:
+                    texts[file_name] = "Error: No ZIP available for this part."
+                elif file_name in zip_files[part].namelist():
+                    texts[file_name] = extract_text_from_dita_bytes(
+                        zip_files[part].read(file_name)
+                    )
+                else:
+                    texts[file_name] = "Error: File not found in ZIP."
+            return texts
+        finally:
+            for zip_ref in zip_files.values():
+                zip_ref.close()
+
+    def refresh(self) -> bool:
+        """
+        Re-validate every part ZIP against acquisition.gov and rebuild the
+        corpus if anything changed. Returns True when a new version was
+        installed. Safe to call from a worker thread. Does nothing offline.
+        """
+        if self.offline:
+            return False
+        with self._refresh_lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            metadata = self._read_metadata()
+            parts = sorted(set(f.split("/")[0] for f in FAR_DITA_FILES))
+
+            changed = False
+            available = set()
+            for part in parts:
+                cached = metadata.setdefault(part, {})
+                result = self._fetch_part(part, cached)
+                if result is not None:
+                    available.add(part)
+                changed = changed or bool(result)
+
+            if not changed and self.texts:
+                return False
+            if not changed and self._load_corpus_file(self.corpus_path):
+                return False
+            if not available:
+                # No ZIP downloaded or cached: keep serving what is loaded (if
+                # anything) and install nothing, so no error corpus reaches disk.
+                logging.warning("No FAR part ZIP is available; corpus not refreshed.")
+                return False
+
+            texts = self._parse_zips(available)
+            if not has_regulatory_text(texts):
+                logging.warning("FAR part ZIPs hold none of the clauses; corpus not refreshed.")
+                return False
+            version = hashlib.sha256(
+                json.dumps(
+                    {part: metadata.get(part, {}).get("sha256") for part in parts},
+                    sort_keys=True,
+                ).encode("utf-8")
+            ).hexdigest()[:16]
+
+            self._write_json(self.metadata_path, metadata)
+            self._write_json(self.corpus_path, {"version": version, "texts": texts})
+            self.texts = texts
+            self.version = version
+            logging.info("Installed FAR corpus version %s.", version)
+            return True
+
+    async def refresh_periodically(
+        self, interval_hours: float = FAR_REFRESH_INTERVAL_HOURS
+    ) -> None:
+        """Background task: refresh off the event loop every interval."""
+        while True:
+            await asyncio.sleep(interval_hours * 3600)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logging.error("FAR corpus refresh failed: %s", e)
+
+
+far_corpus = RegulatoryCorpusCache()
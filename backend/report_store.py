@@ -0,0 +1,122 @@
+# report_store.py
+#
+# Compressed storage for analysis reports.
+#
+# Reports (the full JSON of a CSV batch, or the LLM analysis text) live in the
+# `reports` table as gzip blobs, one row per document, so the `documents`
+# table only holds small metadata rows. Reports are read only by the detail
+# endpoints, which either pass the gzip bytes straight through or decompress
+# them chunk by chunk while streaming.
+#
+# The helpers take an open connection and never import database.py, so the
+# migration that creates the table can use them too.
+
+import os
+import gzip
+import zlib
+import codecs
+import tempfile
+from typing import Iterator, NamedTuple, Optional, Union
+
+REPORT_COMPRESSION_LEVEL = int(os.getenv("REPORT_COMPRESSION_LEVEL", "6"))
+REPORT_CHUNK_SIZE = 64 * 1024
+
+CREATE_REPORTS_TABLE = '''
+CREATE TABLE IF NOT EXISTS reports (
+    document_id INTEGER PRIMARY KEY,
+    encoding TEXT NOT NULL,   -- 'gzip'
+    size INTEGER NOT NULL,    -- uncompressed bytes
+    data BLOB NOT NULL,
+    FOREIGN KEY (document_id) REFERENCES documents (id)
+)
+'''
+
+
+class CompressedReport(NamedTuple):
+    data: bytes
+    size: int
+
+
+class ReportWriter:
+    """
+    Incrementally gzip a report that is produced in pieces (e.g. the
+    streaming CSV upload) without holding the uncompressed text.
+    """
+
+    def __init__(self):
+        self._spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        self._gzip = gzip.GzipFile(
+            fileobj=self._spool, mode="wb", compresslevel=REPORT_COMPRESSION_LEVEL
+        )
+        self.size = 0
+
+    def write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self._gzip.write(data)
+        self.size += len(data)
+
+    def copy_from(self, text_file) -> None:
+        """Append the rest of an open text file, chunk by chunk."""
+        while True:
+            chunk = text_file.read(REPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.write(chunk)
+
+    def finish(self) -> CompressedReport:
+        self._gzip.close()
+        self._spool.seek(0)
+        data = self._spool.read()
+        self._spool.close()
+        return CompressedReport(data, self.size)
+
+
+def compress_report(report_data: str) -> CompressedReport:
+    raw = report_data.encode("utf-8")
+    return CompressedReport(
+        gzip.compress(raw, compresslevel=REPORT_COMPRESSION_LEVEL), len(raw)
+    )
+
+
+def save_report(db, document_id: int, report: Union[str, CompressedReport, None]) -> None:
+    """Store (or replace) a document's report; None stores nothing."""
+    if report is None:
+        return
+    if isinstance(report, str):
+        report = compress_report(report)
+    db.execute('''
+    INSERT OR REPLACE INTO reports (document_id, encoding, size, data)
+    VALUES (?, 'gzip', ?, ?)
+    ''', (document_id, report.size, report.data))
+
+
+def iter_report_bytes(data: bytes) -> Iterator[bytes]:
+    """Decompress a gzip report in chunks of at most REPORT_CHUNK_SIZE."""
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    for start in range(0, len(data), REPORT_CHUNK_SIZE):
+        chunk = decompressor.decompress(data[start:start + REPORT_CHUNK_SIZE], REPORT_CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = decompressor.decompress(decompressor.unconsumed_tail, REPORT_CHUNK_SIZE)
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def iter_report_text(data: bytes) -> Iterator[str]:
+    """Like iter_report_bytes, but decoded; chunks never split a character."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in iter_report_bytes(data):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def read_report(data: Optional[bytes]) -> Optional[str]:
+    """Whole report as text, for internal consumers that need all of it."""
+    if data is None:
+        return None
+    return gzip.decompress(data).decode("utf-8")
@@ -1,5 +1,7 @@
 import os
 import io
+import asyncio
+import logging
 import csv
 import zipfile
 import requests
@@ -11,17 +13,34 @@ from fuzzywuzzy import fuzz
 from fastapi import Depends
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
 import uvicorn
-from pdf2image import convert_from_bytes
-import pytesseract
-from openai import OpenAI
-from docx import Document
+from llm_gateway import openai_client
 from pydantic import BaseModel, Field
 import json
-from database import get_db
+from database import insert_document
+from executors import run_io
+from metrics import stage
+from jobs import StatusCallback, ignore_status, job_queue
+from regulatory_cache import far_corpus
+from extraction import extract_docx, extract_pdf
+from llm_cache import structured_chat_completion
+from compliance_results import ComplianceResult
+from contract_chunks import (
+    CHUNK_MAX_TOKENS,
+    CONTRACT_CHUNK_CONCURRENCY,
+    AreaFinding,
+    Chunk,
+    ChunkAssessment,
+    ComplianceArea,
+    ContractAnalysis,
+    chunk_areas,
+    chunk_contract,
+    chunk_findings,
+    reduce_contract,
+)
 from .auth import get_current_user, User
 from contextlib import asynccontextmanager
 
@@ -33,82 +52,25 @@ router = APIRouter()
 
 
 regulatory_data = {}
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not os.getenv("OPENAI_API_KEY"):
-    print("Warning: OPENAI_API_KEY is not set in environment variables.")
-
-
-def extract_text_from_dita(file_path: str) -> str:
-    """
-    Parse a DITA XML file and return its complete text content.
-    """
-    try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        full_text = " ".join(text.strip() for text in root.itertext() if text.strip())
-        return full_text
-    except ET.ParseError as e:
-        return f"Error parsing XML: {e}"
+client = openai_client  # shared; limits and retries in llm_gateway.py
 
 
 def load_far_regulatory_data() -> dict:
     """
-    Downloads FAR regulatory DITA ZIP files, extracts designated files,
-    and returns a mapping of file names to their extracted text content.
+    Returns a mapping of FAR file names to their extracted text content,
+    served from the regulatory corpus cache (memory, then disk, then snapshot;
+    acquisition.gov is only contacted when none of those exist).
     """
-    base_url = (
-        "https://www.acquisition.gov/sites/default/files/current/far/compiled_dita/"
-    )
-    dita_files = [
-        "part_52/52.232-25.dita",
-        "part_52/52.244-2.dita",
-        "part_52/52.249-8.dita",
-        "part_52/52.249-9.dita",
-        "part_52/52.249-10.dita",
-        "part_9/9.103.dita",
-        "part_52/52.209-5.dita",
-        "part_3/3.101-1.dita",
-        "part_9/9.505.dita",
-    ]
-
-    parts = set(f.split("/")[0] for f in dita_files)
-    zip_files = {}
-    for part in parts:
-        zip_url = f"{base_url}{part}.zip"
-        response = requests.get(zip_url)
-        if response.status_code == 200:
-            zip_files[part] = zipfile.ZipFile(io.BytesIO(response.content))
-            print(f"Downloaded {part}.zip successfully.")
-        else:
-            print(f"Error downloading {part}.zip: Status code {response.status_code}")
-
-    output_folder = "extracted_dita"
-    os.makedirs(output_folder, exist_ok=True)
-
-    extracted_texts = {}
-    for file_name in dita_files:
-        part = file_name.split("/")[0]
-        if part in zip_files:
-            zip_ref = zip_files[part]
-            if file_name in zip_ref.namelist():
-                zip_ref.extract(file_name, output_folder)
-                dita_file_path = os.path.join(output_folder, file_name)
-                extracted_texts[file_name] = extract_text_from_dita(dita_file_path)
-            else:
-                extracted_texts[file_name] = "Error: File not found in ZIP."
-        else:
-            extracted_texts[file_name] = "Error: No ZIP available for this part."
-    return extracted_texts
+    return far_corpus.get()
 
 
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """
-    Convert a PDF file into images, then extract text using OCR (Tesseract).
+    Extract text from a PDF: text layer first, OCR (Tesseract) only for pages
+    without usable text.
     """
     try:
-        images = convert_from_bytes(file_bytes)
-        text = "\n".join(pytesseract.image_to_string(image) for image in images)
-        return text.strip()
+        return extract_pdf(file_bytes).text.strip()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing PDF: {e}")
 
@@ -118,125 +80,170 @@ def extract_text_from_docx(file_bytes: bytes) -> str:
     Extract text from a DOCX file using python-docx.
     """
     try:
-        doc = Document(io.BytesIO(file_bytes))
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return text.strip()
+        return extract_docx(file_bytes).text.strip()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing DOCX: {e}")
 
 
-def analyze_contract(contract_text: str) -> str:
-    """
-    Constructs a prompt that includes the FAR regulatory details and the contract text.
-    Sends the prompt to OpenAI and returns the analysis result.
-    """
-    regulatory_data = load_far_regulatory_data()
-    print("DEBUG: ", regulatory_data)
-    regulatory_info = "\n\n".join(
-        [f"{key}:\n{value}" for key, value in regulatory_data.items()]
-    )
-    
-
-    system_message = (
+CHUNK_SYSTEM_MESSAGE = (
     "You are a contract compliance analyst specializing in evaluating contracts against Federal Acquisition Regulations (FAR). "
-    "Your responsibilities include:\n"
-    "1. Breaking down the contract into key sections.\n"
-    "2. Extracting key clauses and comparing them to the regulatory reference data.\n"
-    "3. Focusing on these five compliance areas:\n"
-    "   - Pricing & Payment Terms (FAR 52.232-25)\n"
-    "   - Subcontracting Restrictions (FAR 52.244-2)\n"
-    "   - Penalties for Non-Performance\n"
-    "   - Vendor Eligibility & Registration (verify against SAM.gov requirements)\n"
-    "   - Conflict of Interest & Undisclosed Relationships\n"
-    "4. Flagging any missing or incomplete clauses.\n"
-    "5. Assigning a risk level for each area: Low (fully compliant), Medium (minor issues), or High (major non-compliance).\n"
-    "6. Calculating an overall compliance score (0-100%), where a higher score indicates lower risk and better compliance.\n"
-    "7. Providing a concise summary of issues.\n"
-    "Ensure that your analysis is clear, structured, and concise."
+    "You are given one excerpt of a longer contract, the FAR reference text for some compliance areas and the list of those areas. "
+    "For each listed area:\n"
+    "1. Decide whether the excerpt contains a clause that addresses the area (addressed: true/false). "
+    "Judge only this excerpt; other parts of the contract are reviewed separately.\n"
+    "2. If it is addressed, compare the clause with the reference text and assign a risk level: "
+    "Low (fully compliant), Medium (minor issues) or High (major non-compliance).\n"
+    "3. List the issues found as short sentences (an empty list if there are none).\n"
+    "Answer with one entry per listed area; risk_level is null for areas the excerpt does not address."
 )
 
 
+async def analyze_chunk(
+    chunk: Chunk,
+    areas: List[ComplianceArea],
+    regulatory_data: dict,
+    semaphore: asyncio.Semaphore,
+) -> List[AreaFinding]:
+    """Map step: one chunk against the FAR clauses of the areas it touches."""
+    regulatory_info = "\n\n".join(
+        f"{far_file}:\n{regulatory_data.get(far_file, '')}"
+        for area in areas
+        for far_file in area.far_files
+    )
+    area_list = "\n".join(f"- {area.name}" for area in areas)
     user_message = (
         f"Below is the regulatory reference information:\n\n{regulatory_info}\n\n"
-        f'Below is the contract text to be analyzed:\n"""\n{contract_text}\n"""'
+        f"Compliance areas to assess:\n{area_list}\n\n"
+        f'Below is the contract excerpt ({chunk.label}):\n"""\n{chunk.text}\n"""'
     )
-
-    try:
-        response = client.chat.completions.create(
+    # An answer that does not match the schema is retried once, then raises:
+    # dropping it would report the chunk's areas as missing clauses
+    async with semaphore:
+        assessment = await structured_chat_completion(
+            client,
+            ChunkAssessment,
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": system_message},
+                {"role": "system", "content": CHUNK_SYSTEM_MESSAGE},
                 {"role": "user", "content": user_message},
             ],
-            temperature=0.2,
-            max_tokens=1500,
+            temperature=0,  # deterministic, so unchanged chunks hit llm_cache
+            max_tokens=CHUNK_MAX_TOKENS,
         )
-        return response.choices[0].message.content
+    return chunk_findings(assessment, chunk, areas)
+
+
+async def analyze_contract(contract_text: str) -> ContractAnalysis:
+    """
+    Splits the contract into section chunks, analyzes the chunks concurrently
+    against the FAR clauses relevant to each, and merges the findings into
+    per-area risk levels and an overall score (see contract_chunks.py).
+    """
+    with stage("far_load"):
+        regulatory_data = await run_io(load_far_regulatory_data)
+    chunks = chunk_contract(contract_text)
+    semaphore = asyncio.Semaphore(CONTRACT_CHUNK_CONCURRENCY)
+
+    # Chunks left without any area to assess are not sent
+    calls = [
+        analyze_chunk(chunk, areas, regulatory_data, semaphore)
+        for chunk, areas in zip(chunks, chunk_areas(chunks))
+        if areas
+    ]
+    try:
+        with stage("contract_analysis"):
+            chunk_findings = await asyncio.gather(*calls)
     except Exception as e:
-        return f"Error in OpenAI API call: {e}"
+        return ContractAnalysis([], None, f"Error in OpenAI API call: {e}")
+
+    return reduce_contract(chunks, (f for findings in chunk_findings for f in findings))
+
+
+async def process_contract(
+    file_bytes: bytes, filename: str, set_status: StatusCallback = ignore_status
+) -> Tuple[str, str, ComplianceResult]:
+    """
+    Extract and analyze one contract. Returns (risk_level, analysis_result,
+    compliance result). Used inline by the endpoint and as the 'contract'
+    job handler.
+    """
+    file_extension = filename.split(".")[-1].lower()
+
+    await set_status("extracting")
+    with stage("extract", nbytes=len(file_bytes)):
+        if file_extension == "pdf":
+            contract_text = await run_io(extract_text_from_pdf, file_bytes)
+        elif file_extension == "docx":
+            contract_text = await run_io(extract_text_from_docx, file_bytes)
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail="Unsupported file format. Only PDF and DOCX are allowed.",
+            )
+
+    if not contract_text.strip():
+        raise HTTPException(status_code=400, detail="No text extracted from file.")
+
+    # Analyze the contract
+    await set_status("analyzing")
+    analysis = await analyze_contract(contract_text)
+
+    # Risk level from the overall compliance score; HIGH when the analysis failed
+    score = analysis.score
+    logging.info("Contract compliance score: %s", score)
+    risk_level = "HIGH"
+    if score is not None:
+        risk_level = "LOW" if score > 75 else "MEDIUM" if score > 50 else "HIGH"
 
+    return risk_level, analysis.report, analysis.compliance_result()
+
+
+job_queue.register('contract', process_contract)
 
 
 @router.post("/analyze_contract/")
 async def analyze_contract_endpoint(
     file: UploadFile = File(...),
+    background: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     """
     Accepts a PDF or DOCX file, extracts its text, analyzes it against FAR regulatory data,
     and stores the results in the database.
+
+    With ?background=true the analysis is queued instead: the response is
+    {"document_id", "status": "queued"} and the result is polled from
+    /documents/document/{document_id}.
     """
     file_bytes = await file.read()
-    file_extension = file.filename.split(".")[-1].lower()
-
-    if file_extension == "pdf":
-        contract_text = extract_text_from_pdf(file_bytes)
-    elif file_extension == "docx":
-        contract_text = extract_text_from_docx(file_bytes)
-    else:
+    if file.filename.split(".")[-1].lower() not in ("pdf", "docx"):
         raise HTTPException(
             status_code=400,
             detail="Unsupported file format. Only PDF and DOCX are allowed.",
         )
 
-    if not contract_text.strip():
-        raise HTTPException(status_code=400, detail="No text extracted from file.")
-
-    # Analyze the contract
-    analysis_result = analyze_contract(contract_text)
-    
-    # Extract risk level from the analysis
-    risk_level = "HIGH"  # Default value
-    if "Overall Compliance Risk Score: " in analysis_result:
-        score = int(analysis_result.split("Overall Compliance Risk Score: ")[1].split("%")[0])
-        print('Score: ', score)
-        risk_level = "LOW" if score > 75 else "MEDIUM" if score > 50 else "HIGH"
-
-    # Store the document and analysis in the database
-    with get_db() as db:
-        cursor = db.execute('''
-        INSERT INTO documents (
-            user_id,
-            document_name,
-            document_type,
-            upload_date,
-            status,
-            risk_level,
-            report_data
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            current_user.id,
-            file.filename,
-            'contract',
-            datetime.utcnow().isoformat(),
-            'processed',
-            risk_level,
-            analysis_result
-        ))
-        document_id = cursor.lastrowid
+    if background:
+        document_id = await job_queue.enqueue(
+            current_user.id, file.filename, 'contract', file_bytes
+        )
+        return {"document_id": document_id, "status": "queued"}
+
+    risk_level, analysis_result, compliance = await process_contract(file_bytes, file.filename)
+
+    # Store the document, analysis and per-area results in the database
+    document_id = await run_io(
+        insert_document,
+        current_user.id,
+        file.filename,
+        'contract',
+        risk_level,
+        analysis_result,
+        compliance=compliance,
+    )
 
     return {
         "analysis": analysis_result,
         "document_id": document_id,
-        "risk_level": risk_level
+        "risk_level": risk_level,
+        "compliance_score": compliance.score,
     }
\ No newline at end of file
@@ -4,30 +4,36 @@ import os
 import io
 import pandas as pd
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 
 # FastAPI imports
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
 from pydantic import BaseModel, Field
 
 # For PDF & DOCX text extraction
-from pdf2image import convert_from_bytes
-import pytesseract
-from docx import Document
+from extraction import extract_docx, extract_pdf
+from llm_cache import structured_chat_completion
+from case_catalog import CompiledTestCases, TestCaseCatalog
+from compliance_results import (
+    ComplianceResult,
+    TestCaseAssessment,
+    test_case_outcome,
+)
 
 # New-style OpenAI import & client usage in Python
-from openai import OpenAI
+from llm_gateway import openai_client
 
 # Your database & auth
-from database import get_db
+from database import insert_document
+from executors import run_io
+from metrics import stage
+from jobs import StatusCallback, ignore_status, job_queue
 from .auth import get_current_user, User
 
 # ---------------------------------------------------------------------------
-# Initialize the OpenAI client (Python style, analogous to your Node snippet)
+# OpenAI client (shared by all routers, see llm_gateway.py)
 # ---------------------------------------------------------------------------
-openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not os.getenv("OPENAI_API_KEY"):
-    print("Warning: OPENAI_API_KEY is not set in environment variables.")
+openai = openai_client  # shared; limits and retries in llm_gateway.py
 
 # ---------------------------------------------------------------------------
 # Create router
@@ -38,87 +44,129 @@ router = APIRouter()
 # Helper functions for text extraction
 # ---------------------------------------------------------------------------
 def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Convert a PDF file into images, then extract text using OCR (Tesseract)."""
+    """Extract text from a PDF: text layer first, OCR only for pages without text."""
     try:
-        images = convert_from_bytes(file_bytes)
-        text = "\n".join(pytesseract.image_to_string(image) for image in images)
-        return text.strip()
+        return extract_pdf(file_bytes).text.strip()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing PDF: {e}")
 
 def extract_text_from_docx(file_bytes: bytes) -> str:
     """Extract text from a DOCX file using python-docx."""
     try:
-        doc = Document(io.BytesIO(file_bytes))
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return text.strip()
+        return extract_docx(file_bytes).text.strip()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing DOCX: {e}")
 
+# ---------------------------------------------------------------------------
+# Test cases (parsed once, re-parsed when the workbook's mtime changes)
+# ---------------------------------------------------------------------------
+def compile_contract_test_cases(excel_path: str) -> List[dict]:
+    """Records of the first sheet."""
+    return pd.read_excel(excel_path).to_dict('records')
+
+def render_contract_test_cases(records: List[dict]) -> str:
+    return f"{records}"
+
+contract_test_cases = TestCaseCatalog(
+    "comparison_data_excel/Test cases contracts.xlsx",
+    compile_contract_test_cases,
+    render_contract_test_cases,
+)
+
 # ---------------------------------------------------------------------------
 # The check function using the latest OpenAI call style
 # ---------------------------------------------------------------------------
-def check_contract_against_test_cases(contract_text: str, excel_path: str) -> str:
+async def check_contract_against_test_cases(
+    contract_text: str, test_cases: CompiledTestCases
+) -> TestCaseAssessment:
     """
-    Reads test cases from an Excel file, sends them along with the contract text
-    to the OpenAI ChatCompletion (ChatGPT) API, and returns which test cases
-    might be triggered by the contract text.
+    Sends the test cases along with the contract text to the OpenAI
+    ChatCompletion (ChatGPT) API, and returns the test cases the contract
+    fails as a validated TestCaseAssessment. API errors and answers that
+    still do not match the schema after a retry (ValueError) propagate.
     """
-    # 1. Load the test cases from Excel
-    df_testcases = pd.read_excel(excel_path)
-    testcases_list = df_testcases.to_dict('records')
+    # 1. The catalog's test cases most relevant to this contract (TEST_CASE_TOP_K)
+    testcases_list = test_cases.prompt_for(contract_text)
 
     # 2. Prepare system and user messages
     system_message = (
         "You are a compliance detection system. Your job is to analyze a contract "
         "against a provided list of potential non-compliance test cases and identify "
-        "which ones may be triggered by the contract. Return the test case that fails along with risk level."
+        "which ones may be triggered by the contract."
     )
 
     user_message_1 = f"Contract text:\n{contract_text}"
     user_message_2 = (
         "Here is a list of test cases to check for potential non-compliance issues:\n"
         f"{testcases_list}\n\n"
-        "Identify which of these test cases the contract might violate or trigger, "
-        "and explain briefly why. Only print the relevant test cases which are flagged."
+        "Identify which of these test cases the contract might violate or trigger. "
+        "List only the flagged test cases, by their Test Case ID, each with a brief reason."
     )
 
-    # 3. Call the OpenAI chat completion endpoint (Python style)
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",  # or "gpt-4" / "gpt-4o" etc.
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message_1},
-                {"role": "user", "content": user_message_2},
-            ],
-            store=True,  # analogous to your Node snippet
-            max_tokens=1024,
-            temperature=0.7,
-        )
-        # 4. Extract and return the response
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error calling OpenAI API: {e}"
+    # 3. Call the OpenAI chat completion endpoint; the answer is constrained
+    # to the TestCaseAssessment JSON schema.
+    # Served from the LLM response cache only when LLM_CACHE_ALL is set,
+    # since this call samples at temperature 0.7
+    return await structured_chat_completion(
+        openai,
+        TestCaseAssessment,
+        model="gpt-4o-mini",  # or "gpt-4" / "gpt-4o" etc.
+        messages=[
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message_1},
+            {"role": "user", "content": user_message_2},
+        ],
+        store=True,  # analogous to your Node snippet
+        max_tokens=1024,
+        temperature=0.7,
+    )
 
 # ---------------------------------------------------------------------------
-# Simple function to derive risk level from GPT text
+# Pipeline (shared by the endpoint and the background job)
 # ---------------------------------------------------------------------------
-def derive_risk_level(analysis_text: str) -> str:
+async def process_contract_test_check(
+    file_bytes: bytes, filename: str, set_status: StatusCallback = ignore_status
+) -> Tuple[str, str, ComplianceResult]:
     """
-    Naive approach:
-    - If 'High' is mentioned anywhere, risk is HIGH
-    - Else if 'Medium' is mentioned, risk is MEDIUM
-    - Otherwise, LOW
+    Extract the contract text, check it against the Excel test cases and
+    derive the risk level from the failed ones. Returns (risk_level,
+    analysis_result, compliance result).
     """
-    # Normalize case for easier searching
-    text_lower = analysis_text.lower()
-    if "high" in text_lower:
-        return "HIGH"
-    elif "medium" in text_lower:
-        return "MEDIUM"
-    else:
-        return "LOW"
+    file_extension = filename.split(".")[-1].lower()
+
+    # Extract text based on file extension
+    await set_status("extracting")
+    with stage("extract", nbytes=len(file_bytes)):
+        if file_extension == "pdf":
+            contract_text = await run_io(extract_text_from_pdf, file_bytes)
+        elif file_extension == "docx":
+            contract_text = await run_io(extract_text_from_docx, file_bytes)
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail="Unsupported file format. Only PDF and DOCX are allowed.",
+            )
+
+    if not contract_text.strip():
+        raise HTTPException(status_code=400, detail="No text extracted from file.")
+
+    # Run the new test case check
+    await set_status("analyzing")
+    with stage("test_cases_load"):
+        test_cases = await contract_test_cases.get()
+    try:
+        with stage("test_case_check"):
+            assessment = await check_contract_against_test_cases(
+                contract_text=contract_text,
+                test_cases=test_cases
+            )
+    except Exception as e:
+        return "HIGH", f"Error calling OpenAI API: {e}", ComplianceResult()
+
+    # Risk level: the highest catalog Risk Level among the failed test cases
+    return test_case_outcome(assessment, test_cases.records)
+
+job_queue.register('contract_test_check', process_contract_test_check)
 
 # ---------------------------------------------------------------------------
 # New Endpoint
@@ -126,6 +174,7 @@ def derive_risk_level(analysis_text: str) -> str:
 @router.post("/check_contract_against_test_cases/")
 async def check_contract_against_test_cases_endpoint(
     file: UploadFile = File(...),
+    background: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -133,67 +182,48 @@ async def check_contract_against_test_cases_endpoint(
     2. Extract the text.
     3. Compare it against test cases in an Excel file.
        Path: "comparison_data_excel/Test cases contracts.xlsx"
-    4. Derive a risk level from the GPT output.
+    4. Derive the risk level from the failed test cases.
     5. Save the result in the documents DB.
     6. Return the analysis result & document ID & risk level.
-    """
 
-    # Hard-coded path (or load from config/env):
-    excel_file_path = "comparison_data_excel/Test cases contracts.xlsx"
+    With ?background=true steps 2-5 run in the job queue and the response is
+    {"document_id", "status": "queued"}; poll /documents/document/{document_id}.
+    """
 
     # 1. Read file bytes
     file_bytes = await file.read()
-    file_extension = file.filename.split(".")[-1].lower()
-
-    # 2. Extract text based on file extension
-    if file_extension == "pdf":
-        contract_text = extract_text_from_pdf(file_bytes)
-    elif file_extension == "docx":
-        contract_text = extract_text_from_docx(file_bytes)
-    else:
+    if file.filename.split(".")[-1].lower() not in ("pdf", "docx"):
         raise HTTPException(
             status_code=400,
             detail="Unsupported file format. Only PDF and DOCX are allowed.",
         )
 
-    if not contract_text.strip():
-        raise HTTPException(status_code=400, detail="No text extracted from file.")
+    if background:
+        document_id = await job_queue.enqueue(
+            current_user.id, file.filename, 'contract_test_check', file_bytes
+        )
+        return {"document_id": document_id, "status": "queued"}
 
-    # 3. Run the new test case check
-    analysis_result = check_contract_against_test_cases(
-        contract_text=contract_text,
-        excel_path=excel_file_path
+    # 2-4. Extract, check and derive the risk level
+    risk_level, analysis_result, compliance = await process_contract_test_check(
+        file_bytes, file.filename
     )
 
-    # 4. Derive a simple risk level from the text
-    risk_level = derive_risk_level(analysis_result)
-
-    # 5. Store in the DB
-    with get_db() as db:
-        cursor = db.execute('''
-            INSERT INTO documents (
-                user_id,
-                document_name,
-                document_type,
-                upload_date,
-                status,
-                risk_level,
-                report_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            current_user.id,
-            file.filename,
-            'contract_test_check',
-            datetime.utcnow().isoformat(),
-            'processed',
-            risk_level,
-            analysis_result
-        ))
-        document_id = cursor.lastrowid
+    # 5. Store in the DB, with the failed test cases as rows
+    document_id = await run_io(
+        insert_document,
+        current_user.id,
+        file.filename,
+        'contract_test_check',
+        risk_level,
+        analysis_result,
+        compliance=compliance,
+    )
 
     # 6. Return JSON response
     return {
         "document_id": document_id,
         "risk_level": risk_level,
-        "analysis_result": analysis_result
-    }
+        "analysis_result": analysis_result,
+        "failed_test_cases": [row.test_case_id for row in compliance.failed_test_cases],
+    }
\ No newline at end of file
@@ -1,17 +1,32 @@
 import os
 import io
+import re
 import csv
 import zipfile
+import tempfile
+from array import array
 import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from collections import Counter, defaultdict
-from typing import List
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Set, Tuple, Union
 from fuzzywuzzy import fuzz
+import numpy as np
+import pandas as pd
 from fastapi import APIRouter
 
 import json
-from database import get_db
+from contextlib import closing
+import database
+from database import connect, get_db, insert_document
+from findings import FindingRow, finding_rows, save_findings
+from invoice_history import (
+    HISTORY_MATCH_LIMIT, HistoryRow, exact_key, exact_matches, fuzzy_candidates,
+    history_row, save_history,
+)
+from executors import run_cpu, run_io
+from metrics import stage, timed
+from report_store import CompressedReport, ReportWriter
 from .auth import get_current_user, User
 from fastapi import Depends
 
@@ -27,6 +42,7 @@ from docx import Document
 from pydantic import BaseModel, Field
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi import FastAPI
 from fastapi import APIRouter
 
@@ -66,6 +82,11 @@ class FraudIssue(BaseModel):
     recommended_action: str
 
 
+class DuplicateMatch(NamedTuple):
+    partner_id: str
+    message: str
+
+
 class InvoiceFraudReport(BaseModel):
     invoice_id: str
     risk_score: int
@@ -74,250 +95,1037 @@ class InvoiceFraudReport(BaseModel):
     final_recommendation: str
 
 
+# Fixed issues raised by the per-invoice rules (shared by both engines).
+OVERPRICING_ISSUE = FraudIssue(
+    issue="Overpricing detected.",
+    severity="High",
+    risk_increase=25,
+    recommended_action="Verify pricing.",
+)
+OFFSHORE_ISSUE = FraudIssue(
+    issue="Offshore payment detected.",
+    severity="High",
+    risk_increase=35,
+    recommended_action="Flag for compliance review.",
+)
+PAYMENT_DELAY_ISSUE = FraudIssue(
+    issue="Detected payment delays.",
+    severity="Medium",
+    risk_increase=10,
+    recommended_action="Review payment timelines.",
+)
+EARLY_PAYMENT_ISSUE = FraudIssue(
+    issue="Invoice requests early payment.",
+    severity="High",
+    risk_increase=20,
+    recommended_action="Ensure service completion first.",
+)
+MISSING_DOCS_ISSUE = FraudIssue(
+    issue="Missing supporting documentation.",
+    severity="High",
+    risk_increase=25,
+    recommended_action="Request proof of delivery.",
+)
+
+
 # -----------------------------------------------------------------------------
 # Helper Functions
 # -----------------------------------------------------------------------------
+FLAGGED_COUNTRIES = ["cayman islands", "panama", "belize"]
+
+
 def is_offshore(payment_routing: str) -> bool:
-    flagged_countries = ["cayman islands", "panama", "belize"]
-    return any(country in payment_routing.lower() for country in flagged_countries)
+    return any(country in payment_routing.lower() for country in FLAGGED_COUNTRIES)
 
 
 def check_overpricing(amount: float, gsa_standard: float) -> bool:
     return amount > (gsa_standard * 1.3)
 
 
-def parse_csv_invoices(file_data: bytes) -> List[Invoice]:
-    text = file_data.decode("utf-8")
-    reader = csv.DictReader(io.StringIO(text))
-    invoices = []
+def parse_invoice_row(row: dict) -> Invoice:
+    return Invoice(
+        invoice_id=row.get("invoice_id", "").strip(),
+        vendor=row.get("vendor", "").strip(),
+        amount=float(row.get("amount", "0").strip()),
+        gsa_standard=float(row.get("gsa_standard", "0").strip()),
+        payment_routing=row.get("payment_routing", "").strip(),
+        invoice_date=row.get("invoice_date", "").strip(),
+        payment_delay_days=(
+            int(row.get("payment_delay_days", "0").strip())
+            if row.get("payment_delay_days")
+            else None
+        ),
+        early_payment_requested=row.get("early_payment_requested", "False")
+        .strip()
+        .lower()
+        == "true",
+        supporting_documents=row.get("supporting_documents", "True")
+        .strip()
+        .lower()
+        == "true",
+        description=row.get("description", "").strip(),
+    )
 
-    for row in reader:
+
+def iter_csv_invoices(text_stream: IO[str]) -> Iterator[Invoice]:
+    """
+    Parse invoices one row at a time from a text stream, skipping bad rows.
+    """
+    for row in csv.DictReader(text_stream):
         try:
-            invoice = Invoice(
-                invoice_id=row.get("invoice_id", "").strip(),
-                vendor=row.get("vendor", "").strip(),
-                amount=float(row.get("amount", "0").strip()),
-                gsa_standard=float(row.get("gsa_standard", "0").strip()),
-                payment_routing=row.get("payment_routing", "").strip(),
-                invoice_date=row.get("invoice_date", "").strip(),
-                payment_delay_days=(
-                    int(row.get("payment_delay_days", "0").strip())
-                    if row.get("payment_delay_days")
-                    else None
-                ),
-                early_payment_requested=row.get("early_payment_requested", "False")
-                .strip()
-                .lower()
-                == "true",
-                supporting_documents=row.get("supporting_documents", "True")
-                .strip()
-                .lower()
-                == "true",
-                description=row.get("description", "").strip(),
-            )
-            invoices.append(invoice)
+            yield parse_invoice_row(row)
         except Exception as e:
             print(f"Error processing row {row}: {e}")
 
-    return invoices
 
+def iter_csv_invoices_from_file(binary_file: IO[bytes]) -> Iterator[Invoice]:
+    """
+    Decode and parse an uploaded (spooled) CSV file incrementally, starting from
+    the beginning of the file. The underlying file is left open.
+    """
+    binary_file.seek(0)
+    text_stream = io.TextIOWrapper(binary_file, encoding="utf-8", newline="")
+    try:
+        yield from iter_csv_invoices(text_stream)
+    finally:
+        text_stream.detach()
 
-def detect_duplicate_invoices(invoices: List[Invoice]) -> List[str]:
-    seen_invoices = {}
-    potential_duplicates = []
 
-    for inv in invoices:
+def parse_csv_invoices(file_data: bytes) -> List[Invoice]:
+    text = file_data.decode("utf-8")
+    return list(iter_csv_invoices(io.StringIO(text)))
+
+
+# Fuzzy duplicate rule: descriptions must score above this fuzz.ratio and the
+# amounts must be within FUZZY_AMOUNT_WINDOW of each other.
+FUZZY_RATIO_THRESHOLD = 80
+FUZZY_AMOUNT_WINDOW = 10
+
+
+def ratio_upper_bound(len1: int, len2: int, common: int) -> int:
+    """
+    Upper bound on fuzz.ratio for two strings of the given lengths sharing at
+    most `common` characters. fuzz.ratio is 100 * 2M / (len1 + len2) where M
+    never exceeds the multiset character overlap, so the bound is lossless.
+    """
+    total = len1 + len2
+    if total == 0:
+        return 100
+    return int(round(100 * 2.0 * common / total))
+
+
+def fuzzy_candidate_pairs(amounts: List[float]) -> Iterator[Tuple[int, int]]:
+    """
+    Candidate generation for fuzzy duplicate detection: sort one vendor's
+    invoices by amount and sweep a +/-FUZZY_AMOUNT_WINDOW window, so only pairs
+    inside the same amount block are ever compared. Yields (i, j) index pairs
+    into `amounts` with i < j.
+    """
+    # NaN never satisfies the amount window, so those rows can't pair.
+    order = sorted(
+        (idx for idx, amount in enumerate(amounts) if amount == amount),
+        key=lambda idx: amounts[idx],
+    )
+    for pos, i in enumerate(order):
+        amount_i = amounts[i]
+        for q in range(pos + 1, len(order)):
+            j = order[q]
+            if not amounts[j] - amount_i <= FUZZY_AMOUNT_WINDOW:
+                break
+            yield (i, j) if i < j else (j, i)
+
+
+def find_fuzzy_duplicate_pairs(
+    invoice_ids: List[str], amounts: Sequence[float], descriptions: List[str]
+) -> List[Tuple[int, int]]:
+    """
+    Fuzzy duplicate pairs within one vendor group, given as parallel columns
+    (descriptions already lower-cased). Returns sorted (i, j) index pairs.
+    """
+    # Descriptions repeat a lot (recurring line items), so memoize the ratio.
+    ratio_cache = {}
+    signatures = [None] * len(invoice_ids)
+    matches = []
+
+    # Every invoice in a group has the same lower-cased vendor, so the vendor
+    # fuzz.ratio check is always 100 and only the description needs scoring.
+    for i, j in fuzzy_candidate_pairs(amounts):
+        if invoice_ids[i] == invoice_ids[j]:
+            continue
+        desc1, desc2 = descriptions[i], descriptions[j]
+        if desc1 != desc2:
+            len1, len2 = len(desc1), len(desc2)
+            if ratio_upper_bound(len1, len2, min(len1, len2)) <= FUZZY_RATIO_THRESHOLD:
+                continue
+            if signatures[i] is None:
+                signatures[i] = Counter(desc1)
+            if signatures[j] is None:
+                signatures[j] = Counter(desc2)
+            common = sum((signatures[i] & signatures[j]).values())
+            if ratio_upper_bound(len1, len2, common) <= FUZZY_RATIO_THRESHOLD:
+                continue
+            score = ratio_cache.get((desc1, desc2))
+            if score is None:
+                score = ratio_cache[(desc1, desc2)] = fuzz.ratio(desc1, desc2)
+            if score <= FUZZY_RATIO_THRESHOLD:
+                continue
+        matches.append((i, j))
+
+    # Report pairs in the same order as a nested i < j scan would.
+    matches.sort()
+    return matches
+
+
+class DuplicateTracker:
+    """
+    Incremental duplicate state for a batch of invoices. Only compact
+    per-vendor columns (ids, amounts, lower-cased descriptions) and the exact
+    duplicate keys are kept, so invoices can be fed in one at a time and
+    discarded.
+    """
+
+    def __init__(self):
+        self.invoice_id_counts = Counter()
+        self.seen_keys = {}
+        self.exact_matches = []
+        self.vendor_ids = defaultdict(list)
+        self.vendor_amounts = defaultdict(lambda: array("d"))
+        self.vendor_descriptions = defaultdict(list)
+
+    def add(self, inv: Invoice) -> None:
+        self.invoice_id_counts[inv.invoice_id] += 1
+
         key = f"{inv.vendor.lower()}_{inv.amount}_{inv.invoice_date}"
-        if key in seen_invoices:
-            potential_duplicates.append(
-                f"Exact duplicate found: {inv.invoice_id} (Vendor: {inv.vendor}, Amount: {inv.amount})"
+        if key in self.seen_keys:
+            message = f"Exact duplicate found: {inv.invoice_id} (Vendor: {inv.vendor}, Amount: {inv.amount})"
+            self.exact_matches.append(
+                (inv.invoice_id, DuplicateMatch(self.seen_keys[key], message))
             )
         else:
-            seen_invoices[key] = inv.invoice_id
+            self.seen_keys[key] = inv.invoice_id
 
-    vendor_groups = defaultdict(list)
-    for inv in invoices:
-        vendor_groups[inv.vendor.lower()].append(inv)
-
-    for vendor, invoices_list in vendor_groups.items():
-        for i in range(len(invoices_list)):
-            for j in range(i + 1, len(invoices_list)):
-                inv1, inv2 = invoices_list[i], invoices_list[j]
-                if (
-                    fuzz.ratio(inv1.description.lower(), inv2.description.lower()) > 80
-                    and fuzz.ratio(inv1.vendor.lower(), inv2.vendor.lower()) > 80
-                    and abs(float(inv1.amount) - float(inv2.amount)) <= 10
-                    and inv1.invoice_id != inv2.invoice_id
-                ):
-                    potential_duplicates.append(
-                        f"Potential duplicate invoices: {inv1.invoice_id} and {inv2.invoice_id} (Similar descriptions & amounts)"
-                    )
-
-    return potential_duplicates
-
-
-def analyze_invoices(invoices: List[Invoice]) -> List[InvoiceFraudReport]:
-    invoice_ids = [inv.invoice_id for inv in invoices]
-    exact_duplicates = {
-        inv_id for inv_id, count in Counter(invoice_ids).items() if count > 1
-    }
-    fuzzy_duplicates = detect_duplicate_invoices(invoices)
-    reports = []
+        vendor = inv.vendor.lower()
+        self.vendor_ids[vendor].append(inv.invoice_id)
+        self.vendor_amounts[vendor].append(float(inv.amount))
+        self.vendor_descriptions[vendor].append(inv.description.lower())
 
-    for inv in invoices:
-        issues = []
-        risk_score = 0
+    def exact_duplicate_ids(self) -> Set[str]:
+        return {
+            inv_id for inv_id, count in self.invoice_id_counts.items() if count > 1
+        }
 
-        if inv.invoice_id in exact_duplicates:
-            risk_score += 30
-            issues.append(
-                FraudIssue(
-                    issue=f"Duplicate invoice {inv.invoice_id} detected.",
-                    severity="High",
-                    risk_increase=30,
-                    recommended_action="Verify before payment.",
-                )
-            )
+    def results(self) -> Tuple[List[str], Dict[str, List[DuplicateMatch]]]:
+        potential_duplicates = []
+        duplicate_index = defaultdict(list)
+
+        for invoice_id, match in self.exact_matches:
+            potential_duplicates.append(match.message)
+            duplicate_index[invoice_id].append(match)
 
-        for duplicate in fuzzy_duplicates:
-            if inv.invoice_id in duplicate:
-                risk_score += 25
-                issues.append(
-                    FraudIssue(
-                        issue=f"Potential duplicate invoice: {duplicate}",
-                        severity="Medium-High",
-                        risk_increase=25,
-                        recommended_action="Manually review for payment fraud.",
-                    )
-                )
-
-        if check_overpricing(inv.amount, inv.gsa_standard):
-            risk_score += 25
-            issues.append(
-                FraudIssue(
-                    issue="Overpricing detected.",
-                    severity="High",
-                    risk_increase=25,
-                    recommended_action="Verify pricing.",
-                )
+        for vendor, ids in self.vendor_ids.items():
+            pairs = find_fuzzy_duplicate_pairs(
+                ids, self.vendor_amounts[vendor], self.vendor_descriptions[vendor]
             )
+            for i, j in pairs:
+                id1, id2 = ids[i], ids[j]
+                message = f"Potential duplicate invoices: {id1} and {id2} (Similar descriptions & amounts)"
+                potential_duplicates.append(message)
+                duplicate_index[id1].append(DuplicateMatch(id2, message))
+                duplicate_index[id2].append(DuplicateMatch(id1, message))
+
+        return potential_duplicates, dict(duplicate_index)
+
+
+def detect_duplicate_invoices(
+    invoices: List[Invoice],
+) -> Tuple[List[str], Dict[str, List[DuplicateMatch]]]:
+    """
+    Returns the duplicate messages plus an index from invoice_id to the
+    duplicate matches that name it, so callers can look up an invoice's
+    partners directly instead of scanning the messages.
+    """
+    tracker = DuplicateTracker()
+    for inv in invoices:
+        tracker.add(inv)
+    return tracker.results()
+
 
-        if is_offshore(inv.payment_routing):
-            risk_score += 35
-            issues.append(
-                FraudIssue(
-                    issue="Offshore payment detected.",
-                    severity="High",
-                    risk_increase=35,
-                    recommended_action="Flag for compliance review.",
-                )
+# -----------------------------------------------------------------------------
+# Historical Duplicates
+# -----------------------------------------------------------------------------
+# Checks against the invoices of earlier uploads (invoice_history.py). The
+# rules match DuplicateTracker's, but each kind is raised at most once per
+# invoice, naming up to HISTORY_MATCH_LIMIT earlier invoices.
+def describe_prior_invoices(matches: List[Tuple[int, str]]) -> str:
+    return ", ".join(f"{invoice_id} (document {document_id})" for document_id, invoice_id in matches)
+
+
+def historical_duplicate_issues(
+    db,
+    user_id: int,
+    invoice_id: str,
+    vendor: str,
+    amount: float,
+    invoice_date: Optional[str],
+    description: str,
+) -> List[FraudIssue]:
+    issues = []
+    key = exact_key(vendor, amount, invoice_date)
+    exact = exact_matches(db, user_id, key)
+    if exact:
+        issues.append(FraudIssue(
+            issue=f"Invoice {invoice_id} matches previously uploaded invoice(s) "
+                  f"{describe_prior_invoices(exact)} (same vendor, amount and date).",
+            severity="High",
+            risk_increase=30,
+            recommended_action="Confirm it has not already been paid.",
+        ))
+
+    # NaN never satisfies the amount window
+    if amount != amount:
+        return issues
+    description = description.lower()
+    signature = None
+    similar = []
+    for document_id, prior_id, prior_key, prior_description in fuzzy_candidates(
+        db, user_id, vendor.lower(), amount, FUZZY_AMOUNT_WINDOW, len(description)
+    ):
+        if prior_key == key:
+            continue  # already reported as an exact match
+        if prior_description != description:
+            if signature is None:
+                signature = Counter(description)
+            common = sum((signature & Counter(prior_description)).values())
+            if ratio_upper_bound(len(description), len(prior_description), common) <= FUZZY_RATIO_THRESHOLD:
+                continue
+            if fuzz.ratio(description, prior_description) <= FUZZY_RATIO_THRESHOLD:
+                continue
+        similar.append((document_id, prior_id))
+        if len(similar) == HISTORY_MATCH_LIMIT:
+            break
+    if similar:
+        issues.append(FraudIssue(
+            issue=f"Invoice {invoice_id} resembles previously uploaded invoice(s) "
+                  f"{describe_prior_invoices(similar)} (similar description & amount).",
+            severity="Medium-High",
+            risk_increase=25,
+            recommended_action="Compare with the earlier submission before payment.",
+        ))
+    return issues
+
+
+def lookup_invoice_history(
+    database_url: str,
+    user_id: int,
+    invoices: Iterable[Tuple[str, str, float, Optional[str], str]],
+) -> List[List[FraudIssue]]:
+    """
+    Historical duplicate issues for (invoice_id, vendor, amount, invoice_date,
+    description) tuples against the user's earlier uploads, on a private
+    read-only connection so it can run in the process pool or a streaming
+    response.
+    """
+    with closing(connect(database_url, readonly=True)) as db:
+        return [historical_duplicate_issues(db, user_id, *invoice) for invoice in invoices]
+
+
+def risk_assessment(risk_score: int) -> Tuple[str, str]:
+    """Risk level and final recommendation for a capped risk score."""
+    risk_level = (
+        "Fraud Detected 🔴"
+        if risk_score >= 80
+        else "Suspicious 🟡" if risk_score >= 40 else "Safe 🟢"
+    )
+    final_recommendation = (
+        "Immediate review required."
+        if risk_score >= 80
+        else "Review before payment." if risk_score >= 40 else "Likely safe."
+    )
+    return risk_level, final_recommendation
+
+
+def score_invoice(
+    inv: Invoice,
+    exact_duplicates: Set[str],
+    duplicate_index: Dict[str, List[DuplicateMatch]],
+    history_issues: Sequence[FraudIssue] = (),
+) -> InvoiceFraudReport:
+    issues = []
+    risk_score = 0
+
+    if inv.invoice_id in exact_duplicates:
+        risk_score += 30
+        issues.append(
+            FraudIssue(
+                issue=f"Duplicate invoice {inv.invoice_id} detected.",
+                severity="High",
+                risk_increase=30,
+                recommended_action="Verify before payment.",
             )
+        )
 
-        if inv.payment_delay_days:
-            if inv.payment_delay_days > 30:
-                risk_score += 30
-            elif inv.payment_delay_days > 15:
-                risk_score += 20
-            elif inv.payment_delay_days > 5:
-                risk_score += 10
-            issues.append(
-                FraudIssue(
-                    issue="Detected payment delays.",
-                    severity="Medium",
-                    risk_increase=10,
-                    recommended_action="Review payment timelines.",
-                )
+    for match in duplicate_index.get(inv.invoice_id, ()):
+        risk_score += 25
+        issues.append(
+            FraudIssue(
+                issue=f"Potential duplicate invoice: {match.message}",
+                severity="Medium-High",
+                risk_increase=25,
+                recommended_action="Manually review for payment fraud.",
             )
+        )
+
+    for issue in history_issues:
+        risk_score += issue.risk_increase
+        issues.append(issue)
+
+    if check_overpricing(inv.amount, inv.gsa_standard):
+        risk_score += 25
+        issues.append(OVERPRICING_ISSUE)
+
+    if is_offshore(inv.payment_routing):
+        risk_score += 35
+        issues.append(OFFSHORE_ISSUE)
 
-        if inv.early_payment_requested:
+    if inv.payment_delay_days:
+        if inv.payment_delay_days > 30:
+            risk_score += 30
+        elif inv.payment_delay_days > 15:
             risk_score += 20
-            issues.append(
-                FraudIssue(
-                    issue="Invoice requests early payment.",
-                    severity="High",
-                    risk_increase=20,
-                    recommended_action="Ensure service completion first.",
-                )
-            )
+        elif inv.payment_delay_days > 5:
+            risk_score += 10
+        issues.append(PAYMENT_DELAY_ISSUE)
 
-        if not inv.supporting_documents:
-            risk_score += 25
-            issues.append(
-                FraudIssue(
-                    issue="Missing supporting documentation.",
-                    severity="High",
-                    risk_increase=25,
-                    recommended_action="Request proof of delivery.",
-                )
-            )
+    if inv.early_payment_requested:
+        risk_score += 20
+        issues.append(EARLY_PAYMENT_ISSUE)
+
+    if not inv.supporting_documents:
+        risk_score += 25
+        issues.append(MISSING_DOCS_ISSUE)
+
+    risk_score = min(risk_score, 100)
+    risk_level, final_recommendation = risk_assessment(risk_score)
+    return InvoiceFraudReport(
+        invoice_id=inv.invoice_id,
+        risk_score=risk_score,
+        risk_level=risk_level,
+        issues=issues,
+        final_recommendation=final_recommendation,
+    )
+
+
+def analyze_invoices(
+    invoices: List[Invoice], history: Optional[List[List[FraudIssue]]] = None
+) -> List[InvoiceFraudReport]:
+    """history: historical duplicate issues per invoice (lookup_invoice_history)."""
+    tracker = DuplicateTracker()
+    for inv in invoices:
+        tracker.add(inv)
+    exact_duplicates = tracker.exact_duplicate_ids()
+    _, duplicate_index = tracker.results()
+
+    if history is None:
+        history = [()] * len(invoices)
+    return [
+        score_invoice(inv, exact_duplicates, duplicate_index, history_issues)
+        for inv, history_issues in zip(invoices, history)
+    ]
+
+# -----------------------------------------------------------------------------
+# Columnar Engine
+# -----------------------------------------------------------------------------
+# Alternative to parse_csv_invoices + analyze_invoices for large files: the CSV
+# is loaded into columns, every rule is evaluated as a boolean mask over the
+# whole batch and report objects are only built once scoring is done. The
+# output is identical to the row engine.
+INVOICE_FIELDS = (
+    "invoice_id",
+    "vendor",
+    "amount",
+    "gsa_standard",
+    "payment_routing",
+    "invoice_date",
+    "payment_delay_days",
+    "early_payment_requested",
+    "supporting_documents",
+    "description",
+)
+
+OFFSHORE_PATTERN = "|".join(re.escape(country) for country in FLAGGED_COUNTRIES)
+
+
+def convert_column(values: Sequence[str], convert, bad_rows: Set[int]) -> list:
+    """
+    Apply `convert` to a whole column, recording rows that fail so they can be
+    dropped the way parse_csv_invoices skips them.
+    """
+    try:
+        return list(map(convert, values))
+    except Exception:
+        converted = []
+        for row_index, value in enumerate(values):
+            try:
+                converted.append(convert(value))
+            except Exception:
+                converted.append(None)
+                bad_rows.add(row_index)
+        return converted
+
+
+def parse_bool_column(values: Sequence[str]) -> List[bool]:
+    return list(map("true".__eq__, map(str.lower, map(str.strip, values))))
+
+
+def parse_csv_block(header: List[str], rows: List[List[str]], columns: Dict[str, list]) -> None:
+    """Convert a block of well-formed CSV rows column by column."""
+    if not rows:
+        return
+    # Like csv.DictReader, a repeated header name maps to its last column.
+    positions = {name: pos for pos, name in enumerate(header)}
+    raw_columns = list(zip(*rows))
+
+    def raw(name, default):
+        if name in positions:
+            return raw_columns[positions[name]]
+        return (default,) * len(rows)
 
-        risk_score = min(risk_score, 100)
-        risk_level = (
-            "Fraud Detected 🔴"
-            if risk_score >= 80
-            else "Suspicious 🟡" if risk_score >= 40 else "Safe 🟢"
+    # float()/int() ignore surrounding whitespace exactly like str.strip(), so
+    # the numeric columns can be converted with a C-level map.
+    bad_rows = set()
+    parsed = {
+        "invoice_id": list(map(str.strip, raw("invoice_id", ""))),
+        "vendor": list(map(str.strip, raw("vendor", ""))),
+        "amount": convert_column(raw("amount", "0"), float, bad_rows),
+        "gsa_standard": convert_column(raw("gsa_standard", "0"), float, bad_rows),
+        "payment_routing": list(map(str.strip, raw("payment_routing", ""))),
+        "invoice_date": list(map(str.strip, raw("invoice_date", ""))),
+        "payment_delay_days": convert_column(
+            raw("payment_delay_days", None),
+            lambda v: int(v) if v else None,
+            bad_rows,
+        ),
+        "early_payment_requested": parse_bool_column(raw("early_payment_requested", "False")),
+        "supporting_documents": parse_bool_column(raw("supporting_documents", "True")),
+        "description": list(map(str.strip, raw("description", ""))),
+    }
+
+    for row_index in sorted(bad_rows):
+        print(f"Error processing row {dict(zip(header, rows[row_index]))}: invalid value")
+    for field in INVOICE_FIELDS:
+        values = parsed[field]
+        if bad_rows:
+            values = [v for i, v in enumerate(values) if i not in bad_rows]
+        columns[field].extend(values)
+
+
+def parse_csv_columns(file_data: bytes) -> Dict[str, list]:
+    """
+    Columnar equivalent of parse_csv_invoices: returns one list per Invoice
+    field, holding exactly the values the row parser would produce.
+    """
+    text = file_data.decode("utf-8")
+    reader = csv.reader(io.StringIO(text))
+    columns = {field: [] for field in INVOICE_FIELDS}
+    header = next(reader, None)
+    if header is None:
+        return columns
+
+    block = []
+    for row in reader:
+        if not row:
+            continue
+        if len(row) == len(header):
+            block.append(row)
+        else:
+            # Short or long rows keep csv.DictReader semantics via the row parser.
+            parse_csv_block(header, block, columns)
+            block = []
+            row_dict = dict(zip(header, row))
+            if len(row) > len(header):
+                row_dict[None] = row[len(header):]
+            else:
+                for name in header[len(row):]:
+                    row_dict[name] = None
+            try:
+                inv = parse_invoice_row(row_dict)
+            except Exception as e:
+                print(f"Error processing row {row_dict}: {e}")
+                continue
+            for field in INVOICE_FIELDS:
+                columns[field].append(getattr(inv, field))
+    parse_csv_block(header, block, columns)
+    return columns
+
+
+def description_histograms(descriptions: List[str], lengths: np.ndarray) -> np.ndarray:
+    """Character-count matrix (one row per description) for the multiset bound."""
+    codepoints = np.frombuffer("".join(descriptions).encode("utf-32-le"), dtype=np.uint32)
+    alphabet, char_codes = np.unique(codepoints, return_inverse=True)
+    width = max(len(alphabet), 1)
+    rows = np.repeat(np.arange(len(descriptions)), lengths)
+    counts = np.bincount(rows * width + char_codes, minlength=len(descriptions) * width)
+    return counts.reshape(len(descriptions), width).astype(np.int32)
+
+
+class DescriptionIndex:
+    """
+    Factorized lower-cased descriptions for the columnar engine, with lazily
+    built character histograms and a cache of exact fuzz.ratio scores.
+    """
+
+    def __init__(self, descriptions: List[str]):
+        codes, values = pd.factorize(
+            pd.Series([d.lower() for d in descriptions], dtype=object)
         )
-        final_recommendation = (
-            "Immediate review required."
-            if risk_score >= 80
-            else "Review before payment." if risk_score >= 40 else "Likely safe."
+        self.codes = codes
+        self.values = list(values)
+        self.lengths = np.fromiter(
+            (len(d) for d in self.values), dtype=np.int64, count=len(self.values)
         )
-        reports.append(
-            InvoiceFraudReport(
-                invoice_id=inv.invoice_id,
-                risk_score=risk_score,
-                risk_level=risk_level,
-                issues=issues,
-                final_recommendation=final_recommendation,
-            )
+        self.histograms = None
+        self.ratio_cache = {}
+
+    def common_characters(self, desc1: np.ndarray, desc2: np.ndarray) -> np.ndarray:
+        if self.histograms is None:
+            self.histograms = description_histograms(self.values, self.lengths)
+        common = np.empty(len(desc1), dtype=np.int64)
+        for start in range(0, len(desc1), 65536):
+            chunk = slice(start, start + 65536)
+            common[chunk] = np.minimum(
+                self.histograms[desc1[chunk]], self.histograms[desc2[chunk]]
+            ).sum(axis=1)
+        return common
+
+    def ratio(self, code1: int, code2: int) -> int:
+        score = self.ratio_cache.get((code1, code2))
+        if score is None:
+            # Codes differ and empty descriptions never survive the bounds, so
+            # fuzz.ratio's None/equal/empty guards can be skipped.
+            matcher = fuzz.SequenceMatcher(None, self.values[code1], self.values[code2])
+            score = int(round(100 * matcher.ratio()))
+            self.ratio_cache[(code1, code2)] = score
+        return score
+
+
+def ratio_upper_bounds(len1: np.ndarray, len2: np.ndarray, common: np.ndarray) -> np.ndarray:
+    """Vectorized ratio_upper_bound (same float operations and rounding)."""
+    return np.round(100 * 2.0 * common / np.maximum(len1 + len2, 1))
+
+
+def columnar_fuzzy_pairs(
+    rows: np.ndarray,
+    id_codes: np.ndarray,
+    amounts: np.ndarray,
+    descriptions: DescriptionIndex,
+) -> np.ndarray:
+    """
+    Vectorized find_fuzzy_duplicate_pairs for one vendor group. `rows` are the
+    group's row numbers in upload order; returns an (m, 2) array of row pairs
+    sorted the same way as the row engine.
+    """
+    group_amounts = amounts[rows]
+    finite = np.flatnonzero(np.isfinite(group_amounts))
+    order = finite[np.argsort(group_amounts[finite], kind="stable")]
+    sorted_amounts = group_amounts[order]
+
+    # Generous window end from searchsorted, then the exact float test.
+    slack = FUZZY_AMOUNT_WINDOW + 1e-9 * (1.0 + np.abs(sorted_amounts))
+    ends = np.searchsorted(sorted_amounts, sorted_amounts + slack, side="right")
+    counts = np.maximum(ends - np.arange(len(order)) - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    left = np.repeat(np.arange(len(order)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = left + 1 + offsets
+    in_window = sorted_amounts[right] - sorted_amounts[left] <= FUZZY_AMOUNT_WINDOW
+    left, right = order[left[in_window]], order[right[in_window]]
+    first = rows[np.minimum(left, right)]
+    second = rows[np.maximum(left, right)]
+
+    keep = id_codes[first] != id_codes[second]
+    first, second = first[keep], second[keep]
+
+    desc1, desc2 = descriptions.codes[first], descriptions.codes[second]
+    matched = desc1 == desc2
+
+    # Lossless pruning: length bound, then character multiset bound.
+    check = np.flatnonzero(~matched)
+    len1, len2 = descriptions.lengths[desc1[check]], descriptions.lengths[desc2[check]]
+    check = check[ratio_upper_bounds(len1, len2, np.minimum(len1, len2)) > FUZZY_RATIO_THRESHOLD]
+    len1, len2 = descriptions.lengths[desc1[check]], descriptions.lengths[desc2[check]]
+    common = descriptions.common_characters(desc1[check], desc2[check])
+    check = check[ratio_upper_bounds(len1, len2, common) > FUZZY_RATIO_THRESHOLD]
+
+    # Exact fuzz.ratio, once per distinct (description, description) pair.
+    pair_keys = desc1[check].astype(np.int64) * len(descriptions.values) + desc2[check]
+    unique_keys, inverse = np.unique(pair_keys, return_inverse=True)
+    scores = np.fromiter(
+        (
+            descriptions.ratio(*divmod(key, len(descriptions.values)))
+            for key in unique_keys.tolist()
+        ),
+        dtype=np.int64,
+        count=len(unique_keys),
+    )
+    matched[check] = scores[inverse] > FUZZY_RATIO_THRESHOLD
+
+    pairs = np.column_stack((first[matched], second[matched]))
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def analyze_invoice_columns(
+    columns: Dict[str, list], history: Optional[List[List[FraudIssue]]] = None
+) -> List[dict]:
+    """
+    Columnar equivalent of analyze_invoices(parse_csv_invoices(...), history).
+    Returns the reports as dicts, exactly as InvoiceFraudReport.dict() would
+    give them; the issue dicts of the fixed rules are shared between reports.
+    """
+    ids = columns["invoice_id"]
+    vendors = columns["vendor"]
+    amount_values = columns["amount"]
+    n = len(ids)
+    if n == 0:
+        return []
+    if history is None:
+        history = [()] * n
+
+    amounts = np.asarray(amount_values, dtype=float)
+    gsa_standard = np.asarray(columns["gsa_standard"], dtype=float)
+    id_codes, _ = pd.factorize(pd.Series(ids, dtype=object))
+    exact_mask = pd.Series(id_codes).duplicated(keep=False).to_numpy()
+
+    # Exact duplicate messages, in upload order.
+    vendor_lower = [vendor.lower() for vendor in vendors]
+    keys = [
+        f"{vendor}_{amount}_{date}"
+        for vendor, amount, date in zip(vendor_lower, amount_values, columns["invoice_date"])
+    ]
+    key_codes, _ = pd.factorize(pd.Series(keys, dtype=object))
+    # Only the messages are needed here, so the index maps ids to messages.
+    duplicate_messages = defaultdict(list)
+    for row in np.flatnonzero(pd.Series(key_codes).duplicated().to_numpy()):
+        duplicate_messages[ids[row]].append(
+            f"Exact duplicate found: {ids[row]} (Vendor: {vendors[row]}, Amount: {amount_values[row]})"
         )
 
+    # Fuzzy duplicate pairs, vendor groups in order of first appearance.
+    descriptions = DescriptionIndex(columns["description"])
+    vendor_codes, _ = pd.factorize(pd.Series(vendor_lower, dtype=object))
+    by_vendor = np.argsort(vendor_codes, kind="stable")
+    boundaries = np.flatnonzero(np.diff(vendor_codes[by_vendor])) + 1
+    for rows in np.split(by_vendor, boundaries):
+        pairs = columnar_fuzzy_pairs(rows, id_codes, amounts, descriptions)
+        for row1, row2 in pairs.tolist():
+            id1, id2 = ids[row1], ids[row2]
+            message = f"Potential duplicate invoices: {id1} and {id2} (Similar descriptions & amounts)"
+            duplicate_messages[id1].append(message)
+            duplicate_messages[id2].append(message)
+
+    # Rule masks.
+    duplicate_counts = np.fromiter(
+        (len(duplicate_messages.get(inv_id, ())) for inv_id in ids), dtype=np.int64, count=n
+    )
+    overpriced = amounts > gsa_standard * 1.3
+    offshore = (
+        pd.Series(columns["payment_routing"], dtype=object)
+        .str.lower()
+        .str.contains(OFFSHORE_PATTERN, regex=True)
+        .to_numpy(dtype=bool)
+    )
+    delays = np.array(
+        [np.nan if days is None else days for days in columns["payment_delay_days"]],
+        dtype=float,
+    )
+    delayed = ~np.isnan(delays) & (delays != 0)
+    delay_points = np.select([delays > 30, delays > 15, delays > 5], [30, 20, 10], 0)
+    early = np.asarray(columns["early_payment_requested"], dtype=bool)
+    missing_docs = ~np.asarray(columns["supporting_documents"], dtype=bool)
+
+    history_points = np.fromiter(
+        (sum(issue.risk_increase for issue in issues) for issues in history),
+        dtype=np.int64, count=n,
+    )
+    risk_scores = np.minimum(
+        30 * exact_mask
+        + 25 * duplicate_counts
+        + history_points
+        + 25 * overpriced
+        + 35 * offshore
+        + np.where(delayed, delay_points, 0)
+        + 20 * early
+        + 25 * missing_docs,
+        100,
+    ).tolist()
+
+    # Report payloads are only built once every score is known. The fixed-rule
+    # issues only depend on five flags, so their lists are precomputed per
+    # flag combination.
+    fixed_issues = [issue.dict() for issue in (
+        OVERPRICING_ISSUE, OFFSHORE_ISSUE, PAYMENT_DELAY_ISSUE,
+        EARLY_PAYMENT_ISSUE, MISSING_DOCS_ISSUE,
+    )]
+    issue_lists = [
+        [issue for bit, issue in enumerate(fixed_issues) if combination & (1 << bit)]
+        for combination in range(1 << len(fixed_issues))
+    ]
+    combinations = (
+        overpriced.astype(np.int64)
+        | offshore.astype(np.int64) << 1
+        | delayed.astype(np.int64) << 2
+        | early.astype(np.int64) << 3
+        | missing_docs.astype(np.int64) << 4
+    ).tolist()
+
+    assessments = {}
+    reports = []
+    for inv_id, risk_score, exact, combination, history_issues in zip(
+        ids, risk_scores, exact_mask.tolist(), combinations, history
+    ):
+        messages = duplicate_messages.get(inv_id)
+        if exact or messages or history_issues:
+            issues = []
+            if exact:
+                issues.append({
+                    "issue": f"Duplicate invoice {inv_id} detected.",
+                    "severity": "High",
+                    "risk_increase": 30,
+                    "recommended_action": "Verify before payment.",
+                })
+            for message in messages or ():
+                issues.append({
+                    "issue": f"Potential duplicate invoice: {message}",
+                    "severity": "Medium-High",
+                    "risk_increase": 25,
+                    "recommended_action": "Manually review for payment fraud.",
+                })
+            issues.extend(issue.dict() for issue in history_issues)
+            issues.extend(issue_lists[combination])
+        else:
+            issues = issue_lists[combination].copy()
+        assessment = assessments.get(risk_score)
+        if assessment is None:
+            assessment = assessments[risk_score] = risk_assessment(risk_score)
+        reports.append({
+            "invoice_id": inv_id,
+            "risk_score": risk_score,
+            "risk_level": assessment[0],
+            "issues": issues,
+            "final_recommendation": assessment[1],
+        })
     return reports
 
+
+def invoice_dicts_from_columns(columns: Dict[str, list]) -> List[dict]:
+    """The parsed_invoices payload (same as inv.dict()) built from columns."""
+    return [
+        dict(zip(INVOICE_FIELDS, values))
+        for values in zip(*(columns[field] for field in INVOICE_FIELDS))
+    ]
+
+
+class CsvAnalysis(NamedTuple):
+    invoices_json: str
+    reports_json: str
+    highest_risk_score: int
+    findings: List[FindingRow]
+    history: List[HistoryRow]
+
+
+def analyze_csv_bytes(
+    file_data: bytes,
+    columnar: bool = False,
+    database_url: Optional[str] = None,
+    user_id: Optional[int] = None,
+) -> CsvAnalysis:
+    """
+    Parse and score an uploaded CSV. Returns the invoices and reports already
+    serialized as JSON arrays, the highest risk score and the rows for
+    invoice_findings and invoice_history. Module-level so the upload endpoint
+    can run it in the process pool; serializing there keeps multi-megabyte
+    payloads off the event loop. With database_url, invoices are also checked
+    against the earlier uploads of user_id.
+    """
+    if columnar:
+        columns = parse_csv_columns(file_data)
+        invoice_dicts = invoice_dicts_from_columns(columns)
+    else:
+        invoices = parse_csv_invoices(file_data)
+        invoice_dicts = [inv.dict() for inv in invoices]
+
+    history = None
+    if database_url is not None:
+        history = lookup_invoice_history(database_url, user_id, (
+            (inv["invoice_id"], inv["vendor"], inv["amount"], inv["invoice_date"], inv["description"])
+            for inv in invoice_dicts
+        ))
+
+    if columnar:
+        report_dicts = analyze_invoice_columns(columns, history)
+    else:
+        report_dicts = [report.dict() for report in analyze_invoices(invoices, history)]
+    highest_risk_score = max(report["risk_score"] for report in report_dicts)
+    findings = [
+        row
+        for invoice, report in zip(invoice_dicts, report_dicts)
+        for row in finding_rows(invoice, report)
+    ]
+    return CsvAnalysis(
+        json.dumps(invoice_dicts),
+        json.dumps(report_dicts),
+        highest_risk_score,
+        findings,
+        [history_row(invoice) for invoice in invoice_dicts],
+    )
+
+
+def overall_risk_level(highest_risk_score: int) -> str:
+    return (
+        "HIGH" if highest_risk_score >= 80
+        else "MEDIUM" if highest_risk_score >= 40
+        else "LOW"
+    )
+
+
+@timed("db_insert_csv")
+def store_invoice_document(
+    user_id: int,
+    filename: str,
+    risk_level: str,
+    report_data: Union[str, CompressedReport],
+    findings: Iterable[FindingRow],
+    history: Iterable[HistoryRow],
+) -> int:
+    """
+    Store the document, its report, its findings and its invoices' entries in
+    the duplicate history in one transaction.
+    """
+    with get_db() as db:
+        document_id = insert_document(user_id, filename, 'invoice', risk_level, report_data)
+        save_findings(db, document_id, user_id, findings)
+        save_history(db, document_id, user_id, history)
+    return document_id
+
+
+def stream_csv_analysis(file: UploadFile, user_id: int) -> Iterator[str]:
+    """
+    Streaming variant of the CSV upload. The spooled upload is read twice: the
+    first pass only feeds the DuplicateTracker, the second scores each invoice
+    and emits it as an NDJSON line. Parsed invoices, reports and the
+    findings/history rows are spooled to temporary files and then gzipped into
+    the stored report or bulk inserted, instead of being kept as objects.
+    """
+    tracker = DuplicateTracker()
+    for inv in iter_csv_invoices_from_file(file.file):
+        tracker.add(inv)
+    exact_duplicates = tracker.exact_duplicate_ids()
+    _, duplicate_index = tracker.results()
+    del tracker
+
+    highest_risk_score = 0
+    invoice_count = 0
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as invoices_spool, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as analysis_spool, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as findings_spool, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as history_spool, \
+            closing(connect(database.DATABASE_URL, readonly=True)) as history_db:
+        for inv in iter_csv_invoices_from_file(file.file):
+            history_issues = historical_duplicate_issues(
+                history_db, user_id, inv.invoice_id, inv.vendor, inv.amount, inv.invoice_date, inv.description
+            )
+            report = score_invoice(inv, exact_duplicates, duplicate_index, history_issues)
+            highest_risk_score = max(highest_risk_score, report.risk_score)
+
+            separator = ", " if invoice_count else ""
+            invoice_dict = inv.dict()
+            report_dict = report.dict()
+            invoice_json = json.dumps(invoice_dict)
+            report_json = json.dumps(report_dict)
+            invoices_spool.write(separator + invoice_json)
+            analysis_spool.write(separator + report_json)
+            for row in finding_rows(invoice_dict, report_dict):
+                findings_spool.write(json.dumps(row) + "\n")
+            history_spool.write(json.dumps(history_row(invoice_dict)) + "\n")
+            invoice_count += 1
+
+            yield f'{{"invoice": {invoice_json}, "report": {report_json}}}\n'
+
+        # Same layout as json.dumps({"invoices": [...], "analysis": [...]}),
+        # compressed as it is assembled so the full text is never in memory.
+        invoices_spool.seek(0)
+        analysis_spool.seek(0)
+        writer = ReportWriter()
+        writer.write('{"invoices": [')
+        writer.copy_from(invoices_spool)
+        writer.write('], "analysis": [')
+        writer.copy_from(analysis_spool)
+        writer.write("]}")
+        report_data = writer.finish()
+
+        risk_level = overall_risk_level(highest_risk_score)
+        findings_spool.seek(0)
+        history_spool.seek(0)
+        document_id = store_invoice_document(
+            user_id, file.filename, risk_level, report_data,
+            (json.loads(line) for line in findings_spool),
+            (json.loads(line) for line in history_spool),
+        )
+    yield json.dumps({
+        "document_id": document_id,
+        "risk_level": risk_level,
+        "invoice_count": invoice_count,
+    }) + "\n"
+
+
 @router.post("/upload-csv-invoices/")
 async def upload_csv_invoices(
     file: UploadFile = File(...),
+    stream: bool = False,
+    columnar: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Upload a CSV file for invoice fraud analysis and store results."""
+    """
+    Upload a CSV file for invoice fraud analysis and store results.
+
+    With ?stream=true the upload is parsed incrementally and the response is
+    NDJSON: one {"invoice", "report"} line per invoice followed by a summary
+    line with the document_id. With ?columnar=true the batch is scored by the
+    vectorized columnar engine instead of row by row; the output is the same.
+    """
+    if stream:
+        return StreamingResponse(
+            stream_csv_analysis(file, current_user.id),
+            media_type="application/x-ndjson",
+        )
+
     file_data = await file.read()
-    invoices = parse_csv_invoices(file_data)
-    analysis_report = analyze_invoices(invoices)
-    
+    # Parsing and scoring are CPU-bound: run them in the process pool
+    with stage("csv_analysis", nbytes=len(file_data)):
+        analysis = await run_cpu(
+            analyze_csv_bytes, file_data, columnar, database.DATABASE_URL, current_user.id
+        )
+
     # Calculate overall risk level based on analysis
-    highest_risk_score = max(report.risk_score for report in analysis_report)
-    risk_level = (
-        "HIGH" if highest_risk_score >= 80
-        else "MEDIUM" if highest_risk_score >= 40
-        else "LOW"
-    )
+    risk_level = overall_risk_level(analysis.highest_risk_score)
 
-    # Store the document and analysis in the database
-    with get_db() as db:
-        cursor = db.execute('''
-        INSERT INTO documents (
-            user_id,
-            document_name,
-            document_type,
-            upload_date,
-            status,
-            risk_level,
-            report_data
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            current_user.id,
-            file.filename,
-            'invoice',
-            datetime.utcnow().isoformat(),
-            'processed',
-            risk_level,
-            json.dumps({"invoices": [inv.dict() for inv in invoices],
-                    "analysis": [report.dict() for report in analysis_report]})
-        ))
-        document_id = cursor.lastrowid
+    # Store the document and analysis in the database. Same layout as
+    # json.dumps({"invoices": [...], "analysis": [...]}).
+    document_id = await run_io(
+        store_invoice_document,
+        current_user.id,
+        file.filename,
+        risk_level,
+        '{"invoices": ' + analysis.invoices_json + ', "analysis": ' + analysis.reports_json + '}',
+        analysis.findings,
+        analysis.history,
+    )
 
-    return {
-        "document_id": document_id,
-        "parsed_invoices": [inv.dict() for inv in invoices],
-        "analysis_report": [report.dict() for report in analysis_report]
-    }
\ No newline at end of file
+    return Response(
+        content=(
+            f'{{"document_id": {document_id}, "parsed_invoices": {analysis.invoices_json}, '
+            f'"analysis_report": {analysis.reports_json}}}'
+        ),
+        media_type="application/json",
+    )
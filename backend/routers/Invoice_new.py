@@ -3,26 +3,34 @@
 import os
 import logging
 import pandas as pd
-import fitz  # PyMuPDF
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from openai import OpenAI
+from llm_gateway import openai_client
 
 # Database and auth (adjust to your actual imports)
-from database import get_db
+from database import insert_document
+from executors import run_io
+from metrics import stage
+from jobs import StatusCallback, ignore_status, job_queue
+from extraction import extract_pdf
+from llm_cache import structured_chat_completion
+from case_catalog import CompiledTestCases, TestCaseCatalog
+from compliance_results import (
+    ComplianceResult,
+    TestCaseAssessment,
+    test_case_outcome,
+)
 from .auth import get_current_user, User
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
 # ---------------------------------------------------------------------------
-# Initialize OpenAI client (Python style, matching your "latest version" usage)
+# OpenAI client (shared by all routers, see llm_gateway.py)
 # ---------------------------------------------------------------------------
-openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not os.getenv("OPENAI_API_KEY"):
-    logging.warning("Warning: OPENAI_API_KEY is not set in environment variables.")
+openai = openai_client  # shared; limits and retries in llm_gateway.py
 
 # ---------------------------------------------------------------------------
 # Create the FastAPI router
@@ -51,19 +59,31 @@ def load_test_cases(
         logging.error("Error loading test cases from Excel: %s", e)
         raise HTTPException(status_code=500, detail="Failed to load test cases from Excel.")
 
+def compile_invoice_test_cases(excel_path: str) -> List[dict]:
+    return load_test_cases(excel_path).to_dict('records')
+
+def render_invoice_test_cases(records: List[dict]) -> str:
+    """Test cases as a plain-text table, as DataFrame.to_string lays them out."""
+    return pd.DataFrame(records).to_string(index=False)
+
+# Parsed once, re-parsed when the workbook's mtime changes
+invoice_test_cases = TestCaseCatalog(
+    "comparison_data_excel/Test cases invoices.xlsx",
+    compile_invoice_test_cases,
+    render_invoice_test_cases,
+)
+
 # ---------------------------------------------------------------------------
-# Helper function: Extract text from PDF using PyMuPDF (fitz)
+# Helper function: Extract text from PDF (shared extraction module)
 # ---------------------------------------------------------------------------
 def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
     """
-    Extract text from a PDF invoice given as bytes.
+    Extract text from a PDF invoice given as bytes (PyMuPDF text layer, with
+    OCR for scanned pages).
     """
     try:
-        text = ""
-        # Open from bytes stream
-        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-            for page in doc:
-                text += page.get_text("text") + "\n"
+        # Text layer first; pages without text go through OCR
+        text = "".join(page + "\n" for page in extract_pdf(file_bytes).pages)
         if not text.strip():
             logging.warning("No text was extracted from the PDF.")
         return text
@@ -74,13 +94,16 @@ def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
 # ---------------------------------------------------------------------------
 # Helper function: Analyze invoice with OpenAI
 # ---------------------------------------------------------------------------
-def analyze_invoice_with_openai(invoice_text: str, test_cases: pd.DataFrame) -> str:
+async def analyze_invoice_with_openai(
+    invoice_text: str, test_cases: CompiledTestCases
+) -> TestCaseAssessment:
     """
     Use the OpenAI API to determine which test cases the invoice fails,
-    considering risk levels and scenarios.
+    considering risk levels and scenarios. The answer is constrained to the
+    TestCaseAssessment JSON schema.
     """
-    # Format test cases as a string for inclusion in the prompt
-    test_cases_str = test_cases.to_string(index=False)
+    # The catalog's test cases most relevant to this invoice (TEST_CASE_TOP_K)
+    test_cases_str = test_cases.prompt_for(invoice_text)
 
     # Build the prompt for the OpenAI API
     prompt = (
@@ -90,32 +113,67 @@ def analyze_invoice_with_openai(invoice_text: str, test_cases: pd.DataFrame) ->
         f"{invoice_text}\n\n"
         "Test Cases:\n"
         f"{test_cases_str}\n\n"
-        "Return the failed test case details in the following format:\n"
-        "Test Case ID | Test Case Name | Risk Level | Description\n"
+        "List only the failed test cases, by their Test Case ID, each with a brief reason.\n"
     )
 
     try:
-        response = openai.chat.completions.create(
+        # Deterministic (temperature 0), so repeat checks hit the LLM cache
+        assessment = await structured_chat_completion(
+            openai,
+            TestCaseAssessment,
             model="gpt-4o",  # Adjust to your preferred model
             messages=[
                 {"role": "system", "content": "You are an expert invoice compliance checker."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0
+            temperature=0,
         )
-        answer = response.choices[0].message.content
         logging.info("Received response from OpenAI API.")
-        return answer.strip()
+    except ValueError as e:
+        # Not matching the schema, even after a retry
+        logging.error("Invalid OpenAI answer: %s", e)
+        raise HTTPException(status_code=502, detail="OpenAI returned an invalid test case assessment.")
     except Exception as e:
         logging.error("Error during OpenAI API call: %s", e)
         raise HTTPException(status_code=500, detail="OpenAI API call failed.")
+    return assessment
 
 # ---------------------------------------------------------------------------
 # FastAPI Endpoint
 # ---------------------------------------------------------------------------
+async def process_invoice_compliance(
+    file_bytes: bytes, filename: str, set_status: StatusCallback = ignore_status
+) -> Tuple[str, str, ComplianceResult]:
+    """
+    Extract the invoice text, check it against the Excel test cases and derive
+    a risk level. Returns (risk_level, analysis_result, compliance result).
+    Used inline by the endpoint and as the 'invoice_test_check' job handler.
+    """
+    # Extract the PDF text
+    await set_status("extracting")
+    with stage("extract", nbytes=len(file_bytes)):
+        invoice_text = await run_io(extract_text_from_pdf_bytes, file_bytes)
+    if not invoice_text.strip():
+        raise HTTPException(status_code=400, detail="No text extracted from PDF invoice.")
+
+    # Test cases from the Excel catalog (parsed once, not per request)
+    await set_status("analyzing")
+    with stage("test_cases_load"):
+        test_cases = await invoice_test_cases.get()
+
+    # Analyze the invoice with OpenAI
+    with stage("test_case_check"):
+        assessment = await analyze_invoice_with_openai(invoice_text, test_cases)
+
+    # Risk level: the highest catalog Risk Level among the failed test cases
+    return test_case_outcome(assessment, test_cases.records)
+
+job_queue.register('invoice_test_check', process_invoice_compliance)
+
 @router.post("/check_invoice_compliance/")
 async def check_invoice_compliance_endpoint(
     file: UploadFile = File(...),
+    background: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -124,10 +182,10 @@ async def check_invoice_compliance_endpoint(
     3. Loads test cases from an Excel file.
     4. Analyzes the invoice text with OpenAI to find which test cases it fails.
     5. Stores the analysis in the 'documents' table and returns the result.
-    """
 
-    # Hard-coded path to your Excel file (adjust as needed)
-    excel_file_path = "comparison_data_excel/Test cases invoices.xlsx"
+    With ?background=true steps 2-5 run in the job queue and the response is
+    {"document_id", "status": "queued"}; poll /documents/document/{document_id}.
+    """
 
     # Step 1: Read file bytes
     file_bytes = await file.read()
@@ -140,47 +198,32 @@ async def check_invoice_compliance_endpoint(
             detail="Unsupported file format. Only PDF is allowed for invoices."
         )
 
-    # Extract the PDF text
-    invoice_text = extract_text_from_pdf_bytes(file_bytes)
-    if not invoice_text.strip():
-        raise HTTPException(status_code=400, detail="No text extracted from PDF invoice.")
+    if background:
+        document_id = await job_queue.enqueue(
+            current_user.id, file.filename, 'invoice_test_check', file_bytes
+        )
+        return {"document_id": document_id, "status": "queued"}
 
-    # Step 3: Load test cases from Excel
-    test_cases = load_test_cases(excel_file_path)
-
-    # Step 4: Analyze the invoice with OpenAI
-    analysis_result = analyze_invoice_with_openai(invoice_text, test_cases)
-
-    # (Optional) Derive a simple risk level if you want
-    # For example: "HIGH" if the text contains 'High', else "LOW"
-    risk_level = "HIGH" if "High" in analysis_result else "LOW"
-
-    # Step 5: Store the result in the database
-    with get_db() as db:
-        cursor = db.execute('''
-            INSERT INTO documents (
-                user_id,
-                document_name,
-                document_type,
-                upload_date,
-                status,
-                risk_level,
-                report_data
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            current_user.id,
-            file.filename,
-            'invoice_test_check',
-            datetime.utcnow().isoformat(),
-            'processed',
-            risk_level,
-            analysis_result
-        ))
-        document_id = cursor.lastrowid
+    # Steps 2-4: extract, load test cases and analyze
+    risk_level, analysis_result, compliance = await process_invoice_compliance(
+        file_bytes, file.filename
+    )
+
+    # Step 5: Store the result in the database, with the failed test cases as rows
+    document_id = await run_io(
+        insert_document,
+        current_user.id,
+        file.filename,
+        'invoice_test_check',
+        risk_level,
+        analysis_result,
+        compliance=compliance,
+    )
 
     # Return JSON response
     return {
         "document_id": document_id,
         "risk_level": risk_level,
-        "analysis_result": analysis_result
-    }
+        "analysis_result": analysis_result,
+        "failed_test_cases": [row.test_case_id for row in compliance.failed_test_cases],
+    }
\ No newline at end of file
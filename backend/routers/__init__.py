@@ -3,4 +3,7 @@ from .Invoice import router as invoice_router
 from .auth import router as auth_router
 from .documents import router as document_router
 from .Contract_new import router as contract_new_router
-from .Invoice_new import router as invoice_new_route
\ No newline at end of file
+from .Invoice_new import router as invoice_new_route
+from .system import router as system_router, metrics_router
+from .findings import router as findings_router
+from .batch import router as batch_router
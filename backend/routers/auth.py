@@ -5,6 +5,7 @@ from typing import Optional
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from database import get_db
+from executors import run_io
 
 router = APIRouter()
 
@@ -31,18 +32,21 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user(username: str):
-    with get_db() as db:
-        user = db.execute(
+def get_user_record(username: str):
+    with get_db(readonly=True) as db:
+        return db.execute(
             "SELECT * FROM users WHERE username = ?", (username,)
         ).fetchone()
-        if user:
-            return User(
-                id=user['id'],
-                username=user['username'],
-                email=user['email'],
-                full_name=user['full_name']
-            )
+
+def get_user(username: str):
+    user = get_user_record(username)
+    if user:
+        return User(
+            id=user['id'],
+            username=user['username'],
+            email=user['email'],
+            full_name=user['full_name']
+        )
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
@@ -57,35 +61,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = get_user(username)
+    user = await run_io(get_user, username)
     if user is None:
         raise credentials_exception
     return user
 
 @router.post("/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = get_user(form_data.username)
-    if not user:
+    user_record = await run_io(get_user_record, form_data.username)
+    
+    # In production, use proper password hashing and verification
+    if user_record is None or form_data.password != user_record['hashed_password']:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    # In production, use proper password hashing and verification
-    with get_db() as db:
-        user_record = db.execute(
-            "SELECT * FROM users WHERE username = ?", (form_data.username,)
-        ).fetchone()
-        
-        if user_record is None or form_data.password != user_record['hashed_password']:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
 
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": user_record['username']})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/users/me", response_model=User)
@@ -0,0 +1,231 @@
+# batch.py
+#
+# Batch variants of the single-file analysis endpoints. One request carries
+# many files and/or ZIP archives of them; the files are analysed by the same
+# pipelines as the single-file endpoints, at most BATCH_CONCURRENCY at a time,
+# and each file's result is streamed back as one NDJSON line as soon as it is
+# done (in completion order, with its index in the upload). Once every file
+# has finished, all documents are stored in one transaction and a final
+# {"summary": ...} line carries their ids.
+#
+# The batch runs as its own task, so it still completes and is stored if the
+# client stops reading the stream.
+
+import io
+import os
+import json
+import asyncio
+import logging
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from compliance_results import ComplianceResult
+from database import insert_documents
+from executors import run_io
+from jobs import JobHandler
+from .Contract import process_contract
+from .Contract_new import process_contract_test_check
+from .Invoice_new import process_invoice_compliance
+from .auth import get_current_user, User
+
+router = APIRouter()
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+# Uncompressed size of all ZIP members of one request
+BATCH_MAX_ZIP_MB = int(os.getenv("BATCH_MAX_ZIP_MB", "1024"))
+
+# document_type -> (pipeline, accepted extensions)
+BATCH_TYPES: Dict[str, Tuple[JobHandler, Tuple[str, ...]]] = {
+    'contract': (process_contract, ("pdf", "docx")),
+    'contract_test_check': (process_contract_test_check, ("pdf", "docx")),
+    'invoice_test_check': (process_invoice_compliance, ("pdf",)),
+}
+
+# Running batches, referenced until they finish
+_batches: Set[asyncio.Task] = set()
+
+# -----------------------------------------------------------------------------
+# Uploads
+# -----------------------------------------------------------------------------
+def file_extension(filename: str) -> str:
+    return filename.split(".")[-1].lower()
+
+def expand_zip(data: bytes, max_bytes: int) -> List[Tuple[str, bytes]]:
+    """(file name, bytes) of the archive's files; folders, hidden files and
+    macOS metadata are skipped. Blocking."""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP archive.")
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and not os.path.basename(info.filename).startswith(".")
+        ]
+        if sum(info.file_size for info in members) > max_bytes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"ZIP contents exceed {BATCH_MAX_ZIP_MB} MB per batch.",
+            )
+        return [(os.path.basename(info.filename), archive.read(info)) for info in members]
+
+async def read_uploads(files: List[UploadFile]) -> List[Tuple[str, bytes]]:
+    """Every uploaded file, with ZIP archives replaced by their contents."""
+    uploads = []
+    zip_budget = BATCH_MAX_ZIP_MB * 1024 * 1024
+    for file in files:
+        data = await file.read()
+        if file_extension(file.filename) == "zip":
+            members = await run_io(expand_zip, data, zip_budget)
+            zip_budget -= sum(len(member) for _, member in members)
+            uploads.extend(members)
+        else:
+            uploads.append((file.filename, data))
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No files in the batch.")
+    if len(uploads) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(uploads)} (at most {BATCH_MAX_FILES} per batch).",
+        )
+    return uploads
+
+# -----------------------------------------------------------------------------
+# Batch
+# -----------------------------------------------------------------------------
+# (document_name, status, risk_level, report_data, compliance), as stored by
+# database.insert_documents
+Outcome = Tuple[str, str, Optional[str], str, Optional[ComplianceResult]]
+
+def result_line(index: int, outcome: Outcome) -> dict:
+    filename, status, risk_level, report_data, compliance = outcome
+    line = {"index": index, "filename": filename, "status": status}
+    if status != "processed":
+        line["error"] = report_data
+        return line
+    line["risk_level"] = risk_level
+    line["analysis_result"] = report_data
+    if compliance is not None and compliance.score is not None:
+        line["compliance_score"] = compliance.score
+    if compliance is not None and compliance.failed_test_cases:
+        line["failed_test_cases"] = [row.test_case_id for row in compliance.failed_test_cases]
+    return line
+
+async def analyze_file(handler: JobHandler, filename: str, file_bytes: bytes) -> Outcome:
+    """Run one file through its pipeline; failures become 'failed' outcomes,
+    stored like failed background jobs."""
+    try:
+        risk_level, report_data, compliance = await handler(file_bytes, filename)
+    except HTTPException as e:
+        return filename, "failed", None, str(e.detail), None
+    except Exception as e:
+        logging.exception("Batch analysis of %s failed.", filename)
+        return filename, "failed", None, f"Analysis failed: {e}", None
+    return filename, "processed", risk_level, report_data, compliance
+
+async def run_batch(
+    user_id: int,
+    document_type: str,
+    uploads: List[Tuple[str, bytes]],
+    lines: asyncio.Queue,
+) -> None:
+    """Analyse the uploads, put one line per file on `lines` as it finishes,
+    store the analysed documents together, then put the summary and None."""
+    handler, extensions = BATCH_TYPES[document_type]
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    outcomes: List[Optional[Outcome]] = [None] * len(uploads)
+
+    async def process(index: int, filename: str, file_bytes: bytes) -> None:
+        if file_extension(filename) not in extensions:
+            # Not a document of this type: reported, not stored
+            await lines.put({
+                "index": index,
+                "filename": filename,
+                "status": "skipped",
+                "error": f"Unsupported file format. Allowed: {', '.join(extensions)}.",
+            })
+            return
+        async with semaphore:
+            outcomes[index] = await analyze_file(handler, filename, file_bytes)
+        await lines.put(result_line(index, outcomes[index]))
+
+    try:
+        await asyncio.gather(*(
+            process(index, filename, file_bytes)
+            for index, (filename, file_bytes) in enumerate(uploads)
+        ))
+        stored = [(index, outcome) for index, outcome in enumerate(outcomes) if outcome]
+        document_ids = await run_io(
+            insert_documents, user_id, document_type, [outcome for _, outcome in stored]
+        )
+        statuses = [outcome[1] for _, outcome in stored]
+        await lines.put({"summary": {
+            "files": len(uploads),
+            "processed": statuses.count("processed"),
+            "failed": statuses.count("failed"),
+            "skipped": len(uploads) - len(stored),
+            "documents": [
+                {"index": index, "filename": outcome[0], "document_id": document_id}
+                for (index, outcome), document_id in zip(stored, document_ids)
+            ],
+        }})
+    except Exception as e:
+        logging.exception("Storing batch of %d file(s) failed.", len(uploads))
+        await lines.put({"error": f"Storing the batch failed: {e}"})
+    finally:
+        await lines.put(None)
+
+async def batch_response(
+    document_type: str, files: List[UploadFile], current_user: User
+) -> StreamingResponse:
+    uploads = await read_uploads(files)
+    lines: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(run_batch(current_user.id, document_type, uploads, lines))
+    _batches.add(task)
+    task.add_done_callback(_batches.discard)
+
+    async def stream() -> AsyncIterator[str]:
+        while True:
+            line = await lines.get()
+            if line is None:
+                return
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# -----------------------------------------------------------------------------
+# Endpoints
+# -----------------------------------------------------------------------------
+@router.post("/batch/analyze_contract/")
+async def batch_analyze_contracts(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    /analyze_contract/ for many PDF/DOCX contracts (or ZIPs of them).
+    Streams NDJSON: one line per file as it finishes, then a summary line
+    with the stored document ids.
+    """
+    return await batch_response('contract', files, current_user)
+
+@router.post("/batch/check_contract_against_test_cases/")
+async def batch_check_contracts_against_test_cases(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """/check_contract_against_test_cases/ for many contracts; see /batch/analyze_contract/."""
+    return await batch_response('contract_test_check', files, current_user)
+
+@router.post("/batch/check_invoice_compliance/")
+async def batch_check_invoice_compliance(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """/check_invoice_compliance/ for many PDF invoices; see /batch/analyze_contract/."""
+    return await batch_response('invoice_test_check', files, current_user)
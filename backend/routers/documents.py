@@ -1,94 +1,355 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from typing import Iterator, List, Optional, Tuple
 from pydantic import BaseModel
 from datetime import datetime
 import json
+import base64
+import binascii
 from database import get_db
+from executors import run_io
+from report_store import iter_report_bytes, iter_report_text
 from .auth import get_current_user, User
 
 router = APIRouter()
 
-class DocumentResponse(BaseModel):
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class DocumentSummary(BaseModel):
     id: int
     document_name: str
     document_type: str
     upload_date: str
     status: str
     risk_level: Optional[str]
+    compliance_score: Optional[int] = None  # contract analyses only
+
+class DocumentResponse(DocumentSummary):
     report_data: Optional[str]
 
-@router.get("/my-documents", response_model=List[DocumentResponse])
-async def get_my_documents(current_user: User = Depends(get_current_user)):
-    with get_db() as db:
-        documents = db.execute('''
-        SELECT * FROM documents
-        WHERE user_id = ?
-        ORDER BY upload_date DESC
-        ''', (current_user.id,)).fetchall()
-        
-        return [
-            DocumentResponse(
-                id=doc['id'],
-                document_name=doc['document_name'],
-                document_type=doc['document_type'],
-                upload_date=doc['upload_date'],
-                status=doc['status'],
-                risk_level=doc['risk_level'],
-                report_data=doc['report_data']
-            )
-            for doc in documents
-        ]
-
-@router.get("/all-documents", response_model=List[DocumentResponse])
-async def get_all_documents(current_user: User = Depends(get_current_user)):
+class AreaRiskCount(BaseModel):
+    area: str
+    risk_level: str
+    documents: int
+
+class FailedTestCaseCount(BaseModel):
+    document_type: str  # contract and invoice catalogs reuse the same IDs
+    test_case_id: str
+    name: str
+    risk_level: str
+    documents: int
+
+class ComplianceSummary(BaseModel):
+    scored_documents: int
+    average_compliance_score: Optional[float]
+    areas: List[AreaRiskCount]
+    failed_test_cases: List[FailedTestCaseCount]  # most frequent first
+
+class DocumentFilters(BaseModel):
+    document_type: Optional[str] = None
+    risk_level: Optional[str] = None
+    uploaded_from: Optional[str] = None  # inclusive, ISO timestamp or date
+    uploaded_to: Optional[str] = None  # exclusive
+
+# -----------------------------------------------------------------------------
+# Keyset pagination
+#
+# Listings are ordered by (upload_date, id) descending. The cursor is the key
+# of the last row of a page, so fetching any page is an index seek on
+# idx_documents_user_upload / idx_documents_upload (both end in the rowid)
+# followed by at most `limit` rows, however many documents exist.
+# -----------------------------------------------------------------------------
+SUMMARY_COLUMNS = (
+    "id, document_name, document_type, upload_date, status, risk_level, compliance_score"
+)
+
+def encode_cursor(upload_date: str, document_id: int) -> str:
+    raw = json.dumps([upload_date, document_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        upload_date, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(upload_date), int(document_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_listing_query(
+    user_id: Optional[int],
+    filters: DocumentFilters,
+    cursor: Optional[Tuple[str, int]],
+    limit: int,
+) -> Tuple[str, list]:
+    """SQL and parameters for one page; user_id=None lists every user."""
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if filters.document_type:
+        conditions.append("document_type = ?")
+        params.append(filters.document_type)
+    if filters.risk_level:
+        conditions.append("risk_level = ?")
+        params.append(filters.risk_level.upper())
+    if filters.uploaded_from:
+        conditions.append("upload_date >= ?")
+        params.append(filters.uploaded_from)
+    if filters.uploaded_to:
+        conditions.append("upload_date < ?")
+        params.append(filters.uploaded_to)
+    if cursor is not None:
+        conditions.append("(upload_date, id) < (?, ?)")
+        params.extend(cursor)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f'''
+        SELECT {SUMMARY_COLUMNS} FROM documents
+        {where}
+        ORDER BY upload_date DESC, id DESC
+        LIMIT ?
+        '''
+    return sql, params + [limit]
+
+# Blocking queries, run through executors.run_io by the endpoints below
+def fetch_document_page(
+    user_id: Optional[int],
+    filters: DocumentFilters,
+    cursor: Optional[Tuple[str, int]],
+    limit: int,
+) -> Tuple[List[DocumentSummary], Optional[str]]:
+    """One page of summaries plus the cursor of the next page (None at the end)."""
+    # One extra row tells whether another page exists
+    sql, params = build_listing_query(user_id, filters, cursor, limit + 1)
+    with get_db(readonly=True) as db:
+        rows = db.execute(sql, params).fetchall()
+
+    documents = [DocumentSummary(**dict(row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = documents[-1]
+        next_cursor = encode_cursor(last.upload_date, last.id)
+    return documents, next_cursor
+
+def fetch_document(document_id: int, user_id: int, username: str):
+    """Metadata plus the compressed report (report_blob), if any."""
+    with get_db(readonly=True) as db:
+        return db.execute('''
+        SELECT d.id, d.document_name, d.document_type, d.upload_date, d.status,
+               d.risk_level, d.compliance_score, d.report_data, r.data AS report_blob
+        FROM documents d
+        LEFT JOIN reports r ON r.document_id = d.id
+        WHERE d.id = ? AND (d.user_id = ? OR ? = 'admin')
+        ''', (document_id, user_id, username)).fetchone()
+
+def fetch_compliance_summary(user_id: Optional[int], filters: DocumentFilters) -> ComplianceSummary:
+    """
+    Counts over the typed results of the contract and test-case analyses
+    (compliance_results.py) of the documents matching `filters`; user_id=None
+    covers every user. risk_level and the cursor do not apply.
+    """
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("d.user_id = ?")
+        params.append(user_id)
+    if filters.document_type:
+        conditions.append("d.document_type = ?")
+        params.append(filters.document_type)
+    if filters.uploaded_from:
+        conditions.append("d.upload_date >= ?")
+        params.append(filters.uploaded_from)
+    if filters.uploaded_to:
+        conditions.append("d.upload_date < ?")
+        params.append(filters.uploaded_to)
+    where = " AND ".join(conditions) or "1"
+
+    with get_db(readonly=True) as db:
+        scored, average = db.execute(f'''
+        SELECT COUNT(d.compliance_score), AVG(d.compliance_score) FROM documents d
+        WHERE {where}
+        ''', params).fetchone()
+        areas = db.execute(f'''
+        SELECT a.area, a.risk_level, COUNT(*) AS documents
+        FROM documents d JOIN contract_areas a ON a.document_id = d.id
+        WHERE {where}
+        GROUP BY a.area, a.risk_level
+        ORDER BY a.area, a.risk_level
+        ''', params).fetchall()
+        test_cases = db.execute(f'''
+        SELECT d.document_type, t.test_case_id, t.name, t.risk_level,
+               COUNT(DISTINCT t.document_id) AS documents
+        FROM documents d JOIN failed_test_cases t ON t.document_id = d.id
+        WHERE {where}
+        GROUP BY d.document_type, t.test_case_id
+        ORDER BY documents DESC, d.document_type, t.test_case_id
+        ''', params).fetchall()
+
+    return ComplianceSummary(
+        scored_documents=scored,
+        average_compliance_score=round(average, 1) if average is not None else None,
+        areas=[AreaRiskCount(**dict(row)) for row in areas],
+        failed_test_cases=[FailedTestCaseCount(**dict(row)) for row in test_cases],
+    )
+
+def iter_document_json(document) -> Iterator[str]:
+    """
+    The DocumentResponse JSON, with report_data decompressed and escaped
+    chunk by chunk instead of being built as one string. report_data is only
+    read from the documents row for rows written before migration 2.
+    """
+    summary = DocumentSummary(**{
+        key: document[key] for key in SUMMARY_COLUMNS.split(", ")
+    })
+    yield json.dumps(summary.dict())[:-1] + ', "report_data": '
+    if document['report_blob'] is not None:
+        yield '"'
+        for text in iter_report_text(document['report_blob']):
+            yield json.dumps(text)[1:-1]
+        yield '"}'
+    else:
+        yield json.dumps(document['report_data']) + "}"
+
+async def list_documents(
+    response: Response,
+    user_id: Optional[int],
+    filters: DocumentFilters,
+    cursor: Optional[str],
+    limit: int,
+) -> List[DocumentSummary]:
+    documents, next_cursor = await run_io(
+        fetch_document_page,
+        user_id,
+        filters,
+        decode_cursor(cursor) if cursor else None,
+        limit,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return documents
+
+@router.get("/my-documents", response_model=List[DocumentSummary])
+async def get_my_documents(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    document_type: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    uploaded_from: Optional[str] = None,
+    uploaded_to: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Newest documents first, without report_data (see /document/{id}/report).
+    When more documents exist, the X-Next-Cursor response header holds the
+    `cursor` for the next page.
+    """
+    filters = DocumentFilters(
+        document_type=document_type,
+        risk_level=risk_level,
+        uploaded_from=uploaded_from,
+        uploaded_to=uploaded_to,
+    )
+    return await list_documents(response, current_user.id, filters, cursor, limit)
+
+@router.get("/all-documents", response_model=List[DocumentSummary])
+async def get_all_documents(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    document_type: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    uploaded_from: Optional[str] = None,
+    uploaded_to: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.username != "admin":
         raise HTTPException(
             status_code=403,
             detail="Only admin can access all documents"
         )
 
-    with get_db() as db:
-        documents = db.execute('''
-        SELECT * FROM documents
-        ORDER BY upload_date DESC
-        ''').fetchall()
-        
-        return [
-            DocumentResponse(
-                id=doc['id'],
-                document_name=doc['document_name'],
-                document_type=doc['document_type'],
-                upload_date=doc['upload_date'],
-                status=doc['status'],
-                risk_level=doc['risk_level'],
-                report_data=doc['report_data']
-            )
-            for doc in documents
-        ]
+    filters = DocumentFilters(
+        document_type=document_type,
+        risk_level=risk_level,
+        uploaded_from=uploaded_from,
+        uploaded_to=uploaded_to,
+    )
+    return await list_documents(response, None, filters, cursor, limit)
+
+@router.get("/compliance-summary", response_model=ComplianceSummary)
+async def get_compliance_summary(
+    document_type: Optional[str] = None,
+    uploaded_from: Optional[str] = None,
+    uploaded_to: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Per-area risk counts of the contract analyses, the most frequently failed
+    test cases and the average compliance score, for the current user's
+    documents (admin: everyone's). Analyses stored before the typed result
+    tables existed are not counted.
+    """
+    filters = DocumentFilters(
+        document_type=document_type,
+        uploaded_from=uploaded_from,
+        uploaded_to=uploaded_to,
+    )
+    user_id = None if current_user.username == "admin" else current_user.id
+    return await run_io(fetch_compliance_summary, user_id, filters)
 
 @router.get("/document/{document_id}", response_model=DocumentResponse)
 async def get_document(
     document_id: int,
     current_user: User = Depends(get_current_user)
 ):
-    with get_db() as db:
-        document = db.execute('''
-        SELECT * FROM documents
-        WHERE id = ? AND (user_id = ? OR ? = 'admin')
-        ''', (document_id, current_user.id, current_user.username)).fetchone()
-        
-        if not document:
-            raise HTTPException(
-                status_code=404,
-                detail="Document not found or access denied"
-            )
-        
-        return DocumentResponse(
-            id=document['id'],
-            document_name=document['document_name'],
-            document_type=document['document_type'],
-            upload_date=document['upload_date'],
-            status=document['status'],
-            risk_level=document['risk_level'],
-            report_data=document['report_data']
-        )
\ No newline at end of file
+    document = await run_io(
+        fetch_document, document_id, current_user.id, current_user.username
+    )
+
+    if not document:
+        raise HTTPException(
+            status_code=404,
+            detail="Document not found or access denied"
+        )
+
+    return StreamingResponse(iter_document_json(document), media_type="application/json")
+
+@router.get("/document/{document_id}/report")
+async def get_document_report(
+    document_id: int,
+    accept_encoding: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    The stored report body on its own: JSON for CSV invoice uploads, the
+    analysis text for the other document types. 404 while still queued.
+    Clients that accept gzip get the stored bytes as they are; others get
+    them decompressed on the fly.
+    """
+    document = await run_io(
+        fetch_document, document_id, current_user.id, current_user.username
+    )
+
+    if not document or (document['report_blob'] is None and document['report_data'] is None):
+        raise HTTPException(
+            status_code=404,
+            detail="Report not found or access denied"
+        )
+
+    media_type = (
+        "application/json" if document['document_type'] == 'invoice'
+        else "text/plain; charset=utf-8"
+    )
+    if document['report_blob'] is None:
+        return Response(content=document['report_data'], media_type=media_type)
+    if "gzip" in (accept_encoding or "").lower():
+        return Response(
+            content=document['report_blob'],
+            media_type=media_type,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return StreamingResponse(
+        iter_report_bytes(document['report_blob']),
+        media_type=media_type,
+        headers={"Vary": "Accept-Encoding"},
+    )
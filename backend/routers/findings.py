@@ -0,0 +1,152 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from database import get_db
+from executors import run_io
+from invoice_history import rebuild_invoice_history
+from .auth import get_current_user, User
+from .documents import decode_cursor, encode_cursor
+
+router = APIRouter()
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class InvoiceFinding(BaseModel):
+    id: int
+    document_id: int
+    invoice_id: str
+    vendor: str
+    invoice_date: str
+    amount: Optional[float]
+    risk_score: int
+    risk_level: str
+    issue: Optional[str]
+    severity: Optional[str]
+    risk_increase: Optional[int]
+
+class FindingFilters(BaseModel):
+    vendor: Optional[str] = None  # case-insensitive exact match
+    risk_level: Optional[str] = None  # 'Fraud Detected', 'Suspicious' or 'Safe'
+    date_from: Optional[str] = None  # inclusive invoice_date, e.g. 2024-01-01
+    date_to: Optional[str] = None  # exclusive
+
+# -----------------------------------------------------------------------------
+# Queries
+#
+# Same keyset pagination as the document listings, on (invoice_date, id)
+# descending. Each filter combination is served by one of the indexes from
+# findings.CREATE_FINDINGS_INDEXES (see tests/test_query_plans.py).
+# -----------------------------------------------------------------------------
+FINDING_COLUMNS = (
+    "id, document_id, invoice_id, vendor, invoice_date, amount, risk_score, "
+    "risk_level, issue, severity, risk_increase"
+)
+
+def build_findings_query(
+    user_id: Optional[int],
+    filters: FindingFilters,
+    cursor: Optional[Tuple[str, int]],
+    limit: int,
+) -> Tuple[str, list]:
+    """SQL and parameters for one page; user_id=None searches every user."""
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if filters.vendor:
+        conditions.append("vendor = ?")
+        params.append(filters.vendor)
+    if filters.risk_level:
+        conditions.append("risk_level = ?")
+        params.append(filters.risk_level)
+    if filters.date_from:
+        conditions.append("invoice_date >= ?")
+        params.append(filters.date_from)
+    if filters.date_to:
+        conditions.append("invoice_date < ?")
+        params.append(filters.date_to)
+    if cursor is not None:
+        conditions.append("(invoice_date, id) < (?, ?)")
+        params.extend(cursor)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f'''
+        SELECT {FINDING_COLUMNS} FROM invoice_findings
+        {where}
+        ORDER BY invoice_date DESC, id DESC
+        LIMIT ?
+        '''
+    return sql, params + [limit]
+
+# Blocking; run through executors.run_io
+def fetch_findings_page(
+    user_id: Optional[int],
+    filters: FindingFilters,
+    cursor: Optional[Tuple[str, int]],
+    limit: int,
+) -> Tuple[List[InvoiceFinding], Optional[str]]:
+    sql, params = build_findings_query(user_id, filters, cursor, limit + 1)
+    with get_db(readonly=True) as db:
+        rows = db.execute(sql, params).fetchall()
+
+    findings = [InvoiceFinding(**dict(row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = findings[-1]
+        next_cursor = encode_cursor(last.invoice_date, last.id)
+    return findings, next_cursor
+
+def rebuild_history() -> int:
+    with get_db() as db:
+        return rebuild_invoice_history(db)
+
+@router.get("/invoice-findings", response_model=List[InvoiceFinding])
+async def get_invoice_findings(
+    response: Response,
+    vendor: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Findings of every CSV invoice upload, newest invoice_date first: one
+    entry per invoice and issue (issue is null for invoices without issues).
+    Users see their own uploads, admin sees all. Paginated like
+    /documents/my-documents through the X-Next-Cursor header.
+    """
+    filters = FindingFilters(
+        vendor=vendor,
+        risk_level=risk_level,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    user_id = None if current_user.username == "admin" else current_user.id
+    findings, next_cursor = await run_io(
+        fetch_findings_page,
+        user_id,
+        filters,
+        decode_cursor(cursor) if cursor else None,
+        limit,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return findings
+
+@router.post("/invoice-history/rebuild")
+async def rebuild_invoice_history_index(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Rebuild the cross-upload duplicate index from the stored invoice reports,
+    e.g. after restoring a backup. Uploads wait for it to finish.
+    """
+    if current_user.username != "admin":
+        raise HTTPException(
+            status_code=403,
+            detail="Only admin can rebuild the invoice history"
+        )
+    return {"indexed_invoices": await run_io(rebuild_history)}
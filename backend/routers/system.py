@@ -0,0 +1,37 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from executors import run_io
+from extraction import extraction_cache
+from llm_cache import llm_cache
+from llm_gateway import llm_gateway
+from metrics import render_metrics
+
+router = APIRouter()
+
+# Included without authentication (main.py) so Prometheus can scrape it;
+# it holds timings and counts only, no document data.
+metrics_router = APIRouter()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and sizes of the persistent caches."""
+    return {
+        "extraction": await run_io(extraction_cache.stats),
+        "llm": await run_io(llm_cache.stats),
+    }
+
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """Per-model request, retry, token and latency counters of the LLM gateway."""
+    return llm_gateway.stats()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage, request and LLM histograms in the Prometheus text format."""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
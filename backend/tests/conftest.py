@@ -0,0 +1,23 @@
+# conftest.py
+#
+# Tests run against throwaway SQLite files; the backend modules are imported
+# from the parent folder, as when the app runs from there.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def database_url(tmp_path, monkeypatch):
+    """Point database.py at a fresh file; pooled connections are closed after."""
+    path = str(tmp_path / "documents.db")
+    monkeypatch.setattr(database, "DATABASE_URL", path)
+    yield path
+    database.close_connections()
@@ -0,0 +1,53 @@
+# test_document_listing.py
+#
+# Keyset pagination of the document listings (routers/documents.py): paging
+# through every row must return each document exactly once, in order, also
+# when many documents share an upload_date.
+
+import pytest
+
+import database
+from routers.documents import DocumentFilters, decode_cursor, fetch_document_page
+
+# Three timestamps shared by several documents each, interleaved by id
+UPLOAD_DATES = ["2024-03-01T09:00:00", "2024-03-02T09:00:00", "2024-03-01T09:00:00"]
+
+
+@pytest.fixture
+def documents(database_url):
+    """17 documents of user 1 and 5 of user 2; returns user 1's ids in listing order."""
+    database.init_db()
+    with database.get_db() as db:
+        for number in range(22):
+            db.execute('''
+            INSERT INTO documents (user_id, document_name, document_type, upload_date, status)
+            VALUES (?, ?, 'contract', ?, 'processed')
+            ''', (1 if number < 17 else 2, f"doc{number}.pdf", UPLOAD_DATES[number % 3]))
+        rows = db.execute('''
+        SELECT id FROM documents WHERE user_id = 1 ORDER BY upload_date DESC, id DESC
+        ''').fetchall()
+    return [row["id"] for row in rows]
+
+
+def page_through(user_id, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page, next_cursor = fetch_document_page(user_id, DocumentFilters(), cursor, limit)
+        ids.extend(document.id for document in page)
+        pages += 1
+        if next_cursor is None:
+            return ids, pages
+        cursor = decode_cursor(next_cursor)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 16, 17, 50])
+def test_pages_have_no_gaps_or_duplicates(documents, limit):
+    ids, pages = page_through(1, limit)
+    assert ids == documents
+    assert pages == max(1, -(-len(documents) // limit))
+
+
+def test_pages_only_list_the_users_documents(documents):
+    ids, _ = page_through(2, 2)
+    assert len(ids) == 5
+    assert not set(ids) & set(documents)
@@ -0,0 +1,157 @@
+# test_migrations.py
+#
+# init_db() on a database created by the baseline schema (before
+# MIGRATIONS existed), run twice: the second run must change nothing.
+
+import json
+import shutil
+import sqlite3
+
+import database
+from report_store import read_report
+
+# The documents and users tables as the baseline init_db() created them
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    hashed_password TEXT NOT NULL,
+    full_name TEXT,
+    email TEXT
+);
+CREATE TABLE documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    document_name TEXT NOT NULL,
+    document_type TEXT NOT NULL,
+    upload_date TIMESTAMP NOT NULL,
+    status TEXT NOT NULL,
+    risk_level TEXT,
+    report_data TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+'''
+
+INVOICE_REPORT = json.dumps({
+    "invoices": [
+        {"invoice_id": "INV-1", "vendor": "Acme", "amount": 120.0,
+         "invoice_date": "2024-01-05", "description": "Cloud hosting"},
+        {"invoice_id": "INV-2", "vendor": "Globex", "amount": 80.0,
+         "invoice_date": "2024-01-06", "description": "Office supplies"},
+    ],
+    "analysis": [
+        {"invoice_id": "INV-1", "risk_score": 30, "risk_level": "Safe 🟢", "issues": [
+            {"issue": "Round amount", "severity": "Low", "risk_increase": 10},
+        ]},
+        {"invoice_id": "INV-2", "risk_score": 0, "risk_level": "Safe 🟢", "issues": []},
+    ],
+})
+CONTRACT_REPORT = "### Contract Compliance Analysis\n\nOverall Compliance Score: 80%"
+
+
+def create_baseline_database(path: str) -> None:
+    db = sqlite3.connect(path)
+    db.executescript(BASELINE_SCHEMA)
+    db.execute(
+        "INSERT INTO users (username, hashed_password) VALUES ('user1', 'user1pass')"
+    )
+    db.executemany('''
+    INSERT INTO documents (user_id, document_name, document_type, upload_date,
+                           status, risk_level, report_data)
+    VALUES (1, ?, ?, '2024-02-01T10:00:00', 'processed', ?, ?)
+    ''', [
+        ("invoices.csv", "invoice", "LOW", INVOICE_REPORT),
+        ("contract.pdf", "contract", "MEDIUM", CONTRACT_REPORT),
+    ])
+    db.commit()
+    db.close()
+
+
+def snapshot(path: str) -> dict:
+    """Schema and contents of every table, for comparing two runs."""
+    db = sqlite3.connect(path)
+    try:
+        tables = [row[0] for row in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        )]
+        return {
+            "version": db.execute("PRAGMA user_version").fetchone()[0],
+            "schema": db.execute(
+                "SELECT type, name, sql FROM sqlite_master ORDER BY type, name"
+            ).fetchall(),
+            "rows": {
+                table: db.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+                for table in tables
+            },
+        }
+    finally:
+        db.close()
+
+
+def columns_and_indexes(path: str) -> dict:
+    """Column definitions and indexed columns per table, ignoring how the
+    CREATE statements are formatted."""
+    db = sqlite3.connect(path)
+    try:
+        tables = [row[0] for row in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        )]
+        return {
+            table: (
+                [row[1:] for row in db.execute(f"PRAGMA table_info({table})")],
+                sorted(
+                    (index[1], [column[2] for column in db.execute(f"PRAGMA index_info({index[1]})")])
+                    for index in db.execute(f"PRAGMA index_list({table})")
+                ),
+            )
+            for table in tables
+        }
+    finally:
+        db.close()
+
+
+def test_migrations_apply_once_on_a_baseline_database(tmp_path, database_url):
+    baseline = str(tmp_path / "baseline.db")
+    create_baseline_database(baseline)
+    shutil.copy(baseline, database_url)
+
+    database.init_db()
+    database.close_connections()
+    first = snapshot(database_url)
+    database.init_db()
+    database.close_connections()
+    second = snapshot(database_url)
+
+    assert first["version"] == database.MIGRATIONS[-1][0]
+    assert second == first
+
+    rows = first["rows"]
+    assert len(rows["documents"]) == 2
+    # Migration 2: reports moved out of documents, compressed
+    assert all(document[7] is None for document in rows["documents"])
+    with database.get_db(readonly=True) as db:
+        reports = {
+            document_id: read_report(data)
+            for document_id, data in db.execute("SELECT document_id, data FROM reports")
+        }
+        # Migrations 3 and 4: the CSV report is indexed, once
+        assert db.execute("SELECT COUNT(*) FROM invoice_findings").fetchone()[0] == 2
+        assert [tuple(row) for row in db.execute(
+            "SELECT user_id, invoice_id FROM invoice_history ORDER BY id"
+        )] == [(1, "INV-1"), (1, "INV-2")]
+    assert reports == {1: INVOICE_REPORT, 2: CONTRACT_REPORT}
+
+
+def test_migrations_on_a_fresh_database_match_the_migrated_baseline(tmp_path, database_url):
+    database.init_db()
+    database.close_connections()
+    fresh = snapshot(database_url)
+
+    migrated = str(tmp_path / "migrated.db")
+    create_baseline_database(migrated)
+    database.DATABASE_URL = migrated  # restored by the database_url fixture
+    database.init_db()
+    database.close_connections()
+
+    assert fresh["version"] == snapshot(migrated)["version"]
+    assert columns_and_indexes(database_url) == columns_and_indexes(migrated)
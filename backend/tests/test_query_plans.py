@@ -0,0 +1,135 @@
+# test_query_plans.py
+#
+# EXPLAIN QUERY PLAN checks: the document listings, invoice findings and
+# invoice history lookups must seek the indexes from database.MIGRATIONS,
+# never scan the table and sort it in a temporary B-tree.
+
+import pytest
+
+import database
+from invoice_history import exact_matches, fuzzy_candidates
+from routers.documents import DocumentFilters, build_listing_query
+from routers.findings import FindingFilters, build_findings_query
+
+CURSOR = ("2024-01-01T00:00:00002500", 2500)
+FILTERED = DocumentFilters(document_type="contract", risk_level="high")
+FINDINGS_CURSOR = ("2024-03-15", 2500)
+VENDOR = FindingFilters(vendor="vendor7", date_from="2024-01-01", date_to="2024-04-01")
+FRAUD = FindingFilters(risk_level="Fraud Detected", date_from="2024-01-01")
+
+# (label, (sql, params), index that must appear in the plan)
+QUERIES = [
+    ("my-documents", build_listing_query(2, DocumentFilters(), None, 50),
+     "idx_documents_user_upload"),
+    ("my-documents page", build_listing_query(2, DocumentFilters(), CURSOR, 50),
+     "idx_documents_user_upload"),
+    ("my-documents filtered", build_listing_query(2, FILTERED, CURSOR, 50),
+     "idx_documents_user_upload"),
+    ("all-documents", build_listing_query(None, DocumentFilters(), None, 50),
+     "idx_documents_upload"),
+    ("all-documents page", build_listing_query(None, DocumentFilters(), CURSOR, 50),
+     "idx_documents_upload"),
+    ("findings by vendor", build_findings_query(2, VENDOR, FINDINGS_CURSOR, 100),
+     "idx_findings_vendor"),
+    ("findings by vendor (admin)", build_findings_query(None, VENDOR, None, 100),
+     "idx_findings_vendor"),
+    ("findings by risk", build_findings_query(2, FRAUD, FINDINGS_CURSOR, 100),
+     "idx_findings_user_risk"),
+    ("findings by risk (admin)", build_findings_query(None, FRAUD, None, 100),
+     "idx_findings_risk"),
+    ("findings", build_findings_query(2, FindingFilters(), FINDINGS_CURSOR, 100),
+     "idx_findings_user_date"),
+    ("findings (admin)", build_findings_query(None, FindingFilters(), None, 100),
+     "idx_findings_date"),
+]
+
+# invoice_history.py runs its own SQL: captured from a call.
+# (label, call, index, whether a sort is expected)
+HISTORY_LOOKUPS = [
+    ("history exact", lambda db: exact_matches(db, 2, "vendor7_120.0_2024-01-05"),
+     "idx_history_exact", False),
+    # The range seek on amount cannot return rows in id order, so the few
+    # candidates in the window are sorted; the table itself is never scanned
+    ("history fuzzy", lambda db: list(fuzzy_candidates(db, 2, "vendor7", 120.0, 50.0, 20)),
+     "idx_history_vendor_amount", True),
+]
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    """A migrated database with enough rows (and fresh statistics) that the
+    planner has a choice."""
+    original = database.DATABASE_URL
+    database.DATABASE_URL = str(tmp_path_factory.mktemp("plans") / "documents.db")
+    database.init_db()
+    with database.get_db() as db:
+        db.executemany('''
+        INSERT INTO documents (user_id, document_name, document_type, upload_date, status)
+        VALUES (?, ?, 'contract', ?, 'processed')
+        ''', [(i % 50, f"doc{i}.pdf", f"2024-01-01T00:00:{i:08d}") for i in range(5000)])
+        db.executemany('''
+        INSERT INTO invoice_findings (document_id, user_id, invoice_id, vendor,
+                                      invoice_date, risk_score, risk_level)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (i // 100, i % 50, f"INV{i}", f"vendor{i % 200}",
+             f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", i % 101,
+             ("Safe", "Suspicious", "Fraud Detected")[i % 3])
+            for i in range(20000)
+        ])
+        db.executemany('''
+        INSERT INTO invoice_history (document_id, user_id, invoice_id, vendor_key, amount,
+                                     invoice_date, exact_key, description, description_length)
+        VALUES (?, ?, ?, ?, ?, '2024-01-05', ?, 'cloud hosting', 13)
+        ''', [
+            (i // 100, i % 50, f"INV{i}", f"vendor{i % 200}", float(i % 1000),
+             f"vendor{i % 200}_{float(i % 1000)}_2024-01-05")
+            for i in range(20000)
+        ])
+        db.execute("ANALYZE")
+    yield database
+    database.close_connections()
+    database.DATABASE_URL = original
+
+
+def query_plan(db, sql: str, params) -> str:
+    rows = db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "\n".join(row["detail"] for row in rows)
+
+
+def assert_uses_index(plan: str, index: str, sorts: bool = False) -> None:
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan, plan
+    # An ordered walk of the index (first page of a listing) is fine; a
+    # full table scan is not
+    assert not any(
+        line.startswith("SCAN") and "INDEX" not in line for line in plan.splitlines()
+    ), plan
+    assert ("TEMP B-TREE" in plan) == sorts, plan
+
+
+@pytest.mark.parametrize(
+    "query, index", [(query, index) for _, query, index in QUERIES],
+    ids=[label for label, _, _ in QUERIES],
+)
+def test_listing_queries_use_their_index(db, query, index):
+    sql, params = query
+    with db.get_db(readonly=True) as conn:
+        assert_uses_index(query_plan(conn, sql, params), index)
+
+
+@pytest.mark.parametrize(
+    "lookup, index, sorts", [entry[1:] for entry in HISTORY_LOOKUPS],
+    ids=[entry[0] for entry in HISTORY_LOOKUPS],
+)
+def test_history_lookups_use_their_index(db, lookup, index, sorts):
+    statements = []
+    with db.get_db(readonly=True) as conn:
+        # The trace callback sees the statement with its parameters bound
+        conn.set_trace_callback(statements.append)
+        try:
+            lookup(conn)
+        finally:
+            conn.set_trace_callback(None)
+        selects = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+        assert len(selects) == 1, statements
+        assert_uses_index(query_plan(conn, selects[0], ()), index, sorts)
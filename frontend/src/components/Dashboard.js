@@ -6,33 +6,52 @@ import MarkdownDisplay from "./MarkdownDisplay";
 
 const Dashboard = () => {
   const [documents, setDocuments] = useState([]);
+  // /documents/my-documents returns one page at a time; the cursor of the
+  // next page comes in the X-Next-Cursor header (absent on the last page)
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const { token } = useAuth();
 
-  useEffect(() => {
-    const fetchDocuments = async () => {
-      try {
-        const response = await fetch("http://localhost:8000/documents/my-documents", {
-          method: "GET",
-          headers: {
-            "Authorization": `Bearer ${token}`,
-            "Accept": "application/json"
-          }
-        });
+  const fetchDocuments = async (cursor = null) => {
+    const url = new URL("http://localhost:8000/documents/my-documents");
+    if (cursor) {
+      url.searchParams.set("cursor", cursor);
+    }
+    const response = await fetch(url, {
+      method: "GET",
+      headers: {
+        "Authorization": `Bearer ${token}`,
+        "Accept": "application/json"
+      }
+    });
 
-        if (!response.ok) {
-          throw new Error("Failed to fetch documents");
-        }
+    if (!response.ok) {
+      throw new Error("Failed to fetch documents");
+    }
 
-        const data = await response.json();
-        setDocuments(data);
-      } catch (error) {
-        console.error("Error fetching documents:", error);
-      }
-    };
+    const data = await response.json();
+    setDocuments((previous) => (cursor ? [...previous, ...data] : data));
+    setNextCursor(response.headers.get("X-Next-Cursor"));
+  };
 
-    fetchDocuments();
+  useEffect(() => {
+    fetchDocuments().catch((error) => {
+      console.error("Error fetching documents:", error);
+    });
+  // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [token]);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      await fetchDocuments(nextCursor);
+    } catch (error) {
+      console.error("Error fetching documents:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const renderRiskLevel = (riskLevel) => {
     const riskColors = {
       "Low": "green",
@@ -97,6 +116,15 @@ const Dashboard = () => {
           ))}
         </tbody>
       </table>
+      {nextCursor && (
+        <button
+          className="action-button view"
+          onClick={loadMore}
+          disabled={loadingMore}
+        >
+          {loadingMore ? "Loading..." : "Load more"}
+        </button>
+      )}
     </div>
   );
 };